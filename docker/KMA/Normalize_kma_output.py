@@ -1,20 +1,31 @@
 #! /usr/bin/env python
 
 
+import os
 import click
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from os.path import join
 
 
 """
 Script for normalizing KMA depth into Counts Per Million (CPM)
-This script takes KMA output file and generates normalized depths                                                                  
+This script takes KMA output files and generates normalized depths
+(optionally also TPM and RPKM based on template lengths)
 
 """
 
 pd.options.mode.chained_assignment = None
- 
 
-def load_kma_file(path):
+# suffix of KMA results files stripped from sample names
+KMA_RES_SUFFIXES = ['.kma.res', '.res']
+# suffix of normalized depth files written to the output directory
+OUT_SUFFIX = '.geneCPM.txt'
+NORMALIZATIONS = ['CPM', 'TPM', 'RPKM']
+
+
+def load_kma_file(path, columns=('#Template', 'Depth')):
 
 	"""
 	Reads KMA output 
@@ -23,12 +34,14 @@ def load_kma_file(path):
     ----------
 	input_file : tsv
         tsv file kma output
+	columns : list of str
+		columns to read
 
     Returns
     -------
 	Pandas dataframe
 	"""
-	kma_results_df = pd.read_csv(path, usecols=['#Template', 'Depth'], sep="\t")
+	kma_results_df = pd.read_csv(path, usecols=list(columns), sep="\t")
 	return kma_results_df
 
 
@@ -41,36 +54,110 @@ def add_normalized_depth(kma_file):
 	Total_depth = kma_file['Depth'].to_numpy().sum()
 	kma_file['Depth/Total_depth'] = kma_file['Depth'].to_numpy() / Total_depth
 	kma_file['CPM'] = kma_file['Depth/Total_depth'].to_numpy() * 1_000_000
-    
 
-@click.command()
-@click.option('--input_file', '-i', required=True,
-              type=click.Path(resolve_path=True, readable=True, exists=True),
-              help='Input kma results file .res file.')
-@click.option('--out_file', '-o', required=True,
-              type=click.Path(resolve_path=True, readable=True, exists=False),
-              help='Output .tsv file.')
 
-def _perform_normalization(input_file, out_file):
+def add_length_normalized_depth(kma_file):
+	"""
+	Reads KMA dataframe with template lengths
+	Performs TPM and RPKM normalization of aligned bases
+	(depth * template length, proportional to read counts)
+
+	KMA depth is already divided by template length, so TPM equals CPM
+	of depths.
+	"""
+	depth = kma_file['Depth'].to_numpy()
+	aligned_bases = depth * kma_file['Template_length'].to_numpy()
+	kma_file['TPM'] = depth / depth.sum() * 1_000_000
+	kma_file['RPKM'] = depth / aligned_bases.sum() * 1_000_000_000
+
+
+def normalize_kma_file(input_file, out_file, normalizations=('CPM',)):
+	"""
+	Normalizes depths of a KMA output file and saves Gene ID and
+	the normalized depths to the output file. CPM is always the first
+	normalized column, as readers of the file expect it there.
+	"""
+	normalizations = ['CPM'] + [n for n in normalizations if n != 'CPM']
+	length_aware = bool({'TPM', 'RPKM'} & set(normalizations))
+	columns = ['#Template', 'Template_length', 'Depth'] if length_aware \
+		else ['#Template', 'Depth']
 
 	# load kma dataframe
-	kma_df = load_kma_file(input_file)
+	kma_df = load_kma_file(input_file, columns)
 
-	# adds normalized column
+	# adds normalized columns
 	add_normalized_depth(kma_df)
+	if length_aware:
+		add_length_normalized_depth(kma_df)
 
 	# subset the data to obtain Gene ID and normalized depth
-	normalized_genes = kma_df[["#Template", "CPM"]]
+	normalized_genes = kma_df[["#Template"] + list(normalizations)]
 	normalized_genes.rename(columns={'#Template':'Gene ID'}, inplace=True)
-	
+
 	# saving output to file
 	normalized_genes.to_csv(out_file, sep = '\t', index=False)
 
 
-if __name__ == "__main__":
-	_perform_normalization()
-
+def sample_out_file(input_file, out_dir):
+	"""
+	Output file of a KMA output file in the output directory,
+	<sample>.geneCPM.txt
+	"""
+	sample = os.path.basename(input_file)
+	for suffix in KMA_RES_SUFFIXES:
+		if sample.endswith(suffix):
+			sample = sample[:-len(suffix)]
+			break
+	return join(out_dir, f'{sample}{OUT_SUFFIX}')
 
 
+@click.command()
+@click.option('--input_file', '-i', required=True, multiple=True,
+              type=click.Path(resolve_path=True, readable=True, exists=True),
+              help='Input kma results file .res file. Can be repeated.')
+@click.option('--out_file', '-o', default=None,
+              type=click.Path(resolve_path=True, readable=True, exists=False),
+              help='Output .tsv file of a single input file.')
+@click.option('--out_dir', '-d', default=None,
+              type=click.Path(resolve_path=True, file_okay=False),
+              help='Output directory of <sample>.geneCPM.txt files for '
+                   'many input files.')
+@click.option('--normalization', '-n', multiple=True, default=['CPM'],
+              show_default=True, type=click.Choice(NORMALIZATIONS),
+              help='Normalized depth column, CPM is always written first. '
+                   'Can be repeated.')
+@click.option('--workers', '-w', default=1, type=click.IntRange(1),
+              show_default=True,
+              help='Number of processes normalizing input files.')
+
+def _perform_normalization(input_file, out_file, out_dir, normalization,
+                           workers):
+
+	if (out_file is None) == (out_dir is None):
+		raise click.UsageError(
+			'Exactly one of --out_file and --out_dir is required.')
+	if out_file is not None and len(input_file) > 1:
+		raise click.UsageError(
+			'--out_dir is required for more input files.')
+
+	normalizations = list(dict.fromkeys(normalization))
+	if out_file is not None:
+		out_files = [out_file]
+	else:
+		os.makedirs(out_dir, exist_ok=True)
+		out_files = [sample_out_file(path, out_dir) for path in input_file]
+		if len(set(out_files)) < len(out_files):
+			raise click.UsageError(
+				'Input files of the same sample name.')
+
+	normalize = partial(normalize_kma_file, normalizations=normalizations)
+	if workers > 1 and len(input_file) > 1:
+		with ProcessPoolExecutor(min(workers, len(input_file))) as executor:
+			list(executor.map(normalize, input_file, out_files))
+	else:
+		for path, out_path in zip(input_file, out_files):
+			normalize(path, out_path)
 
 
+if __name__ == "__main__":
+	_perform_normalization()
@@ -1,54 +1,597 @@
 #! /usr/bin/env python
 
+import os
+import re
+import shutil
+import hashlib
+import tempfile
 import click
+import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 import obonet
 import networkx as nx
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from os.path import join
 
+# root terms pruned from propagated GO terms
+ROOT_TERMS = {'GO:0008150', 'GO:0003674', 'GO:0005575'}
+# gene column of gene mapping tables: written by the gene mapper, older
+# .tsv tables
+GENE_COLUMNS = ['Gene_ID', 'Gene ID']
+# version tag of the GO closure index files
+CLOSURE_INDEX_VERSION = 1
 
-# propagate GO terms
-def propagate_go(goterms, go_graph):
+# compiled GO closure: term IDs, CSR arrays of ancestor codes per term code
+# and dictionary of term codes
+GOClosure = namedtuple('GOClosure', ['terms', 'indptr', 'indices', 'codes'])
+
+# GO closure of the current (worker) process, see init_propagation
+_go_closure = None
+
+
+def load_genemapper_table(path, columns=None):
+    """
+    Reads gene mapping table (.tsv, .parquet or .feather),
+    loading only the requested columns
+
+    Parameters
+    ----------
+    path : str
+    columns : list of str
+
+    Returns
+    -------
+    Pandas dataframe
+    """
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    if path.endswith('.feather'):
+        return pd.read_feather(path, columns=columns)
+    return pd.read_csv(path, sep="\t", usecols=columns)
+
+
+def read_genemapper_columns(path):
+    """
+    Reads column names of gene mapping table (.tsv, .parquet or .feather)
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    list of str
+    """
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+    if path.endswith('.feather'):
+        import pyarrow as pa
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).schema.names
+    return pd.read_csv(path, sep="\t", nrows=0).columns.tolist()
+
+
+def find_gene_column(path):
+    """
+    Finds the gene column of gene mapping table, one of GENE_COLUMNS
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    str
+    """
+    columns = read_genemapper_columns(path)
+    for column in GENE_COLUMNS:
+        if column in columns:
+            return column
+    raise click.BadParameter(
+        f'{path} has no gene column ({", ".join(GENE_COLUMNS)})',
+        param_hint='--gene_mapper_file')
+
+
+def iter_genemapper_table(path, columns=None, chunksize=None):
+    """
+    Reads gene mapping table (.tsv, .parquet or .feather) chunk by chunk,
+    loading only the requested columns
+
+    Parameters
+    ----------
+    path : str
+    columns : list of str
+    chunksize : int
+        number of rows per chunk, whole table if None
+
+    Yields
+    ------
+    Pandas dataframe
+    """
+    if chunksize is None:
+        yield load_genemapper_table(path, columns)
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if path.endswith('.parquet'):
+        for batch in pq.ParquetFile(path).iter_batches(chunksize,
+                                                       columns=columns):
+            yield batch.to_pandas()
+    elif path.endswith('.feather'):
+        # record batches are read one at a time from the memory map
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = pa.Table.from_batches([reader.get_batch(i)])
+                if columns is not None:
+                    batch = batch.select(columns)
+                for start in range(0, batch.num_rows, chunksize):
+                    yield batch.slice(start, chunksize).to_pandas()
+    else:
+        with pd.read_csv(path, sep="\t", usecols=columns,
+                         chunksize=chunksize) as reader:
+            yield from reader
+
+
+def read_obo_version(obo_path):
     """
-    Propagate GO terms based on Graph
+    Reads the version of an OBO file from its header ('data-version' tag).
+    The content hash is used for files without version.
+
+    Parameters
+    ----------
+    obo_path : str
+
+    Returns
+    -------
+    Version string usable in file names
+    """
+    version = None
+    with open(obo_path, 'r') as f:
+        for line in f:
+            if line.startswith('['):
+                break
+            if line.startswith('data-version:'):
+                version = line.split(':', 1)[1].strip()
+                break
+    if version is None:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(obo_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        version = digest.hexdigest()
+    return re.sub(r'[^\w.-]', '_', version)
+
+
+def compile_go_closure(go_graph):
+    """
+    Compiles ancestors (all terms reachable through is_a and relationship
+    edges) of every term in the GO graph.
 
     Parameters
     ----------
-    goterms : list
     go_graph : networkx.classes.multidigraph.MultiDiGraph
 
     Returns
     -------
-    String with comma-separated GO terms
-
-    """
-    all_goterms = set()
-    for goterm in list(goterms):
-        # dealing with obsolete GO terms
-        try:
-            parents = nx.descendants(go_graph, goterm)
-            all_goterms = all_goterms.union(parents)
-        except:
-            all_goterms = all_goterms.union(set([goterm]))
-    # adding original GOs
-    all_goterms = all_goterms.union(set(goterms))
-    # root terms
-    root_terms = {'GO:0008150', 'GO:0003674', 'GO:0005575'}
+    GOClosure with sorted term IDs and CSR arrays of sorted ancestor codes
+    """
+    terms = np.array(sorted(go_graph.nodes), dtype=str)
+    codes = {term: code for code, term in enumerate(terms)}
+    indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    ancestors = []
+    for code, term in enumerate(terms):
+        term_ancestors = sorted(codes[parent]
+                                for parent in nx.descendants(go_graph, term))
+        ancestors.append(term_ancestors)
+        indptr[code + 1] = indptr[code] + len(term_ancestors)
+    indices = np.fromiter((code for term_ancestors in ancestors
+                           for code in term_ancestors),
+                          dtype=np.int32, count=indptr[-1])
+    return GOClosure(terms, indptr, indices, codes)
+
+
+def save_go_closure(closure, index_dir):
+    """
+    Saves GO closure arrays as .npy files into a directory. The directory
+    is written next to its final place and renamed, so that readers never
+    see a partial index.
+
+    Parameters
+    ----------
+    closure : GOClosure
+    index_dir : str
+        directory of the index
+    """
+    tmp_dir = f'{index_dir}.tmp{os.getpid()}'
+    os.makedirs(tmp_dir, exist_ok=True)
+    for name in ['terms', 'indptr', 'indices']:
+        np.save(join(tmp_dir, f'{name}.npy'), getattr(closure, name))
+    try:
+        os.rename(tmp_dir, index_dir)
+    except OSError:
+        # index saved by a concurrent run
+        shutil.rmtree(tmp_dir)
+
+
+def load_go_closure(index_dir):
+    """
+    Loads GO closure arrays memory-mapped from a directory.
+
+    Parameters
+    ----------
+    index_dir : str
+        directory of the index
+
+    Returns
+    -------
+    GOClosure
+    """
+    arrays = {name: np.load(join(index_dir, f'{name}.npy'), mmap_mode='r')
+              for name in ['terms', 'indptr', 'indices']}
+    codes = {term: code for code, term in enumerate(arrays['terms'].tolist())}
+    return GOClosure(codes=codes, **arrays)
+
+
+def get_go_closure(obo_path, index_path=None):
+    """
+    Loads the GO closure index of an OBO file, compiling and saving it
+    first if there is no index of its version yet.
+
+    Parameters
+    ----------
+    obo_path : str
+        GO tree (.obo)
+    index_path : str
+        directory with GO closure indices, the directory of the OBO file
+        if None
+
+    Returns
+    -------
+    GOClosure
+    """
+    if index_path is None:
+        index_path = os.path.dirname(obo_path)
+    index_dir = join(index_path, f'go_closure_v{CLOSURE_INDEX_VERSION}_'
+                                 f'{read_obo_version(obo_path)}')
+    if os.path.isdir(index_dir):
+        return load_go_closure(index_dir)
+
+    with open(obo_path, 'r') as f:
+        closure = compile_go_closure(obonet.read_obo(f))
+    try:
+        save_go_closure(closure, index_dir)
+    except OSError as e:
+        print(f'GO closure index not saved to {index_dir}: {e}')
+    return closure
+
+
+def go_incidence_matrix(go_strings, go_closure):
+    """
+    Builds boolean incidence matrix of comma-separated GO strings and
+    GO terms. Terms missing in the GO closure (obsolete terms, '-') get
+    columns after the closure terms.
+
+    Parameters
+    ----------
+    go_strings : numpy.ndarray
+        comma-separated GO terms
+    go_closure : GOClosure
+
+    Returns
+    -------
+    CSR matrix (GO strings x terms), array of unknown terms
+    """
+    exploded = pd.Series(go_strings, dtype=object).str.split(',').explode()
+    goterms = exploded.to_numpy(dtype=str)
+    codes = pd.Index(go_closure.terms).get_indexer(goterms)
+    unknown = codes == -1
+    unknown_terms, unknown_codes = np.unique(goterms[unknown],
+                                             return_inverse=True)
+    codes[unknown] = len(go_closure.terms) + unknown_codes
+    incidence = sp.csr_matrix(
+        (np.ones(len(codes), dtype=bool),
+         (exploded.index.to_numpy(), codes)),
+        shape=(len(go_strings), len(go_closure.terms) + len(unknown_terms)))
+    return incidence, unknown_terms
+
+
+def ancestor_matrix(go_closure, n_unknown=0):
+    """
+    Builds boolean matrix of terms and their ancestors including the term
+    itself. Unknown terms are their own only ancestors.
+
+    Parameters
+    ----------
+    go_closure : GOClosure
+    n_unknown : int
+        number of unknown terms after the closure terms
+
+    Returns
+    -------
+    CSR matrix (terms x terms)
+    """
+    n_terms = len(go_closure.terms) + n_unknown
+    indptr = np.concatenate([go_closure.indptr,
+                             np.full(n_unknown, go_closure.indptr[-1])])
+    ancestors = sp.csr_matrix(
+        (np.ones(len(go_closure.indices), dtype=bool),
+         np.asarray(go_closure.indices), indptr), shape=(n_terms, n_terms))
+    return ancestors + sp.identity(n_terms, dtype=bool, format='csr')
+
+
+def propagate_go_column(go_column, go_closure):
+    """
+    Propagate comma-separated GO terms of every row as a sparse product of
+    the incidence matrix of distinct GO strings and the ancestor matrix.
+    Root terms are pruned by a column mask and columns are sorted by term.
+
+    Parameters
+    ----------
+    go_column : pandas.Series
+        comma-separated GO terms
+    go_closure : GOClosure
+
+    Returns
+    -------
+    pandas.Series with comma-separated propagated GO terms,
+    CSR matrix (rows x terms) of propagated GO terms,
+    array of matrix column terms
+    """
+    codes, go_strings = pd.factorize(go_column)
+    incidence, unknown_terms = go_incidence_matrix(go_strings, go_closure)
+    propagated = incidence @ ancestor_matrix(go_closure, len(unknown_terms))
+
+    terms = np.concatenate([go_closure.terms, unknown_terms])
+    order = np.argsort(terms, kind='stable')
     # pruning root terms
-    all_goterms = all_goterms.difference(root_terms)
-    return ','.join(sorted(all_goterms))
+    order = order[~np.isin(terms[order], list(ROOT_TERMS))]
+    terms = terms[order]
+    propagated = propagated[:, order]
+    propagated.sort_indices()
+    print(f'GO propagation: {len(go_column)} rows, '
+          f'{len(go_strings)} distinct GO strings, '
+          f'{len(terms)} GO terms')
+
+    term_names = terms.astype(object)
+    go_propagated = np.array(
+        [','.join(term_names[propagated.indices[start:stop]])
+         for start, stop in zip(propagated.indptr[:-1],
+                                propagated.indptr[1:])], dtype=object)
+    return (pd.Series(go_propagated[codes], index=go_column.index),
+            propagated[codes], terms)
+
+
+def save_go_matrix(path, go_matrix, genes, terms):
+    """
+    Saves gene x GO matrix in .npz format readable by scipy.sparse.load_npz
+    with additional 'genes' and 'terms' arrays of row and column labels.
+
+    Parameters
+    ----------
+    path : str
+        output .npz file
+    go_matrix : scipy.sparse.csr_matrix
+    genes : numpy.ndarray
+        row labels
+    terms : numpy.ndarray
+        column labels
+    """
+    np.savez_compressed(path, format=b'csr', shape=go_matrix.shape,
+                        data=go_matrix.data, indices=go_matrix.indices,
+                        indptr=go_matrix.indptr, genes=genes.astype(str),
+                        terms=terms.astype(str))
+
+
+def load_go_matrix(path):
+    """
+    Loads gene x GO matrix saved by save_go_matrix.
+
+    Parameters
+    ----------
+    path : str
+        .npz file
+
+    Returns
+    -------
+    CSR matrix, array of genes (rows), array of GO terms (columns)
+    """
+    with np.load(path) as arrays:
+        return sp.load_npz(path), arrays['genes'], arrays['terms']
+
+
+def init_propagation(tree, index_path=None):
+    """
+    Loads the GO closure used by propagate_genes in this process. Pool
+    workers load the saved index memory-mapped, so that all of them share
+    its pages.
+
+    Parameters
+    ----------
+    tree : str
+        GO tree (.obo)
+    index_path : str
+        directory with GO closure indices
+    """
+    global _go_closure
+    _go_closure = get_go_closure(tree, index_path)
+
+
+def propagate_genes(mapped_genes):
+    """
+    Propagate GO terms of genes in a chunk of the gene mapping table with
+    the GO closure loaded by init_propagation.
+
+    Parameters
+    ----------
+    mapped_genes : pandas.DataFrame
+        chunk with 'Gene ID' and 'GOs' columns
+
+    Returns
+    -------
+    Pandas dataframe of genes with GOs and propagated GOs,
+    CSR matrix (genes x terms) of propagated GO terms,
+    array of matrix column terms
+    """
+    # drop NAN in the Gene ID column
+    mapped_genes = mapped_genes[mapped_genes['Gene ID'].notna()]
+
+    # subset data and drop NANs in the GOs column
+    genes_GO_df = mapped_genes[["Gene ID", "GOs"]].dropna()
+
+    # propagate GO terms
+    genes_GO_df['GOs_propagated'], go_matrix, go_terms = \
+        propagate_go_column(genes_GO_df['GOs'], _go_closure)
+    return genes_GO_df, go_matrix, go_terms
+
+
+def iter_ordered(executor, func, items, window):
+    """
+    Maps function over items in a process pool, keeping at most `window`
+    items in flight, and yields results in the order of items.
+
+    Parameters
+    ----------
+    executor : concurrent.futures.Executor
+    func : function
+    items : iterable
+    window : int
+        maximal number of submitted items without consumed result
+
+    Yields
+    ------
+    Results of func
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def open_spool(path, dtype, length, mode='w+'):
+    """
+    Memory-maps a temporary array file of write_propagated.
+
+    Parameters
+    ----------
+    path : str
+    dtype : numpy dtype
+    length : int
+        number of elements
+    mode : str
+        'w+' creates the file, 'r' reads an existing one
+
+    Returns
+    -------
+    numpy.memmap (numpy.ndarray if empty)
+    """
+    if length == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode=mode, shape=(length,))
+
+
+def write_propagated(results, out_file):
+    """
+    Writes propagated chunks to the output .tsv file as they come and
+    saves the gene x GO matrix of all chunks to .npz next to it. Matrix
+    rows and genes of every chunk are spooled to temporary files next to
+    the output, so that only one chunk is held in memory at a time.
+
+    Parameters
+    ----------
+    results : iterable
+        (genes dataframe, CSR matrix, terms) of chunks as returned by
+        propagate_genes
+    out_file : str
+        output .tsv file
+    """
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(out_file),
+                                     prefix='.go_matrix.') as tmp_dir:
+        # (number of genes, gene ID width, nnz, terms) of chunks
+        chunks = []
+        with open(join(tmp_dir, 'indices'), 'wb') as indices_file, \
+                open(join(tmp_dir, 'row_nnz'), 'wb') as row_nnz_file, \
+                open(join(tmp_dir, 'genes'), 'wb') as genes_file:
+            for genes_GO_df, go_matrix, go_terms in results:
+                genes_GO_df.to_csv(out_file, sep='\t', index=False,
+                                   header=not chunks,
+                                   mode='a' if chunks else 'w')
+                genes = genes_GO_df['Gene ID'].to_numpy(dtype=str)
+                genes.tofile(genes_file)
+                go_matrix.indices.astype(np.int64).tofile(indices_file)
+                np.diff(go_matrix.indptr).astype(np.int64).tofile(
+                    row_nnz_file)
+                chunks.append((len(genes), genes.dtype, go_matrix.nnz,
+                               go_terms))
+        if not chunks:
+            # table without chunks
+            genes_GO_df, _, go_terms = propagate_genes(
+                pd.DataFrame(columns=["Gene ID", "GOs"], dtype=object))
+            genes_GO_df.to_csv(out_file, sep='\t', index=False)
+            chunks.append((0, np.dtype(str), 0, go_terms))
+
+        # chunks differ in unknown terms, columns are aligned to all terms
+        terms = np.unique(np.concatenate([c[3] for c in chunks]))
+        n_genes = sum(c[0] for c in chunks)
+        nnz = sum(c[2] for c in chunks)
+        idx_dtype = np.int32 if max(nnz, len(terms)) <= \
+            np.iinfo(np.int32).max else np.int64
+        chunk_indices = open_spool(join(tmp_dir, 'indices'), np.int64, nnz,
+                                   'r')
+        indices = open_spool(join(tmp_dir, 'indices_aligned'), idx_dtype,
+                             nnz)
+        indptr = open_spool(join(tmp_dir, 'indptr'), idx_dtype, n_genes + 1)
+        genes = open_spool(join(tmp_dir, 'genes_aligned'),
+                           np.result_type(*[c[1] for c in chunks]), n_genes)
+        indptr[0] = 0
+        np.cumsum(open_spool(join(tmp_dir, 'row_nnz'), np.int64, n_genes,
+                             'r'), out=indptr[1:])
+        row, start = 0, 0
+        with open(join(tmp_dir, 'genes'), 'rb') as genes_file:
+            for n_rows, gene_dtype, n, go_terms in chunks:
+                indices[start:start + n] = np.searchsorted(terms, go_terms)[
+                    chunk_indices[start:start + n]]
+                genes[row:row + n_rows] = np.fromfile(genes_file, gene_dtype,
+                                                      n_rows)
+                row += n_rows
+                start += n
+        save_go_matrix(f'{os.path.splitext(out_file)[0]}.npz',
+                       sp.csr_matrix((np.ones(nnz, dtype=bool), indices,
+                                      indptr), shape=(n_genes, len(terms))),
+                       genes, terms)
+        del chunk_indices, indices, indptr, genes
 
 
 @click.command()
 @click.option('--gene_mapper_file', '-g', required=True,
               type=click.Path(resolve_path=True, readable=True, exists=True),
-              help='Input gene mapping table .tsv file')
+              help='Input gene mapping table .tsv, .parquet or .feather file')
 @click.option('--tree', '-t', required=True,
               type=click.Path(resolve_path=True, readable=True, exists=True),
               help='obo tree')
 @click.option('--out_file', '-o', required=True,
               type=click.Path(resolve_path=True, readable=True, exists=False),
               help='Output .tsv file.')
-def _propagate_GO(gene_mapper_file, tree, out_file):
+@click.option('--index_path', '-i', default=None,
+              type=click.Path(resolve_path=True, file_okay=False),
+              help='Directory with compiled GO closure indices keyed by OBO '
+                   'version (directory of the obo tree by default).')
+@click.option('--workers', '-w', default=1, type=click.IntRange(1),
+              show_default=True,
+              help='Number of processes propagating chunks of the table.')
+@click.option('--chunksize', '-c', default=None, type=click.IntRange(1),
+              help='Number of rows of the table propagated at once '
+                   '(whole table by default).')
+def _propagate_GO(gene_mapper_file, tree, out_file, index_path, workers,
+                  chunksize):
     """
     Script for Propagation of GO terms.
 
@@ -56,31 +599,33 @@ def _propagate_GO(gene_mapper_file, tree, out_file):
     1) go graph
     2) EggNOG GO predictions
     3) Name of output file
+    4) (optional) Directory of GO closure indices
+    5) (optional) Number of processes and rows per chunk
 
     Output:
     1) propagated Gene ontologies
+    2) gene x GO matrix of propagated Gene ontologies (.npz next to the
+       output file)
     """
 
-    with open(tree, 'r') as f:
-        go_graph = obonet.read_obo(f)
+    # compile the GO closure index once before starting the workers
+    init_propagation(tree, index_path)
 
     # load gene mapper table
-    mapped_genes = pd.read_csv(gene_mapper_file, sep="\t")
+    gene_column = find_gene_column(gene_mapper_file)
+    chunks = (chunk.rename(columns={gene_column: "Gene ID"}) for chunk in
+              iter_genemapper_table(gene_mapper_file, [gene_column, "GOs"],
+                                    chunksize))
 
-    # drop NAN in the Gene ID column
-    mapped_genes = mapped_genes[mapped_genes['Gene ID'].notna()]
-
-    # subset data and drop NANs in the GOs column
-    genes_GO_df = mapped_genes[["Gene ID", "GOs"]].dropna()
-
-    # propagate GO terms
-    genes_GO_df['GOs_propagated'] = genes_GO_df['GOs'].str.split(',').\
-        apply(propagate_go, go_graph=go_graph)
-
-    # save the file
-    genes_GO_df.to_csv(out_file, sep='\t', index=False)
+    # propagate GO terms and save the files
+    if workers > 1:
+        with ProcessPoolExecutor(workers, initializer=init_propagation,
+                                 initargs=(tree, index_path)) as executor:
+            write_propagated(iter_ordered(executor, propagate_genes, chunks,
+                                          2 * workers), out_file)
+    else:
+        write_propagated(map(propagate_genes, chunks), out_file)
 
 
 if __name__ == "__main__":
     _propagate_GO()
-
@@ -0,0 +1,276 @@
+#! /usr/bin/env python
+
+import os
+import glob
+import click
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from concurrent.futures import ProcessPoolExecutor
+from os.path import join
+
+# suffixes of KMA results and normalized KMA depth files
+KMA_RES_SUFFIX = '.kma.res'
+GENE_CPM_SUFFIX = '.geneCPM.txt'
+# arrays of the abundance matrix directory
+MATRIX_ARRAYS = ['data', 'indices', 'indptr', 'genes', 'samples']
+
+# gene index of the current (worker) process, see init_gene_index
+_gene_index = None
+
+
+def load_kma_abundance(path):
+    """
+    Reads CPMs of genes from KMA results (.kma.res), normalizing depths
+    to CPM, or from normalized KMA depth file (.geneCPM.txt)
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    Array of gene IDs, array of CPMs
+    """
+    if path.endswith(KMA_RES_SUFFIX):
+        kma_df = pd.read_csv(path, usecols=['#Template', 'Depth'], sep="\t")
+        depth = kma_df['Depth'].to_numpy()
+        return kma_df['#Template'].to_numpy(dtype=str), \
+            depth / depth.sum() * 1_000_000
+    kma_df = pd.read_csv(path, sep="\t", skiprows=1, usecols=[0, 1],
+                         names=['Gene_ID', 'CPM'])
+    return kma_df['Gene_ID'].to_numpy(dtype=str), kma_df['CPM'].to_numpy()
+
+
+def load_genemapper_table(path, columns=None):
+    """
+    Reads gene mapping table (.tsv, .parquet or .feather),
+    loading only the requested columns
+
+    Parameters
+    ----------
+    path : str
+    columns : list of str
+
+    Returns
+    -------
+    Pandas dataframe
+    """
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    if path.endswith('.feather'):
+        return pd.read_feather(path, columns=columns)
+    return pd.read_csv(path, sep="\t", usecols=columns)
+
+
+def list_kma_files(input_paths):
+    """
+    Lists KMA results and normalized KMA depth files of samples. Directories
+    are searched for *.kma.res and *.geneCPM.txt files.
+
+    Parameters
+    ----------
+    input_paths : list of str
+        files and directories
+
+    Returns
+    -------
+    Dictionary of sample names and paths
+    """
+    sample_files = {}
+    for input_path in input_paths:
+        if os.path.isdir(input_path):
+            paths = sorted(glob.glob(join(input_path, f'*{KMA_RES_SUFFIX}')) +
+                           glob.glob(join(input_path, f'*{GENE_CPM_SUFFIX}')))
+        else:
+            paths = [input_path]
+        for path in paths:
+            sample = os.path.basename(path)
+            for suffix in [KMA_RES_SUFFIX, GENE_CPM_SUFFIX]:
+                if sample.endswith(suffix):
+                    sample = sample[:-len(suffix)]
+            if sample in sample_files:
+                raise click.BadParameter(
+                    f'{path} and {sample_files[sample]} are of the same '
+                    f'sample {sample}', param_hint='--input_path')
+            sample_files[sample] = path
+    return sample_files
+
+
+def init_gene_index(genes):
+    """
+    Sets the gene index used by code_sample_abundance in this process.
+
+    Parameters
+    ----------
+    genes : numpy.ndarray
+        gene IDs in the catalog order, None to return gene IDs
+    """
+    global _gene_index
+    _gene_index = None if genes is None else pd.Index(genes)
+
+
+def code_sample_abundance(path):
+    """
+    Reads CPMs of a sample with genes coded by the gene index. Genes
+    missing in the index are dropped.
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    Array of gene codes (gene IDs without the index), array of float32 CPMs,
+    number of dropped genes
+    """
+    genes, cpm = load_kma_abundance(path)
+    if _gene_index is None:
+        return genes, cpm.astype(np.float32), 0
+    codes = _gene_index.get_indexer(genes)
+    known = codes != -1
+    return codes[known].astype(np.int32), cpm[known].astype(np.float32), \
+        np.count_nonzero(~known)
+
+
+def build_abundance_matrix(sample_files, genes=None, workers=1):
+    """
+    Builds sparse gene x sample matrix of CPMs, reading sample files in
+    parallel.
+
+    Parameters
+    ----------
+    sample_files : dict
+        sample names and paths of their KMA files
+    genes : numpy.ndarray
+        gene IDs in the catalog order, sorted IDs of all genes in the samples
+        if None
+    workers : int
+        number of processes reading sample files
+
+    Returns
+    -------
+    CSC matrix (genes x samples) of float32 CPMs, array of genes,
+    array of samples
+    """
+    paths = list(sample_files.values())
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(min(workers, len(paths)),
+                                 initializer=init_gene_index,
+                                 initargs=(genes,)) as executor:
+            samples = list(executor.map(code_sample_abundance, paths))
+    else:
+        init_gene_index(genes)
+        samples = [code_sample_abundance(path) for path in paths]
+
+    codes = [sample_codes for sample_codes, _, _ in samples]
+    cpm = np.concatenate([np.empty(0, dtype=np.float32)] +
+                         [sample_cpm for _, sample_cpm, _ in samples])
+    n_dropped = sum(sample_dropped for _, _, sample_dropped in samples)
+    if n_dropped:
+        print(f'{n_dropped} gene abundances of genes missing in the gene '
+              f'catalog skipped')
+    if genes is None:
+        genes, indices = np.unique(
+            np.concatenate([np.empty(0, dtype=str)] + codes),
+            return_inverse=True)
+    else:
+        indices = np.concatenate([np.empty(0, dtype=np.int32)] + codes)
+    indptr = np.zeros(len(paths) + 1, dtype=np.int64)
+    np.cumsum([len(sample_codes) for sample_codes in codes], out=indptr[1:])
+
+    abundance = sp.csc_matrix((cpm, indices.astype(np.int32), indptr),
+                              shape=(len(genes), len(paths)))
+    # genes repeated in a sample file are summed up
+    abundance.sum_duplicates()
+    return abundance, np.asarray(genes, dtype=str), \
+        np.array(list(sample_files), dtype=str)
+
+
+def save_abundance_matrix(out_dir, abundance, genes, samples):
+    """
+    Saves gene x sample matrix as .npy files of CSC arrays and gene and
+    sample indices, loadable memory-mapped.
+
+    Parameters
+    ----------
+    out_dir : str
+    abundance : scipy.sparse.csc_matrix
+    genes : numpy.ndarray
+    samples : numpy.ndarray
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    arrays = {'data': abundance.data, 'indices': abundance.indices,
+              'indptr': abundance.indptr, 'genes': genes, 'samples': samples}
+    for name in MATRIX_ARRAYS:
+        np.save(join(out_dir, f'{name}.npy'), arrays[name])
+
+
+def load_abundance_matrix(matrix_dir, mmap_mode='r'):
+    """
+    Loads gene x sample matrix saved by save_abundance_matrix.
+
+    Parameters
+    ----------
+    matrix_dir : str
+    mmap_mode : str
+        memory-map mode of numpy.load, None to read arrays into memory
+
+    Returns
+    -------
+    CSC matrix (genes x samples) of float32 CPMs, array of genes,
+    array of samples
+    """
+    arrays = {name: np.load(join(matrix_dir, f'{name}.npy'),
+                            mmap_mode=mmap_mode)
+              for name in MATRIX_ARRAYS}
+    abundance = sp.csc_matrix(
+        (arrays['data'], arrays['indices'], arrays['indptr']),
+        shape=(len(arrays['genes']), len(arrays['samples'])), copy=False)
+    return abundance, arrays['genes'], arrays['samples']
+
+
+@click.command()
+@click.option('--input_path', '-i', required=True, multiple=True,
+              type=click.Path(resolve_path=True, readable=True, exists=True),
+              help='KMA results .kma.res or normalized KMA depth '
+                   '.geneCPM.txt file, or directory of these files. '
+                   'Can be repeated.')
+@click.option('--gene_mapper_file', '-g', default=None,
+              type=click.Path(resolve_path=True, readable=True, exists=True),
+              help='Gene mapping table .tsv, .parquet or .feather file '
+                   'giving the order of genes (sorted gene IDs of the '
+                   'samples by default).')
+@click.option('--out_dir', '-o', required=True,
+              type=click.Path(resolve_path=True, file_okay=False),
+              help='Output directory of the abundance matrix.')
+@click.option('--workers', '-w', default=1, type=click.IntRange(1),
+              show_default=True,
+              help='Number of processes reading sample files.')
+def _build_abundance_matrix(input_path, gene_mapper_file, out_dir, workers):
+    """
+    The script takes KMA results or normalized KMA depths of all samples
+    and builds a sparse gene x sample matrix of CPMs.
+
+    Input files required:
+    1) KMA results or normalized KMA depths of samples
+    2) (optional) gene mapper table with the gene catalog
+
+    Outputs:
+    1) directory with .npy files of the CSC matrix (data, indices, indptr),
+       gene index (genes) and sample index (samples)
+    """
+    sample_files = list_kma_files(input_path)
+
+    genes = None
+    if gene_mapper_file is not None:
+        genes = load_genemapper_table(gene_mapper_file, ["Gene ID"])[
+            'Gene ID'].dropna().drop_duplicates().to_numpy(dtype=str)
+
+    abundance, genes, samples = build_abundance_matrix(sample_files, genes,
+                                                       workers)
+    save_abundance_matrix(out_dir, abundance, genes, samples)
+
+
+if __name__ == "__main__":
+    _build_abundance_matrix()
@@ -1,11 +1,18 @@
 #! /usr/bin/env python
 
+import os
 import click
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
+from os.path import join
 
 pd.options.mode.chained_assignment = None
 
+# separators of terms in annotation columns other than comma, empty string
+# for single-letter terms
+ANNOTATION_SEPARATORS = {'COG_category': ''}
+
 
 def load_normalized_kma_file(path):
     """
@@ -19,76 +26,262 @@ def load_normalized_kma_file(path):
     -------
     Pandas dataframe
     """
-    kma_df = pd.read_csv(path, sep="\t", skiprows=1, names=['Gene_ID', 'CPM'])
+    kma_df = pd.read_csv(path, sep="\t", skiprows=1, usecols=[0, 1],
+                         names=['Gene_ID', 'CPM'])
     return kma_df
 
 
-def load_genemapper_table(path):
+def load_genemapper_table(path, columns=None):
     """
-    Reads gene mapping table
+    Reads gene mapping table (.tsv, .parquet or .feather),
+    loading only the requested columns
     Parameters
     ----------
-    input_file : tsv
+    input_file : tsv, parquet or feather
+    columns : list of str
 
     Returns
     -------
     Pandas dataframe
 
     """
-
-    mapping_table_df = pd.read_csv(path, sep="\t")
+    if path.endswith('.parquet'):
+        mapping_table_df = pd.read_parquet(path, columns=columns)
+    elif path.endswith('.feather'):
+        mapping_table_df = pd.read_feather(path, columns=columns)
+    else:
+        mapping_table_df = pd.read_csv(path, sep="\t", usecols=columns)
     return mapping_table_df
 
 
+def load_abundance_matrix(matrix_dir):
+    """
+    Reads gene x sample CPM matrix built by KMA_abundance_matrix.py,
+    memory-mapped
+
+    Parameters
+    ----------
+    matrix_dir : str
+        directory of the abundance matrix
+
+    Returns
+    -------
+    CSC matrix (genes x samples), array of genes, array of samples
+    """
+    arrays = {name: np.load(join(matrix_dir, f'{name}.npy'), mmap_mode='r')
+              for name in ['data', 'indices', 'indptr', 'genes', 'samples']}
+    abundance = sp.csc_matrix(
+        (arrays['data'], arrays['indices'], arrays['indptr']),
+        shape=(len(arrays['genes']), len(arrays['samples'])), copy=False)
+    return abundance, arrays['genes'], arrays['samples']
+
+
+def load_go_matrix(path):
+    """
+    Reads gene x GO matrix of propagated GO terms saved by
+    GO_terms_propagation.py (.npz)
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    CSR matrix (genes x GO terms), array of genes, array of GO terms
+    """
+    with np.load(path) as arrays:
+        return sp.load_npz(path), arrays['genes'], arrays['terms']
+
+
+def gene_term_matrix(annotations, separator=','):
+    """
+    Builds gene x term incidence matrix of annotation terms of genes.
+    Genes without annotation have no terms.
+
+    Parameters
+    ----------
+    annotations : pandas.Series
+        annotation terms of genes separated by separator
+    separator : str
+        separator of terms, empty string for single-letter terms
+
+    Returns
+    -------
+    CSR matrix (genes x terms), array of terms
+    """
+    n_genes = len(annotations)
+    annotations = annotations.reset_index(drop=True).dropna().astype(str)
+    if separator:
+        exploded = annotations.str.split(separator).explode()
+    else:
+        exploded = annotations.map(list).explode()
+    exploded = exploded.dropna()
+    terms, codes = np.unique(exploded.to_numpy(dtype=str),
+                             return_inverse=True)
+    term_matrix = sp.csr_matrix(
+        (np.ones(len(codes)), (exploded.index.to_numpy(), codes)),
+        shape=(n_genes, len(terms)))
+    return term_matrix, terms
+
+
+def align_abundance(genes, abundance, abundance_genes):
+    """
+    Selects abundances of genes in the given order. Genes without
+    abundance get zero rows.
+
+    Parameters
+    ----------
+    genes : numpy.ndarray
+    abundance : scipy.sparse matrix
+        genes x samples CPMs
+    abundance_genes : numpy.ndarray
+        genes of abundance rows
+
+    Returns
+    -------
+    CSR matrix (genes x samples) of CPMs
+    """
+    codes = pd.Index(abundance_genes).get_indexer(genes)
+    # missing genes select the appended zero row
+    codes[codes == -1] = abundance.shape[0]
+    abundance = sp.vstack([sp.csr_matrix(abundance, dtype=np.float64),
+                           sp.csr_matrix((1, abundance.shape[1]))],
+                          format='csr')
+    return abundance[codes]
+
+
+def sum_CPM_per_term(term_matrix, abundance):
+    """
+    Sums up CPMs of genes per term as sparse product of term x gene and
+    gene x sample matrices.
+
+    Parameters
+    ----------
+    term_matrix : scipy.sparse matrix
+        genes x terms
+    abundance : scipy.sparse matrix
+        genes x samples CPMs, rows aligned to term_matrix
+
+    Returns
+    -------
+    numpy.ndarray (terms x samples) of summed CPMs
+    """
+    CPM_per_term = sp.csr_matrix(term_matrix.T, dtype=np.float64) @ abundance
+    return CPM_per_term.toarray()
+
+
+def annotation_out_file(out_file, annotation, n_annotations):
+    """
+    Output file of an annotation column, the output file itself for a
+    single annotation and '<out_file root>_<annotation><ext>' otherwise.
+
+    Parameters
+    ----------
+    out_file : str
+    annotation : str
+    n_annotations : int
+
+    Returns
+    -------
+    str
+    """
+    if n_annotations == 1:
+        return out_file
+    root, ext = os.path.splitext(out_file)
+    return f'{root}_{annotation}{ext}'
+
+
 @click.command()
-@click.option('--kma_file', '-k', required=True,
+@click.option('--kma_file', '-k', default=None,
               type=click.Path(resolve_path=True, readable=True, exists=True),
               help='Input normalized KMA depth file .tsv file.')
-@click.option('--gene_mapper_file', '-g', required=True,
+@click.option('--abundance_matrix', '-a', default=None,
+              type=click.Path(resolve_path=True, readable=True, exists=True,
+                              file_okay=False),
+              help='Input directory of gene x sample CPM matrix built by '
+                   'KMA_abundance_matrix.py, instead of --kma_file.')
+@click.option('--gene_mapper_file', '-g', default=None,
               type=click.Path(resolve_path=True, readable=True, exists=True),
-              help='Input gene mapping table .tsv file.')
+              help='Input gene mapping table .tsv, .parquet or .feather '
+                   'file.')
+@click.option('--propagated_go', '-p', default=None,
+              type=click.Path(resolve_path=True, readable=True, exists=True),
+              help='Input gene x GO matrix .npz file of propagated GO terms '
+                   'saved by GO_terms_propagation.py, used for GOs instead '
+                   'of the gene mapper table.')
+@click.option('--annotation', '-n', multiple=True, default=['GOs'],
+              show_default=True,
+              help='Annotation column of the gene mapper table to sum up '
+                   'CPMs for (e.g. GOs, KEGG_ko, KEGG_Pathway, KEGG_Module, '
+                   'EC, COG_category, PFAMs, CAZy). Can be repeated.')
 @click.option('--out_file', '-o', required=True,
               type=click.Path(resolve_path=True, readable=True, exists=False),
-              help='Output .tsv file.')
-def _perform_summing_up_CPM(kma_file, gene_mapper_file, out_file):
+              help='Output .tsv file, with _<annotation> appended for more '
+                   'annotations.')
+def _perform_summing_up_CPM(kma_file, abundance_matrix, gene_mapper_file,
+                            propagated_go, annotation, out_file):
     """
     The script takes normalized KMA depths, gene mapper
-    table and sums up CPMs per GO terms.
+    table and sums up CPMs per GO terms (or other annotation terms).
 
     Input files required:
-    1) Normalized KMA depths
-    2) gene mapper table
+    1) Normalized KMA depths of a sample or abundance matrix of all samples
+    2) gene mapper table and/or matrix of propagated GO terms
 
     Outputs:
-    1) TSV file of CPMs per GO term
+    1) TSV file of CPMs per term of each annotation (column per sample for
+       the abundance matrix)
     """
-    # load kma dataframe
-    kma_df = load_normalized_kma_file(kma_file)
-
-    # load gene mapper table
-    mapped_genes = load_genemapper_table(gene_mapper_file)
-
-    # subset data to obtain genes and GO terms
-    genes_GO_mapping = mapped_genes[["Gene ID", "GOs", ]]
-
-    # transforming dataframe
-    gene_go = genes_GO_mapping.set_index('Gene ID') \
-        .GOs.str.split(',', expand=True) \
-        .stack() \
-        .reset_index('Gene ID') \
-        .rename(columns={0: 'GOs'}) \
-        .reset_index(drop=True)
+    annotations = list(dict.fromkeys(annotation))
+    table_annotations = [name for name in annotations
+                         if name != 'GOs' or propagated_go is None]
+    if (kma_file is None) == (abundance_matrix is None):
+        raise click.UsageError(
+            'Exactly one of --kma_file and --abundance_matrix is required.')
+    if table_annotations and gene_mapper_file is None:
+        raise click.UsageError(
+            '--gene_mapper_file is required for '
+            f'{", ".join(table_annotations)}.')
+    if propagated_go is not None and 'GOs' not in annotations:
+        raise click.UsageError('--propagated_go requires GOs annotation.')
 
-    # mapping kma dataframe to GO mapping df
-    cpm_gene_go = pd.merge(gene_go, kma_df,
-                           left_on='Gene ID', right_on='Gene_ID',
-                           how='outer')
+    # load abundances
+    if kma_file is not None:
+        kma_df = load_normalized_kma_file(kma_file) \
+            .groupby('Gene_ID', sort=False)['CPM'].sum()
+        abundance = sp.csr_matrix(kma_df.to_numpy()[:, np.newaxis])
+        abundance_genes = kma_df.index.to_numpy(dtype=str)
+        samples = ['CPM']
+    else:
+        abundance, abundance_genes, samples = \
+            load_abundance_matrix(abundance_matrix)
 
-    # sum up CPMs per GO term
-    CPM_per_GO = cpm_gene_go.groupby(['GOs'])['CPM'].agg(np.sum).reset_index()
+    # build gene x term matrices of annotations
+    term_matrices = {}
+    if table_annotations:
+        mapped_genes = load_genemapper_table(
+            gene_mapper_file, ['Gene ID'] + table_annotations)
+        mapped_genes = mapped_genes[mapped_genes['Gene ID'].notna()]
+        genes = mapped_genes['Gene ID'].to_numpy(dtype=str)
+        genes_abundance = align_abundance(genes, abundance, abundance_genes)
+        for name in table_annotations:
+            term_matrix, terms = gene_term_matrix(
+                mapped_genes[name], ANNOTATION_SEPARATORS.get(name, ','))
+            term_matrices[name] = term_matrix, terms, genes_abundance
+    if propagated_go is not None:
+        go_matrix, go_genes, terms = load_go_matrix(propagated_go)
+        term_matrices['GOs'] = go_matrix, terms, \
+            align_abundance(go_genes, abundance, abundance_genes)
 
-    # saving to file
-    CPM_per_GO.to_csv(out_file, sep='\t', index=False)
+    # sum up CPMs per term and save to files
+    for name in annotations:
+        term_matrix, terms, genes_abundance = term_matrices[name]
+        CPM_per_term = pd.DataFrame(
+            sum_CPM_per_term(term_matrix, genes_abundance), columns=samples)
+        CPM_per_term.insert(0, name, terms)
+        CPM_per_term.to_csv(annotation_out_file(out_file, name,
+                                                len(annotations)),
+                            sep='\t', index=False)
 
 
 if __name__ == "__main__":
@@ -2,61 +2,565 @@
 
 import os
 import glob
+import gzip
+import hashlib
+import mmap
 import click
 import re
+import tarfile
+import numpy as np
 import pandas as pd
 
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from os.path import join
-from skbio import io
 
 pd.options.mode.chained_assignment = None
 
 
-def tabulate_cluster_info(path):
+# number of bytes decompressed from gzipped fasta files at once
+FASTA_BLOCK_SIZE = 1 << 24
+# identifier of a fasta header (up to the first whitespace)
+FASTA_HEADER = re.compile(rb'\n>(\S*)')
+FASTA_FIRST_HEADER = re.compile(rb'>(\S*)')
+GZIP_MAGIC = b'\x1f\x8b'
+# suffix of MetaBAT2 bin archives
+BINS_ARCHIVE_SUFFIX = '.bins.tar.gz'
+# number of bytes read from the CD-HIT cluster file at once
+CLUSTER_BLOCK_SIZE = 1 << 24
+# number of annotations sampled to estimate the memory of a chunk
+SAMPLE_CHUNK_SIZE = 10_000
+# peak memory of writing a chunk relative to the memory of its annotations
+CHUNK_MEMORY_FACTOR = 4
+# smallest memory given to a chunk in bounded-memory mode
+MIN_CHUNK_BUDGET = 64 * 2**20
+
+# columns of the split output tables
+GENE_CLUSTER_COLS = ['Cluster_ID', 'centroid', 'seed_ortholog', 'evalue',
+                     'score', 'max_annot_lvl', 'Preferred_name', 'GOs', 'EC',
+                     'KEGG_ko', 'KEGG_Pathway', 'KEGG_Module',
+                     'KEGG_Reaction', 'KEGG_rclass', 'BRITE', 'KEGG_TC',
+                     'CAZy', 'BiGG_Reaction', 'PFAMs', 'eggNOG_OGs',
+                     'COG_category', 'Description']
+GENE_TABLE_COLS = ['Cluster_ID', 'Gene_ID', 'Contig_ID', 'MAG_ID']
+
+# parsed intermediates cache: entry suffix, format version and number of
+# bytes hashed per sampled block of the fingerprinted files
+CACHE_SUFFIX = '.pkl'
+CACHE_VERSION = 1
+FINGERPRINT_SAMPLE_SIZE = 1 << 16
+
+# number of rows of the split tables decoded at once
+SPLIT_CHUNK_SIZE = 1 << 20
+# number of rows of the previous master table updated at once
+UPDATE_CHUNK_SIZE = 1 << 20
+
+# file extensions of the output formats
+OUTPUT_EXTENSIONS = {'tsv': '.tsv', 'parquet': '.parquet',
+                     'feather': '.feather'}
+# compression codec and largest row group of the columnar outputs
+COLUMNAR_COMPRESSION = 'zstd'
+ROW_GROUP_SIZE = 1 << 20
+
+
+def bytes_to_str(ids):
+    """
+    Decodes a list of byte identifiers in one go.
+
+    Parameters
+    ----------
+    ids : list of bytes
+
+    Returns
+    -------
+    List of str
+    """
+    if not ids:
+        return []
+    return b'\n'.join(ids).decode().split('\n')
+
+
+def _parse_cluster_block(block, cluster_code):
+    """
+    Parses a block of complete lines of a CD-HIT cluster file.
+    Every '>' starts either a cluster header line or a member gene ID
+    (i.e. '1\t269nt, >GENE_ID... at +/95.12%'), both are located at once
+    on the raw bytes.
+
+    Parameters
+    ----------
+    block : bytes
+        complete lines of the cluster file
+    cluster_code : int
+        code of the cluster open at the beginning of the block
+
+    Returns
+    -------
+    Names of the clusters opened in the block, cluster codes (int64 array)
+    and gene IDs of the block members
+    """
+    data = np.frombuffer(block, dtype=np.uint8)
+    starts = np.flatnonzero(data == ord('>'))
+    is_header = np.ones(len(starts), dtype=bool)
+    inner = starts > 0
+    is_header[inner] = data[starts[inner] - 1] == ord('\n')
+
+    # header names end with the line
+    line_ends = np.flatnonzero(data == ord('\n'))
+    header_starts = starts[is_header]
+    header_ends = line_ends[np.searchsorted(line_ends, header_starts)]
+    names = [block[start + 1:end].rstrip() for start, end
+             in zip(header_starts.tolist(), header_ends.tolist())]
+
+    # gene IDs end with '...'
+    dots = np.flatnonzero((data[:-2] == ord('.')) & (data[1:-1] == ord('.')) &
+                          (data[2:] == ord('.')))
+    dots = np.append(dots, len(data))
+    member_starts = starts[~is_header] + 1
+    member_ends = dots[np.searchsorted(dots, member_starts)]
+    genes = [block[start:end] for start, end
+             in zip(member_starts.tolist(), member_ends.tolist())]
+
+    codes = (cluster_code + np.cumsum(is_header))[~is_header]
+    return bytes_to_str(names), codes, bytes_to_str(genes)
+
+
+def iter_cluster_blocks(path, block_size=CLUSTER_BLOCK_SIZE):
+    """
+    Streams CD-HIT cluster file in large blocks.
+    Clusters are coded with their ordinal number in the file.
+
+    Parameters
+    ----------
+    path : str
+        clustering file containing cluster centroids and gene IDS
+    block_size : int
+        number of bytes read at once
+
+    Yields
+    ------
+    Names of the clusters opened in the block, cluster codes (int64 array)
+    and gene IDs of the block members
+    """
+    cluster_code = -1
+    tail = b''
+    with open(path, 'rb') as file:
+        for block in iter(partial(file.read, block_size), b''):
+            block = tail + block
+            cut = block.rfind(b'\n') + 1
+            block, tail = block[:cut], block[cut:]
+            if block:
+                names, codes, genes = _parse_cluster_block(block,
+                                                           cluster_code)
+                cluster_code += len(names)
+                yield names, codes, genes
+        if tail:
+            yield _parse_cluster_block(tail + b'\n', cluster_code)
+
+
+def tabulate_cluster_info(path, block_size=CLUSTER_BLOCK_SIZE):
     """
     transforming raw cluster file
     Reads cluster file from CD-HIT
     transforms it into two-column format (cluster centroid ID and gene ID)
+    Both columns are categorical, cluster IDs are coded with the ordinal
+    number of the cluster in the file.
+
+    Parameters
+    ----------
+    path : str
+        clustering file containing cluster centroids and gene IDS
+    block_size : int
+        number of bytes read from the file at once
+
+    Returns
+    -------
+    Pandas dataframe containing cluster IDS and gene IDS
+    """
+    cluster_names, cluster_codes, genes = [], [], []
+    for names, codes, block_genes in iter_cluster_blocks(path, block_size):
+        cluster_names.extend(names)
+        cluster_codes.append(codes)
+        genes.extend(block_genes)
+    cluster_codes = np.concatenate(cluster_codes) if cluster_codes \
+        else np.empty(0, dtype=np.int64)
+    return pd.DataFrame({
+        'Cluster_ID': _cluster_categorical(cluster_codes, cluster_names),
+        'Gene_ID': _gene_categorical(genes)})
+
+
+def iter_cluster_info(path, chunksize=1_000_000,
+                      block_size=CLUSTER_BLOCK_SIZE):
+    """
+    Reads cluster file from CD-HIT chunk by chunk
+    Every chunk has the format of `tabulate_cluster_info` output with
+    categories limited to the clusters and genes of the chunk.
+
     Parameters
     ----------
-    input_file : str
+    path : str
         clustering file containing cluster centroids and gene IDS
+    chunksize : int
+        maximal number of genes in a chunk
+    block_size : int
+        number of bytes read from the file at once
+
+    Yields
+    ------
+    Pandas dataframe containing cluster IDS and gene IDS
+    """
+    # names of the clusters which can still be referenced,
+    # `first_code` is the code of the first of them
+    cluster_names, first_code = [], 0
+    cluster_codes, genes = np.empty(0, dtype=np.int64), []
+    for names, codes, block_genes in iter_cluster_blocks(path, block_size):
+        cluster_names.extend(names)
+        cluster_codes = np.concatenate([cluster_codes, codes])
+        genes.extend(block_genes)
+        while len(genes) >= chunksize:
+            yield _cluster_chunk(cluster_names, first_code,
+                                 cluster_codes[:chunksize], genes[:chunksize])
+            cluster_codes, genes = cluster_codes[chunksize:], \
+                genes[chunksize:]
+        # forget clusters which are complete and already returned
+        last_code = first_code + len(cluster_names) - 1
+        keep_code = min(cluster_codes[0], last_code) if genes else last_code
+        del cluster_names[:max(keep_code - first_code, 0)]
+        first_code = max(keep_code, first_code)
+    if genes:
+        yield _cluster_chunk(cluster_names, first_code, cluster_codes, genes)
+
+
+def _cluster_chunk(cluster_names, first_code, cluster_codes, genes):
+    """
+    Creates a chunk of the cluster table.
+
+    Parameters
+    ----------
+    cluster_names : list of str
+        names of the clusters starting from the `first_code`
+    first_code : int
+        code of the first cluster in `cluster_names`
+    cluster_codes : numpy.ndarray
+        sorted cluster codes of the genes
+    genes : list of str
+        gene IDs
 
     Returns
     -------
     Pandas dataframe containing cluster IDS and gene IDS
     """
-    clusters, genes = [], []
-    with open(path, 'r') as file:
-        for line in file:
-            if line.startswith(">"):
-                cluster_id = line.rstrip().replace(">", "")
-            else:
-                gene_id = line.split(">")[1].split("...")[0]
-                clusters.append(cluster_id)
-                genes.append(gene_id)
-    gene_cluster_df = pd.DataFrame(list(zip(clusters, genes)),
-                                   columns=['Cluster_ID', 'Gene_ID'])
-    return gene_cluster_df
+    start = max(cluster_codes[0], first_code)
+    stop = max(cluster_codes[-1] + 1, start)
+    return pd.DataFrame({
+        'Cluster_ID': _cluster_categorical(
+            np.where(cluster_codes < 0, -1, cluster_codes - start),
+            cluster_names[start - first_code:stop - first_code]),
+        'Gene_ID': _gene_categorical(genes)})
 
 
-def load_fasta_ids(path):
+def _gene_categorical(genes):
     """
-    Reads sequences from a fasta file and extracts identifiers.
+    Creates categorical gene IDs, categories keep the order of the genes.
 
     Parameters
     ----------
-    input_file : str
-        fasta file containing contigs and gene identifiers
+    genes : list of str
+        gene IDs
 
     Returns
     -------
-    List of fasta identifiers
+    Pandas categorical
     """
-    fasta_ids = [seq.metadata['id'] for seq in io.read(path, format='fasta')]
+    codes, categories = pd.factorize(np.array(genes, dtype=object))
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def _cluster_categorical(cluster_codes, cluster_names):
+    """
+    Creates categorical cluster IDs from cluster codes.
+    Repeated cluster names share one category.
+
+    Parameters
+    ----------
+    cluster_codes : numpy.ndarray
+        ordinal numbers of the clusters, -1 for genes outside of clusters
+    cluster_names : list of str
+        names of the clusters in the file order
+
+    Returns
+    -------
+    Pandas categorical
+    """
+    name_codes, categories = pd.factorize(np.array(cluster_names,
+                                                   dtype=object))
+    name_codes = np.append(name_codes, -1)
+    return pd.Categorical.from_codes(name_codes[cluster_codes],
+                                     categories=categories)
+
+
+def load_fasta_ids(path, block_size=FASTA_BLOCK_SIZE):
+    """
+    Scans headers of a fasta file and extracts identifiers.
+    Sequences are skipped without parsing, plain files are memory-mapped,
+    gzipped files are decompressed block by block.
+
+    Parameters
+    ----------
+    path : str
+        fasta file (optionally gzipped) containing contigs and gene
+        identifiers
+    block_size : int
+        number of bytes decompressed at once from gzipped files
+
+    Returns
+    -------
+    Numpy bytes array of fasta identifiers
+    """
+    with open(path, 'rb') as file:
+        is_gzipped = file.read(2) == GZIP_MAGIC
+        if is_gzipped:
+            file.seek(0)
+            fasta_ids = _scan_fasta_ids(gzip.GzipFile(fileobj=file),
+                                        block_size)
+        elif os.fstat(file.fileno()).st_size == 0:
+            fasta_ids = []
+        else:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                fasta_ids = FASTA_HEADER.findall(mm)
+                first = FASTA_FIRST_HEADER.match(mm)
+                if first:
+                    fasta_ids.insert(0, first.group(1))
+    return np.array(fasta_ids, dtype=bytes)
+
+
+def _scan_fasta_ids(file, block_size):
+    """
+    Extracts fasta identifiers from a stream read block by block.
+
+    Parameters
+    ----------
+    file : file object
+        binary stream of a fasta file
+    block_size : int
+        number of bytes read at once
+
+    Returns
+    -------
+    List of fasta identifiers (bytes)
+    """
+    fasta_ids = []
+    # every header has to be preceded by a newline inside a block
+    tail = b'\n'
+    for block in iter(partial(file.read, block_size), b''):
+        block = tail + block
+        cut = block.rfind(b'\n')
+        fasta_ids.extend(FASTA_HEADER.findall(block, 0, cut))
+        tail = block[cut:]
+    fasta_ids.extend(FASTA_HEADER.findall(tail))
     return fasta_ids
 
+
+def code_dtype(n_ids):
+    """
+    Smallest integer type able to code the given number of identifiers.
+
+    Parameters
+    ----------
+    n_ids : int
+        size of the ID dictionary
+
+    Returns
+    -------
+    numpy.int32 or numpy.int64
+    """
+    return np.int32 if n_ids < np.iinfo(np.int32).max else np.int64
+
+
+def encode_ids(ids, id_index):
+    """
+    Encodes identifiers with their integer codes in the ID dictionary.
+
+    Parameters
+    ----------
+    ids : array-like of str
+        identifiers to encode
+    id_index : pandas.Index
+        ID dictionary (unique identifiers, position is the code)
+
+    Returns
+    -------
+    Numpy array of codes, -1 for identifiers missing in the dictionary
+    """
+    return id_index.get_indexer(ids).astype(code_dtype(len(id_index)))
+
+
+def decode_codes(codes, id_index):
+    """
+    Decodes integer codes back to identifiers.
+    The returned array shares string objects with the ID dictionary.
+
+    Parameters
+    ----------
+    codes : numpy.ndarray
+        codes of the identifiers, -1 for missing values
+    id_index : pandas.Index
+        ID dictionary (unique identifiers, position is the code)
+
+    Returns
+    -------
+    Numpy object array with the identifiers, NaN for missing values
+    """
+    # the last element is returned for -1 codes
+    values = np.append(id_index.to_numpy(dtype=object), np.nan)
+    return values[codes]
+
+
+def group_codes(codes):
+    """
+    Groups rows by their integer codes for repeated joins.
+    Negative codes are skipped.
+
+    Parameters
+    ----------
+    codes : numpy.ndarray
+
+    Returns
+    -------
+    Row positions ordered by code, first position and number of rows
+    of every code
+    """
+    order = np.argsort(codes, kind='stable')
+    order = order[np.count_nonzero(codes < 0):]
+    counts = np.bincount(codes[order], minlength=codes.max(initial=-1) + 1)
+    return order, np.cumsum(counts) - counts, counts
+
+
+def join_grouped(left_codes, right_groups, how='inner'):
+    """
+    Joins integer codes with grouped right rows (output of `group_codes`).
+    Negative codes never match. The order of the left rows is kept and the
+    matches of every left row follow the order of the right rows.
+
+    Parameters
+    ----------
+    left_codes : numpy.ndarray
+    right_groups : tuple
+        grouped right rows
+    how : {'inner', 'left'}
+        type of join; with 'left' unmatched left rows are kept
+
+    Returns
+    -------
+    Left and right row positions of the joined rows, the right position is
+    -1 for the unmatched left rows
+    """
+    right_order, starts, counts = right_groups
+    known = (left_codes >= 0) & (left_codes < len(counts))
+    n_matches = np.zeros(len(left_codes), dtype=np.int64)
+    n_matches[known] = counts[left_codes[known]]
+    n_rows = np.maximum(n_matches, 1) if how == 'left' else n_matches
+    left_pos = np.repeat(np.arange(len(left_codes)), n_rows)
+    # position of every joined row among the matches of its left row
+    offsets = np.arange(len(left_pos)) - \
+        np.repeat(np.cumsum(n_rows) - n_rows, n_rows)
+    matched = np.repeat(n_matches > 0, n_rows)
+    left_starts = np.zeros(len(left_codes), dtype=np.int64)
+    left_starts[known] = starts[left_codes[known]]
+    right_pos = np.full(len(left_pos), -1, dtype=np.int64)
+    right_pos[matched] = right_order[(np.repeat(left_starts, n_rows) +
+                                      offsets)[matched]]
+    return left_pos, right_pos
+
+
+def join_codes(left_codes, right_codes, how='inner'):
+    """
+    Joins two arrays of integer codes.
+    Negative codes never match. The order of the left rows is kept and the
+    matches of every left row follow the order of the right rows.
+
+    Parameters
+    ----------
+    left_codes : numpy.ndarray
+    right_codes : numpy.ndarray
+    how : {'inner', 'left'}
+        type of join; with 'left' unmatched left rows are kept
+
+    Returns
+    -------
+    Left and right row positions of the joined rows, the right position is
+    -1 for the unmatched left rows
+    """
+    return join_grouped(left_codes, group_codes(right_codes), how)
+
+
+def id_ranks(id_index):
+    """
+    Lexicographic ranks of the identifiers of an ID dictionary.
+
+    Parameters
+    ----------
+    id_index : pandas.Index
+
+    Returns
+    -------
+    Numpy array with the rank of every code
+    """
+    ranks = np.empty(len(id_index), dtype=np.int64)
+    ranks[id_index.argsort(kind='stable')] = np.arange(len(id_index))
+    return ranks
+
+
+def is_bins_archive(sample_path):
+    """
+    Checks if the sample path is a MetaBAT2 bin archive (.bins.tar.gz).
+
+    Parameters
+    ----------
+    sample_path: str
+        bin directory or bin archive of a sample
+
+    Returns
+    -------
+    bool
+    """
+    return sample_path.endswith(BINS_ARCHIVE_SUFFIX)
+
+
+def iter_bin_contigs(sample_path, block_size=FASTA_BLOCK_SIZE):
+    """
+    Reads contig IDs of every bin of a sample. Bins are read from
+    a directory of .fa files or streamed out of a .bins.tar.gz archive
+    without extraction.
+
+    Parameters
+    ----------
+    sample_path: str
+        bin directory or bin archive of a sample
+    block_size : int
+        number of bytes decompressed at once from the archive
+
+    Yields
+    ------
+    Bin name and list of its contig IDs
+    """
+    if not is_bins_archive(sample_path):
+        for bin_file in glob.glob(join(sample_path, "*.fa")):
+            bin_name = os.path.splitext(os.path.basename(bin_file))[0]
+            yield bin_name, load_fasta_ids(bin_file).astype(str).tolist()
+        return
+
+    with tarfile.open(sample_path, 'r|gz') as archive:
+        for member in archive:
+            if not (member.isfile() and member.name.endswith('.fa')):
+                continue
+            bin_name = os.path.splitext(os.path.basename(member.name))[0]
+            bin_contigs = _scan_fasta_ids(archive.extractfile(member),
+                                          block_size)
+            yield bin_name, [contig.decode() for contig in bin_contigs]
+
+
 def load_mags_contigs_taxonomies_for_sample(sample_dir, taxonomy_path,
                                             checkm_path):
     """
@@ -65,7 +569,7 @@ def load_mags_contigs_taxonomies_for_sample(sample_dir, taxonomy_path,
     Parameters
     ----------
     sample_dir: str
-        directory where to look for specific sample
+        directory (or .bins.tar.gz archive) where to look for specific sample
     taxonomy_path: str
         path with taxonomy files
     checkm_path: str
@@ -77,7 +581,10 @@ def load_mags_contigs_taxonomies_for_sample(sample_dir, taxonomy_path,
     and CHECKM information
     """
     sample_dir_name = os.path.basename(sample_dir)
-    mag_root = sample_dir_name[:sample_dir_name.rfind("_bins")]
+    if is_bins_archive(sample_dir_name):
+        mag_root = sample_dir_name[:-len(BINS_ARCHIVE_SUFFIX)]
+    else:
+        mag_root = sample_dir_name[:sample_dir_name.rfind("_bins")]
 
     # runs through per-sample Checkm files and creates a dataframe
     checkm_file = join(checkm_path, f"{mag_root}_checkm.txt")
@@ -92,10 +599,8 @@ def load_mags_contigs_taxonomies_for_sample(sample_dir, taxonomy_path,
 
     # Run through all bin .fa files
     mags, bins, contigs = [], [], []
-    for bin_file in glob.glob(join(sample_dir, "*.fa")):
-        bin_name = os.path.splitext(os.path.basename(bin_file))[0]
+    for bin_name, bin_contigs in iter_bin_contigs(sample_dir):
         mag_name = f"{mag_root}_{bin_name}"
-        bin_contigs = load_fasta_ids(bin_file)
         mags.extend([mag_name] * len(bin_contigs))
         bins.extend([bin_name] * len(bin_contigs))
         contigs.extend(bin_contigs)
@@ -125,38 +630,50 @@ def load_mags_contigs_taxonomies_for_sample(sample_dir, taxonomy_path,
     return merged_df
 
 
-def load_mags_contigs_taxonomies(bin_path, taxonomy_path, checkm_path):
+def load_mags_contigs_taxonomies(bin_path, taxonomy_path, checkm_path,
+                                 workers=1):
     """
     # extract MAG, contig, taxonomy and CHECKM information for all samples.
 
     Parameters
     ----------
     bin_path: str
-        path with samples
+        path with sample bin directories or .bins.tar.gz archives
     taxonomy_path: str
         path with taxonomy files
     checkm_path: str
         path with CHECKM files
+    workers: int
+        number of processes loading samples concurrently
 
     Returns
     -------
     Pandas dataframe containing MAGS, contigs and taxonomies
     """
 
-    # Extract all sample directories
-    bin_dirs = [f for f in os.scandir(bin_path) if f.is_dir()]
+    # Extract all sample directories and bin archives
+    bin_dirs = [f.path for f in os.scandir(bin_path)
+                if f.is_dir() or is_bins_archive(f.name)]
+
+    load_sample = partial(load_mags_contigs_taxonomies_for_sample,
+                          taxonomy_path=taxonomy_path,
+                          checkm_path=checkm_path)
+    if workers > 1 and len(bin_dirs) > 1:
+        # samples come back in the order of the directories
+        with ProcessPoolExecutor(min(workers, len(bin_dirs))) as executor:
+            sample_dfs = list(executor.map(load_sample, bin_dirs))
+    else:
+        sample_dfs = [load_sample(bin_dir) for bin_dir in bin_dirs]
 
     # Return concatenated dataframe
-    concatenated_df = pd.concat([load_mags_contigs_taxonomies_for_sample(
-        bin_dir, taxonomy_path, checkm_path)
-        for bin_dir in bin_dirs],
-        ignore_index=True)
+    concatenated_df = pd.concat(sample_dfs, ignore_index=True)
     return concatenated_df
 
 
-def load_eggNOG_file(eggnog_ann_file):
+def read_eggNOG_header(eggnog_ann_file):
     """
-    Load EggNOG annotations skipping commented lines i.e. '#\\s'
+    Fetch column names of EggNOG annotations
+    (header should be somewhere at the beginning)
 
     Parameters
     ----------
@@ -165,18 +682,1084 @@ def load_eggNOG_file(eggnog_ann_file):
 
     Returns
     -------
-    Pandas dataframe
+    List of column names
     """
-    # Fetch header from file (should be somewhere at the beginning)
     header = None
-    with open(eggnog_ann_file, 'r') as f:
+    opener = gzip.open if eggnog_ann_file.endswith('.gz') else open
+    with opener(eggnog_ann_file, 'rt') as f:
         for line in f:
             if line.startswith('#query'):
                 header = line
                 break
-    header = [el.strip() for el in header.split('\t')]
+    return [el.strip() for el in header.split('\t')]
+
+
+def eggNOG_shards(eggnog_ann_file):
+    """
+    Lists shards of EggNOG annotations and checks that they share the
+    header.
+
+    Parameters
+    ----------
+    eggnog_ann_file: str or list of str
+        path to EggNOG annotation file (tsv) or paths to its shards
+
+    Returns
+    -------
+    List of shard paths, list of column names
+    """
+    shards = [eggnog_ann_file] if isinstance(eggnog_ann_file, str) \
+        else list(eggnog_ann_file)
+    header = read_eggNOG_header(shards[0])
+    for shard in shards[1:]:
+        if read_eggNOG_header(shard) != header:
+            raise click.BadParameter(
+                f'header of {shard} differs from header of {shards[0]}',
+                param_hint='--eggnog_ann_file')
+    return shards, header
+
+
+def load_eggNOG_file(eggnog_ann_file):
+    """
+    Load EggNOG annotations skipping commented lines i.e. '#\\s'
+
+    Parameters
+    ----------
+    eggnog_ann_file: str or list of str
+        path to EggNOG annotation file (tsv) or paths to its shards
+
+    Returns
+    -------
+    Pandas dataframe
+    """
+    shards, header = eggNOG_shards(eggnog_ann_file)
     # Create & return Pandas DataFrame
-    return pd.read_csv(eggnog_ann_file, sep='\t', names=header, comment='#')
+    eggNOG_dfs = [pd.read_csv(shard, sep='\t', names=header, comment='#')
+                  for shard in shards]
+    if len(eggNOG_dfs) == 1:
+        return eggNOG_dfs[0]
+    return pd.concat(eggNOG_dfs, ignore_index=True)
+
+
+def iter_eggNOG_file(eggnog_ann_file, chunksize):
+    """
+    Load EggNOG annotations chunk by chunk skipping commented lines.
+    Integer and boolean columns are cast as in `with_missing_dtypes`.
+
+    Parameters
+    ----------
+    eggnog_ann_file: str or list of str
+        path to EggNOG annotation file (tsv) or paths to its shards
+    chunksize: int
+        number of rows per chunk
+
+    Yields
+    ------
+    Pandas dataframe
+    """
+    shards, header = eggNOG_shards(eggnog_ann_file)
+    for shard in shards:
+        with pd.read_csv(shard, sep='\t', names=header, comment='#',
+                         chunksize=chunksize) as reader:
+            for chunk in reader:
+                chunk = with_missing_dtypes(chunk)
+                chunk.index = pd.RangeIndex(len(chunk))
+                yield chunk
+
+
+def with_missing_dtypes(df):
+    """
+    Casts columns to the types they get once missing values are added
+    (integers to floats, booleans to objects), so that a table written in
+    chunks is formatted in the same way in every chunk.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+
+    Returns
+    -------
+    Pandas dataframe
+    """
+    casts = {}
+    for col, dtype in df.dtypes.items():
+        if pd.api.types.is_bool_dtype(dtype):
+            casts[col] = object
+        elif pd.api.types.is_integer_dtype(dtype):
+            casts[col] = np.float64
+    return df.astype(casts) if casts else df
+
+
+def file_fingerprint(path, sample_size=FINGERPRINT_SAMPLE_SIZE):
+    """
+    Fast fingerprint of a file: size, modification time and hash of blocks
+    sampled at its start, middle and end.
+
+    Parameters
+    ----------
+    path : str
+        file
+    sample_size : int
+        number of bytes hashed per sampled block
+
+    Returns
+    -------
+    Hex digest (str)
+    """
+    stat = os.stat(path)
+    digest = hashlib.blake2b(f'{stat.st_size}:{stat.st_mtime_ns}'.encode(),
+                             digest_size=16)
+    with open(path, 'rb') as f:
+        for offset in sorted({0, max(stat.st_size // 2 - sample_size // 2, 0),
+                              max(stat.st_size - sample_size, 0)}):
+            f.seek(offset)
+            digest.update(f.read(sample_size))
+    return digest.hexdigest()
+
+
+def path_fingerprint(path):
+    """
+    Fingerprint of a file or of all files in a directory tree
+    (with their relative paths).
+
+    Parameters
+    ----------
+    path : str
+        file or directory
+
+    Returns
+    -------
+    Hex digest (str)
+    """
+    if not os.path.isdir(path):
+        return file_fingerprint(path)
+    digest = hashlib.blake2b(digest_size=16)
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = join(root, name)
+            digest.update(os.path.relpath(file_path, path).encode())
+            digest.update(file_fingerprint(file_path).encode())
+    return digest.hexdigest()
+
+
+def evict_cache(cache_dir, cache_size, keep=None):
+    """
+    Removes least recently used cache entries until the cache fits its size.
+
+    Parameters
+    ----------
+    cache_dir : str
+        cache directory
+    cache_size : int
+        cache size limit in bytes
+    keep : str
+        entry which is never evicted (the one just written)
+    """
+    entries = sorted((entry.stat().st_mtime_ns, entry.stat().st_size,
+                      entry.path)
+                     for entry in os.scandir(cache_dir)
+                     if entry.name.endswith(CACHE_SUFFIX))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= cache_size:
+            break
+        if path != keep:
+            os.remove(path)
+            total -= size
+
+
+def load_cached(cache_dir, cache_size, stage, input_paths, loader, *args):
+    """
+    Loads a parsed intermediate from the cache or computes and caches it.
+    Entries are keyed by the stage and the fingerprints of its inputs,
+    stored as pickles and evicted in least recently used order.
+
+    Parameters
+    ----------
+    cache_dir : str
+        cache directory, nothing is cached if None
+    cache_size : int
+        cache size limit in bytes
+    stage : str
+        name of the intermediate
+    input_paths : list of str
+        files and directories the intermediate is parsed from
+    loader : callable
+        function parsing the intermediate
+    *args
+        arguments of the loader
+
+    Returns
+    -------
+    Parsed intermediate
+    """
+    if cache_dir is None:
+        return loader(*args)
+
+    digest = hashlib.blake2b(f'{CACHE_VERSION}:{stage}'.encode(),
+                             digest_size=16)
+    for path in input_paths:
+        digest.update(path_fingerprint(path).encode())
+    entry = join(cache_dir, f'{stage}-{digest.hexdigest()}{CACHE_SUFFIX}')
+    try:
+        intermediate = pd.read_pickle(entry)
+        # mark as recently used
+        os.utime(entry)
+        return intermediate
+    except FileNotFoundError:
+        pass
+    except Exception as error:
+        # broken entry or pickle of other pandas/numpy versions, rebuilt
+        print(f'Cache entry {entry} is not readable ({error!r}), rebuilding')
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
+
+    intermediate = loader(*args)
+    os.makedirs(cache_dir, exist_ok=True)
+    # write atomically so that interrupted runs do not leave broken entries
+    pd.to_pickle(intermediate, entry + '.tmp')
+    os.replace(entry + '.tmp', entry)
+    evict_cache(cache_dir, cache_size, keep=entry)
+    return intermediate
+
+
+def map_genes_contigs_mags(cluster_df, genes, contigs, MAGS_df):
+    """
+    Maps genes to clusters, centroids, contigs and MAGs.
+    Genes, clusters and contigs are coded with integers once and all joins
+    are run on the codes.
+
+    Parameters
+    ----------
+    cluster_df : pandas.DataFrame
+        categorical cluster table, output of `tabulate_cluster_info`
+    genes : array-like of str
+        gene catalogue (cluster centroids) IDs
+    contigs : array-like of str
+        contig IDs
+    MAGS_df : pandas.DataFrame
+        MAG table with default index, output of
+        `load_mags_contigs_taxonomies`
+
+    Returns
+    -------
+    Pandas dataframe of integer codes with Cluster_ID, Gene_ID, centroid,
+    Contig_ID and MAG_row (row of `MAGS_df`) columns (-1 for missing values)
+    and dictionary with the ID dictionaries of the coded columns
+    """
+    # ID dictionaries
+    gene_index = cluster_df['Gene_ID'].cat.categories
+    cluster_index = cluster_df['Cluster_ID'].cat.categories
+    contig_codes, contig_index = pd.factorize(np.asarray(contigs,
+                                                         dtype=object))
+    contig_index = pd.Index(contig_index)
+    gene_codes = cluster_df['Gene_ID'].cat.codes.to_numpy()
+    cluster_codes = cluster_df['Cluster_ID'].cat.codes.to_numpy()
+
+    # map cluster and NR genes
+    members, _ = join_codes(gene_codes, encode_ids(genes, gene_index))
+    centroid_clusters = cluster_codes[members]
+    centroids = gene_codes[members]
+
+    # mapped cluster genes
+    rows, centroid_pos = join_codes(cluster_codes, centroid_clusters, 'left')
+    row_genes = gene_codes[rows]
+    row_clusters = cluster_codes[rows]
+    # -1 positions pick the appended -1 code
+    row_centroids = np.append(centroids, -1)[centroid_pos]
+
+    # map cluster genes to contigs through truncated gene IDs
+    gene_contigs = encode_ids([gene.rsplit('_', 1)[0] for gene in gene_index],
+                              contig_index)
+    rows, contig_pos = join_codes(gene_contigs[row_genes], contig_codes,
+                                  'left')
+    row_genes, row_clusters, row_centroids = \
+        row_genes[rows], row_clusters[rows], row_centroids[rows]
+    row_contigs = np.append(contig_codes, -1)[contig_pos]
+
+    # mapping between genes, contigs and mags
+    rows, mag_pos = join_codes(row_contigs,
+                               encode_ids(MAGS_df['contigs'], contig_index),
+                               'left')
+
+    # genes of clusters without centroid in the catalogue are marked
+    # with 'nan' string
+    centroid_index = gene_index if 'nan' in gene_index else \
+        gene_index.append(pd.Index(['nan']))
+    row_centroids = row_centroids[rows]
+    row_centroids[row_centroids < 0] = centroid_index.get_loc('nan')
+
+    coded_df = pd.DataFrame({'Cluster_ID': row_clusters[rows],
+                             'Gene_ID': row_genes[rows],
+                             'centroid': row_centroids,
+                             'Contig_ID': row_contigs[rows],
+                             'MAG_row': mag_pos})
+    id_indexes = {'Cluster_ID': cluster_index,
+                  'Gene_ID': gene_index,
+                  'centroid': centroid_index,
+                  'Contig_ID': contig_index}
+    return coded_df, id_indexes
+
+
+def decode_master_table(coded_df, id_indexes, MAGS_df, eggNOG_df,
+                        eggnog_rows):
+    """
+    Decodes integer-coded gene rows into master table rows.
+
+    Parameters
+    ----------
+    coded_df : pandas.DataFrame
+        coded gene rows, output of `map_genes_contigs_mags`
+    id_indexes : dict
+        ID dictionaries of the coded columns
+    MAGS_df : pandas.DataFrame
+        MAG table with default index
+    eggNOG_df : pandas.DataFrame
+        eggNOG annotations with default index
+    eggnog_rows : numpy.ndarray
+        annotation row of every gene row, -1 for genes without annotation
+
+    Returns
+    -------
+    Pandas dataframe
+    """
+    master_df = pd.DataFrame({
+        col: decode_codes(coded_df[col].to_numpy(), id_index)
+        for col, id_index in id_indexes.items()})
+    mags_cols = MAGS_df.reindex(
+        index=coded_df['MAG_row'].to_numpy(),
+        columns=MAGS_df.columns.drop('contigs')).reset_index(drop=True)
+    eggnog_cols = eggNOG_df.reindex(
+        index=eggnog_rows,
+        columns=eggNOG_df.columns.drop('#query')).reset_index(drop=True)
+    return pd.concat([master_df, mags_cols, eggnog_cols], axis=1)
+
+
+def code_master_table(cluster_df, genes, contigs, MAGS_df, eggNOG_df,
+                      exclude_genes=None):
+    """
+    Maps genes to clusters, contigs, MAGs and eggNOG annotations on integer
+    codes. Rows are ordered by gene ID, annotations of genes missing in
+    the clusters are kept.
+
+    Parameters
+    ----------
+    cluster_df : pandas.DataFrame
+        categorical cluster table, output of `tabulate_cluster_info`
+    genes : array-like of str
+        gene catalogue (cluster centroids) IDs
+    contigs : array-like of str
+        contig IDs
+    MAGS_df : pandas.DataFrame
+        MAG table with default index, output of
+        `load_mags_contigs_taxonomies`
+    eggNOG_df : pandas.DataFrame
+        eggNOG annotations, output of `load_eggNOG_file`
+    exclude_genes : array-like of str
+        genes whose rows are left out (their clusters still give centroids
+        of the other genes)
+
+    Returns
+    -------
+    Coded gene rows and ID dictionaries as in `map_genes_contigs_mags` and
+    annotation row of every gene row (-1 for genes without annotation)
+    """
+    coded_df, id_indexes = map_genes_contigs_mags(cluster_df, genes, contigs,
+                                                  MAGS_df)
+    gene_index = id_indexes['Gene_ID']
+    if exclude_genes is not None:
+        excluded = np.zeros(len(gene_index) + 1, dtype=bool)
+        excluded[encode_ids(exclude_genes, gene_index)] = True
+        excluded[-1] = False
+        coded_df = coded_df[~excluded[coded_df['Gene_ID'].to_numpy()]].\
+            reset_index(drop=True)
+
+    # mapping between genes, contigs, mags and eggNOG annotations
+    query_codes = encode_ids(eggNOG_df['#query'], gene_index)
+    rows, eggnog_rows = join_codes(coded_df['Gene_ID'].to_numpy(),
+                                   query_codes, 'left')
+    orphans = np.flatnonzero(query_codes < 0)
+    coded_df = coded_df.reindex(
+        np.concatenate([rows, np.full(len(orphans), -1)]), fill_value=-1)
+    eggnog_rows = np.concatenate([eggnog_rows, orphans])
+
+    # order rows by gene ID (query ID for annotations without gene),
+    # rows of one gene keep the order of their cluster IDs
+    key_index = gene_index.append(pd.Index(eggNOG_df['#query'].iloc[orphans],
+                                           dtype=object))
+    keys = coded_df['Gene_ID'].to_numpy().astype(np.int64)
+    keys[len(rows):] = np.arange(len(gene_index), len(key_index))
+    cluster_ranks = np.append(id_ranks(id_indexes['Cluster_ID']), 0)
+    order = np.lexsort((cluster_ranks[coded_df['Cluster_ID'].to_numpy()],
+                        id_ranks(key_index)[keys]))
+    return (coded_df.iloc[order].reset_index(drop=True), id_indexes,
+            eggnog_rows[order])
+
+
+def map_genes_contigs_mags_eggNOG(cluster_df, genes, contigs, MAGS_df,
+                                  eggNOG_df, exclude_genes=None):
+    """
+    Maps genes to clusters, contigs, MAGs and eggNOG annotations in memory.
+    Identifiers are decoded in the returned table only. Rows are ordered by
+    gene ID, annotations of genes missing in the clusters are kept.
+
+    Parameters
+    ----------
+    cluster_df : pandas.DataFrame
+        categorical cluster table, output of `tabulate_cluster_info`
+    genes : array-like of str
+        gene catalogue (cluster centroids) IDs
+    contigs : array-like of str
+        contig IDs
+    MAGS_df : pandas.DataFrame
+        MAG table with default index, output of
+        `load_mags_contigs_taxonomies`
+    eggNOG_df : pandas.DataFrame
+        eggNOG annotations, output of `load_eggNOG_file`
+    exclude_genes : array-like of str
+        genes whose rows are left out (their clusters still give centroids
+        of the other genes)
+
+    Returns
+    -------
+    Pandas dataframe (master table)
+    """
+    coded_df, id_indexes, eggnog_rows = code_master_table(
+        cluster_df, genes, contigs, MAGS_df, eggNOG_df, exclude_genes)
+    return decode_master_table(coded_df, id_indexes, MAGS_df, eggNOG_df,
+                               eggnog_rows)
+
+
+def write_split_tables(cluster_df, genes, contigs, MAGS_df, eggNOG_df,
+                       out_path, out_name, output_format='tsv'):
+    """
+    Writes the gene cluster and individual gene tables straight from the
+    coded gene rows, without the master table. Both tables are decoded
+    and written in chunks of rows.
+
+    Parameters
+    ----------
+    cluster_df : pandas.DataFrame
+        categorical cluster table, output of `tabulate_cluster_info`
+    genes : array-like of str
+        gene catalogue (cluster centroids) IDs
+    contigs : array-like of str
+        contig IDs
+    MAGS_df : pandas.DataFrame
+        MAG table with default index, output of
+        `load_mags_contigs_taxonomies`
+    eggNOG_df : pandas.DataFrame
+        eggNOG annotations, output of `load_eggNOG_file`
+    out_path : str
+        path to the output folder
+    out_name : str
+        core output name of the split tables
+    output_format : str
+        'tsv', 'parquet' or 'feather'
+    """
+    coded_df, id_indexes, eggnog_rows = code_master_table(
+        cluster_df, genes, contigs, MAGS_df, eggNOG_df)
+    eggNOG_df = eggNOG_df.rename(columns=lambda col: "_".join(col.split(' ')))
+    # columns are typed as if the whole table was written at once
+    if (eggnog_rows < 0).any():
+        eggNOG_df = with_missing_dtypes(eggNOG_df)
+
+    writers = {}
+    try:
+        # an empty table still gets its header
+        for start in range(0, max(len(coded_df), 1), SPLIT_CHUNK_SIZE):
+            stop = start + SPLIT_CHUNK_SIZE
+            write_split_chunk(coded_df.iloc[start:stop], id_indexes, MAGS_df,
+                              eggNOG_df, eggnog_rows[start:stop], out_path,
+                              out_name, start, output_format, writers)
+    finally:
+        close_table_writers(writers)
+
+
+def write_split_chunk(coded_df, id_indexes, MAGS_df, eggNOG_df, eggnog_rows,
+                      out_path, out_name, n_written=0, output_format='tsv',
+                      writers=None):
+    """
+    Writes coded gene rows to the gene cluster and individual gene tables.
+    Only the columns of each table are decoded.
+
+    Parameters
+    ----------
+    coded_df : pandas.DataFrame
+        coded gene rows, output of `map_genes_contigs_mags`
+    id_indexes : dict
+        ID dictionaries of the coded columns
+    MAGS_df : pandas.DataFrame
+        MAG table with default index
+    eggNOG_df : pandas.DataFrame
+        eggNOG annotations with default index and underscores instead of
+        spaces in column names
+    eggnog_rows : numpy.ndarray
+        annotation row of every gene row, -1 for genes without annotation
+    out_path : str
+        path to the output folder
+    out_name : str
+        core output name of the split tables
+    n_written : int
+        number of rows already written, the chunk is appended if positive
+    output_format : str
+        'tsv', 'parquet' or 'feather'
+    writers : dict
+        open columnar writers by path, the tables are written at once if None
+
+    Returns
+    -------
+    Number of rows written including the chunk
+    """
+    gene_cluster_path, mapped_genes_path, _ = split_table_paths(
+        out_path, out_name, output_format)
+    index = pd.RangeIndex(n_written, n_written + len(coded_df))
+
+    def decoded(cols):
+        return pd.DataFrame({col: decode_codes(coded_df[col].to_numpy(),
+                                               id_indexes[col])
+                             for col in cols}, index=index)
+
+    # individual gene table
+    genes_df = decoded(['Cluster_ID', 'Gene_ID', 'Contig_ID'])
+    genes_df['MAG_ID'] = MAGS_df['MAG_ID'].reindex(
+        coded_df['MAG_row'].to_numpy()).to_numpy()
+    write_table(genes_df[GENE_TABLE_COLS], mapped_genes_path, output_format,
+                n_written, writers)
+    del genes_df
+
+    # gene cluster table
+    missing = pd.Index(GENE_CLUSTER_COLS[2:]).difference(eggNOG_df.columns)
+    if len(missing):
+        raise KeyError(f"{list(missing)} not in eggNOG annotations")
+    annotations = eggNOG_df.reindex(index=eggnog_rows,
+                                    columns=GENE_CLUSTER_COLS[2:])
+    annotations.index = index
+    write_table(pd.concat([decoded(GENE_CLUSTER_COLS[:2]), annotations],
+                          axis=1),
+                gene_cluster_path, output_format, n_written, writers)
+    return n_written + len(coded_df)
+
+
+def write_master_table_chunked(cluster_df, genes, contigs, MAGS_df,
+                               eggnog_ann_file, memory_budget, out_path,
+                               out_name, split_output, output_format='tsv'):
+    """
+    Maps genes to clusters, contigs, MAGs and eggNOG annotations within
+    a memory budget.
+    Only integer-coded gene rows and ID dictionaries are kept in memory,
+    eggNOG annotations are streamed in chunks and every chunk of the master
+    table is written to disk right away. Rows of the annotated genes follow
+    the order of the annotations, rows of genes without annotations are
+    written at the end.
+
+    Parameters
+    ----------
+    cluster_df : pandas.DataFrame
+        categorical cluster table, output of `tabulate_cluster_info`
+    genes : array-like of str
+        gene catalogue (cluster centroids) IDs
+    contigs : array-like of str
+        contig IDs
+    MAGS_df : pandas.DataFrame
+        MAG table with default index, output of
+        `load_mags_contigs_taxonomies`
+    eggnog_ann_file : str or list of str
+        path to EggNOG annotation file (tsv) or paths to its shards
+    memory_budget : int
+        memory budget in bytes
+    out_path : str
+        path to the output folder
+    out_name : str
+        output name of the master table or core name of the split tables
+    split_output : bool
+        write split tables instead of the master table
+    output_format : str
+        'tsv', 'parquet' or 'feather'
+    """
+    coded_df, id_indexes = map_genes_contigs_mags(cluster_df, genes, contigs,
+                                                  MAGS_df)
+    gene_index = id_indexes['Gene_ID']
+    gene_rows = group_codes(coded_df['Gene_ID'].to_numpy())
+    annotated = np.zeros(len(gene_index), dtype=bool)
+    # format of the columns has to be the same in every chunk
+    MAGS_df = with_missing_dtypes(MAGS_df)
+
+    # size the chunks from the memory left by the resident tables
+    resident = coded_df.memory_usage().sum() + \
+        MAGS_df.memory_usage(deep=True).sum() + \
+        sum(id_index.memory_usage(deep=True)
+            for id_index in id_indexes.values())
+    chunk_budget = max(memory_budget - resident, MIN_CHUNK_BUDGET)
+    if memory_budget - resident < MIN_CHUNK_BUDGET:
+        print(f'Resident tables take {resident // 2**20} MB, '
+              f'writing chunks of {MIN_CHUNK_BUDGET // 2**20} MB')
+    sample_chunks = iter_eggNOG_file(eggnog_ann_file, SAMPLE_CHUNK_SIZE)
+    sample = next(sample_chunks, None)
+    sample_chunks.close()
+    if sample is None:
+        eggnog_template = pd.DataFrame(
+            columns=eggNOG_shards(eggnog_ann_file)[1])
+        row_bytes = 1
+    else:
+        eggnog_template = sample.iloc[:0]
+        row_bytes = max(sample.memory_usage(deep=True).sum() /
+                        max(len(sample), 1), 1)
+    chunksize = max(int(chunk_budget / (CHUNK_MEMORY_FACTOR * row_bytes)), 1)
+
+    writers = {}
+
+    def write_chunk(coded_chunk, eggnog_chunk, eggnog_rows, n_written):
+        if split_output:
+            return write_split_chunk(
+                coded_chunk, id_indexes, MAGS_df,
+                eggnog_chunk.rename(
+                    columns=lambda col: "_".join(col.split(' '))),
+                eggnog_rows, out_path, out_name, n_written, output_format,
+                writers)
+        master_df = decode_master_table(coded_chunk, id_indexes, MAGS_df,
+                                        eggnog_chunk, eggnog_rows)
+        return write_master_table(master_df, out_path, out_name, False,
+                                  n_written, output_format, writers)
+    n_written = 0
+    try:
+        for chunk in iter_eggNOG_file(eggnog_ann_file, chunksize):
+            query_codes = encode_ids(chunk['#query'], gene_index)
+            annotated[query_codes[query_codes >= 0]] = True
+            # annotations of genes missing in the clusters are kept
+            eggnog_rows, rows = join_grouped(query_codes, gene_rows, 'left')
+            n_written = write_chunk(coded_df.reindex(rows, fill_value=-1),
+                                    chunk, eggnog_rows, n_written)
+
+        # genes without annotations
+        for start in range(0, len(coded_df), chunksize):
+            coded_chunk = coded_df.iloc[start:start + chunksize]
+            coded_chunk = coded_chunk[
+                ~annotated[coded_chunk['Gene_ID'].to_numpy()]]
+            n_written = write_chunk(coded_chunk.reset_index(drop=True),
+                                    eggnog_template,
+                                    np.full(len(coded_chunk), -1), n_written)
+
+        if n_written == 0:
+            write_chunk(coded_df.iloc[:0], eggnog_template,
+                        np.empty(0, dtype=np.int64), n_written)
+    finally:
+        close_table_writers(writers)
+
+
+def read_table(path, columns=None):
+    """
+    Reads a table written by `write_table` in the format given by its
+    extension.
+
+    Parameters
+    ----------
+    path : str
+        .tsv, .parquet or .feather file
+    columns : list of str
+        columns to load, all if None
+
+    Returns
+    -------
+    Pandas dataframe
+    """
+    if path.endswith(OUTPUT_EXTENSIONS['parquet']):
+        return pd.read_parquet(path, columns=columns)
+    if path.endswith(OUTPUT_EXTENSIONS['feather']):
+        return pd.read_feather(path, columns=columns)
+    if columns is None:
+        return pd.read_csv(path, sep='\t', index_col=0)
+    return pd.read_csv(path, sep='\t', usecols=columns)
+
+
+def iter_table_chunks(path, chunksize):
+    """
+    Reads a table written by `write_table` chunk by chunk. Values of .tsv
+    tables are kept as written (strings), so that rewritten rows do not
+    change.
+
+    Parameters
+    ----------
+    path : str
+        .tsv, .parquet or .feather file
+    chunksize : int
+        number of rows per chunk
+
+    Yields
+    ------
+    Pandas dataframe
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if path.endswith(OUTPUT_EXTENSIONS['parquet']):
+        for batch in pq.ParquetFile(path).iter_batches(chunksize):
+            yield batch.to_pandas()
+    elif path.endswith(OUTPUT_EXTENSIONS['feather']):
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i).to_pandas()
+    else:
+        with pd.read_csv(path, sep='\t', index_col=0, dtype=str,
+                         keep_default_na=False,
+                         chunksize=chunksize) as reader:
+            yield from reader
+
+
+def table_format(path):
+    """
+    Output format of a table given by its extension.
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    'tsv', 'parquet' or 'feather', None for other extensions
+    """
+    for output_format, extension in OUTPUT_EXTENSIONS.items():
+        if path.endswith(extension):
+            return output_format
+    return None
+
+
+def is_orphan_row(df):
+    """
+    Tells which master table rows are eggNOG annotations without gene, also
+    in .tsv chunks read as strings.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+
+    Returns
+    -------
+    Boolean series
+    """
+    return df['Gene_ID'].isna() | (df['Gene_ID'] == 'NaN')
+
+
+def row_keys(df):
+    """
+    Hashes of table rows, equal for rows read back the same way.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+
+    Returns
+    -------
+    numpy.ndarray of uint64
+    """
+    # missing values are NaN, None or 'NaN' depending on the format
+    df = df.astype(object).where(df.notna(), 'NaN')
+    return pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy()
+
+def update_master_table(cluster_df, genes, contigs, MAGS_df, eggNOG_df,
+                        previous_table, out_path, out_name,
+                        output_format='tsv'):
+    """
+    Updates a master table with new samples.
+    Rows of genes missing in the previous table are built from the contigs,
+    MAGs and annotations of the new samples and appended. Rows of previous
+    genes with new eggNOG annotations are patched and moved to the end,
+    all other rows are copied unchanged. Annotations without gene already in
+    the previous table are not appended again. Cluster IDs of previous genes
+    are expected to stay the same. The output may replace the previous
+    table.
+
+    Parameters
+    ----------
+    cluster_df : pandas.DataFrame
+        categorical cluster table of all genes, output of
+        `tabulate_cluster_info`
+    genes : array-like of str
+        gene catalogue (cluster centroids) IDs
+    contigs : array-like of str
+        contig IDs of the new samples
+    MAGS_df : pandas.DataFrame
+        MAG table of the new samples, output of
+        `load_mags_contigs_taxonomies`
+    eggNOG_df : pandas.DataFrame
+        eggNOG annotations of new or re-annotated genes, output of
+        `load_eggNOG_file`
+    previous_table : str
+        master table written before (in the output format)
+    out_path : str
+        path to the output folder
+    out_name : str
+        output name of the master table
+    output_format : str
+        'tsv', 'parquet' or 'feather'
+    """
+    previous_genes = read_table(previous_table, ['Gene_ID'])['Gene_ID']
+    previous_genes = pd.Index(previous_genes.dropna().unique())
+
+    # annotations of previous genes patch their rows
+    eggNOG_df = eggNOG_df.rename(
+        columns=lambda col: "_".join(col.split(' ')))
+    is_patch = eggNOG_df['#query'].isin(previous_genes).to_numpy()
+    patches = eggNOG_df[is_patch].reset_index(drop=True)
+    new_df = map_genes_contigs_mags_eggNOG(
+        cluster_df, genes, contigs, MAGS_df,
+        eggNOG_df[~is_patch].reset_index(drop=True), previous_genes)
+    new_df = new_df.rename(columns=lambda col: "_".join(col.split(' ')))
+
+    writers = {}
+    out_file = join(out_path, out_name + OUTPUT_EXTENSIONS[output_format])
+    # written aside and moved at the end, so that the previous table can
+    # be updated in place
+    tmp_file = join(out_path, f'.{out_name}.tmp{OUTPUT_EXTENSIONS[output_format]}')
+    n_written = 0
+    patched = []
+    previous_orphans = set()
+    columns = new_df.columns
+    try:
+        for chunk in iter_table_chunks(previous_table, UPDATE_CHUNK_SIZE):
+            columns = chunk.columns
+            previous_orphans.update(row_keys(chunk[is_orphan_row(chunk)]))
+            is_patched = chunk['Gene_ID'].isin(patches['#query']).to_numpy()
+            patched.append(chunk[is_patched])
+            chunk = chunk[~is_patched]
+            chunk.index = pd.RangeIndex(n_written, n_written + len(chunk))
+            write_table(chunk, tmp_file, output_format, n_written, writers)
+            n_written += len(chunk)
+
+        # previous rows with new annotations
+        patched = pd.concat(patched, ignore_index=True)
+        annotation_cols = patches.columns.drop('#query')
+        patched = patched.drop(columns=annotation_cols).merge(
+            patches, left_on='Gene_ID', right_on='#query').\
+            reindex(columns=columns)
+        # annotations without gene already in the previous table
+        new_df = new_df.reindex(columns=columns)
+        is_orphan = is_orphan_row(new_df).to_numpy()
+        if previous_orphans and is_orphan.any():
+            # compared as written to the output format
+            orphan_file = join(out_path, f'.{out_name}.orphans'
+                                         f'{OUTPUT_EXTENSIONS[output_format]}')
+            write_table(new_df[is_orphan], orphan_file, output_format)
+            orphans = pd.concat(iter_table_chunks(orphan_file,
+                                                  UPDATE_CHUNK_SIZE))
+            os.remove(orphan_file)
+            is_duplicate = np.zeros(len(new_df), dtype=bool)
+            is_duplicate[is_orphan] = np.isin(row_keys(orphans),
+                                              list(previous_orphans))
+            new_df = new_df[~is_duplicate]
+        for updated in [patched, new_df]:
+            updated.index = pd.RangeIndex(n_written,
+                                          n_written + len(updated))
+            write_table(updated, tmp_file, output_format, n_written, writers)
+            n_written += len(updated)
+        close_table_writers(writers)
+        os.replace(tmp_file, out_file)
+    finally:
+        close_table_writers(writers)
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def split_table_paths(out_path, out_name, output_format='tsv'):
+    """
+    Paths of the split output tables.
+
+    Parameters
+    ----------
+    out_path : str
+        path to the output folder
+    out_name : str
+        core output name
+    output_format : str
+        'tsv', 'parquet' or 'feather'
+
+    Returns
+    -------
+    Paths of the gene cluster table, individual gene table and MAG table
+    """
+    return [join(out_path, "_".join([out_name, x]) +
+                 OUTPUT_EXTENSIONS[output_format])
+            for x in ["mapped_genes_cluster", "individual_mapped_genes",
+                      "MAGS"]]
+
+
+def to_arrow_table(df, schema=None):
+    """
+    Converts a table to Arrow without its index. Columns without any value
+    are typed as strings unless a schema is given (missing annotations of
+    a chunk are parsed as floats).
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+    schema : pyarrow.Schema
+        schema the table is cast to (schema of the first chunk)
+
+    Returns
+    -------
+    pyarrow.Table
+    """
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if schema is None:
+        schema = pa.schema([
+            pa.field(field.name, pa.string())
+            if len(column) and column.null_count == len(column) or
+            pa.types.is_null(field.type) else field
+            for field, column in zip(table.schema, table.columns)])
+    return table.cast(schema)
+
+
+def open_table_writer(path, schema, output_format):
+    """
+    Opens a writer of a columnar table written in chunks. Parquet files are
+    dictionary-encoded and compressed by row groups, Feather files are
+    compressed Arrow IPC files.
+
+    Parameters
+    ----------
+    path : str
+        output file
+    schema : pyarrow.Schema
+    output_format : str
+        'parquet' or 'feather'
+
+    Returns
+    -------
+    pyarrow.parquet.ParquetWriter or pyarrow.ipc.RecordBatchFileWriter
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if output_format == 'parquet':
+        return pq.ParquetWriter(path, schema, use_dictionary=True,
+                                compression=COLUMNAR_COMPRESSION)
+    return pa.ipc.new_file(path, schema, options=pa.ipc.IpcWriteOptions(
+        compression=COLUMNAR_COMPRESSION))
+
+
+def write_table(df, path, output_format='tsv', n_written=0, writers=None):
+    """
+    Writes a table or appends its chunk to the output file.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        table or its chunk
+    path : str
+        output file
+    output_format : str
+        'tsv', 'parquet' or 'feather'
+    n_written : int
+        number of rows already written, the chunk is appended if positive
+    writers : dict
+        open columnar writers by path, the table is written at once if None
+    """
+    if output_format == 'tsv':
+        mode, header = ('a', False) if n_written else ('w', True)
+        df.to_csv(path, sep='\t', na_rep='NaN', mode=mode, header=header)
+        return
+
+    if writers is None:
+        writers = {}
+        write_table(df, path, output_format, writers=writers)
+        close_table_writers(writers)
+        return
+    if path not in writers:
+        table = to_arrow_table(df)
+        writers[path] = (open_table_writer(path, table.schema, output_format),
+                         table.schema)
+    else:
+        table = to_arrow_table(df, writers[path][1])
+    writer = writers[path][0]
+    if output_format == 'parquet':
+        writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+    else:
+        writer.write_table(table)
+
+
+def close_table_writers(writers):
+    """
+    Closes columnar writers opened by `write_table`.
+
+    Parameters
+    ----------
+    writers : dict
+        open columnar writers by path
+    """
+    for writer, _ in writers.values():
+        writer.close()
+    writers.clear()
+
+
+def write_master_table(master_df, out_path, out_name, split_output,
+                       n_written=0, output_format='tsv', writers=None):
+    """
+    Writes the master table or the gene cluster and individual gene tables
+    split from it. Spaces in column names are replaced with underscores.
+
+    Parameters
+    ----------
+    master_df : pandas.DataFrame
+        master table or its chunk
+    out_path : str
+        path to the output folder
+    out_name : str
+        output name of the master table or core name of the split tables
+    split_output : bool
+        write split tables instead of the master table
+    n_written : int
+        number of rows already written, the chunk is appended if positive
+    output_format : str
+        'tsv', 'parquet' or 'feather'
+    writers : dict
+        open columnar writers by path, the table is written at once if None
+
+    Returns
+    -------
+    Number of rows written including the chunk
+    """
+    master_df = master_df.rename(columns=lambda col: "_".join(col.split(' ')))
+    master_df.index = pd.RangeIndex(n_written, n_written + len(master_df))
+    if split_output:
+        gene_cluster_path, mapped_genes_path, _ = split_table_paths(
+            out_path, out_name, output_format)
+        write_table(master_df[GENE_CLUSTER_COLS], gene_cluster_path,
+                    output_format, n_written, writers)
+        write_table(master_df[GENE_TABLE_COLS], mapped_genes_path,
+                    output_format, n_written, writers)
+    else:
+        write_table(master_df,
+                    join(out_path, out_name + OUTPUT_EXTENSIONS[output_format]),
+                    output_format, n_written, writers)
+    return n_written + len(master_df)
+
+
+def write_mags_table(MAGS_df, out_path, out_name, output_format='tsv'):
+    """
+    Writes MAG table of the split output sorted by MAG ID.
+
+    Parameters
+    ----------
+    MAGS_df : pandas.DataFrame
+        MAG table, output of `load_mags_contigs_taxonomies`
+    out_path : str
+        path to the output folder
+    out_name : str
+        core output name of the split tables
+    output_format : str
+        'tsv', 'parquet' or 'feather'
+    """
+    # Drop unnecessary columns and sort by MAG ID column
+    MAGS_df = MAGS_df.drop(columns=['Bin_ID', 'contigs']).\
+        sort_values('MAG_ID').reset_index(drop=True)
+    write_table(MAGS_df, split_table_paths(out_path, out_name,
+                                           output_format)[2], output_format)
 
 
 @click.command()
@@ -191,16 +1774,18 @@ def load_eggNOG_file(eggnog_ann_file):
               help='Input path to merged contigs fasta file.')
 @click.option('--bin_fp', '-b', required=True,
               type=click.Path(resolve_path=True, readable=True, exists=True),
-              help='Input path to bin folder.')
+              help='Input path to bin folder (sample bin folders or '
+                   '.bins.tar.gz archives).')
 @click.option('--tax_fp', '-t', required=True,
               type=click.Path(resolve_path=True, readable=True, exists=True),
               help='Input path to taxonomy folder (can be empty).')
 @click.option('--checkm_fp', '-m', required=True,
               type=click.Path(resolve_path=True, readable=True, exists=True),
               help='Input path to checkm folder  (can be empty).')
-@click.option('--eggnog_ann_file', '-e', required=True,
+@click.option('--eggnog_ann_file', '-e', required=True, multiple=True,
               type=click.Path(resolve_path=True, readable=True, exists=True),
-              help='Input path to eggnog .annotations file.')
+              help='Input path to eggnog .annotations file. Repeated for '
+                   'shards of the annotations (with the same header).')
 @click.option('--split-output', '-s', is_flag=True, default=False,
               help='Split master table into three tables: gene cluster table, '
                    'individual gene table, MAG table.')
@@ -210,9 +1795,35 @@ def load_eggNOG_file(eggnog_ann_file):
 @click.option('--out_name', '-o', required=True,
               help='Output name for master table or core output name for three'
                    ' output tables.')
+@click.option('--output-format', type=click.Choice(list(OUTPUT_EXTENSIONS)),
+              default='tsv', show_default=True,
+              help='Format of the output tables. Parquet files are '
+                   'dictionary-encoded and compressed by row groups, Feather '
+                   'files are compressed.')
+@click.option('--workers', type=click.IntRange(min=1), default=1,
+              show_default=True,
+              help='Number of processes loading MAG samples concurrently.')
+@click.option('--memory_budget', type=click.IntRange(min=1), default=None,
+              help='Memory budget in MB. If set, eggNOG annotations are '
+                   'streamed and the table is written in chunks (rows of '
+                   'genes without annotations come last).')
+@click.option('--previous_table', default=None,
+              type=click.Path(resolve_path=True, readable=True, exists=True),
+              help='Master table to update with new samples: only contigs, '
+                   'bins and annotations of the new samples are given, '
+                   'rows of the previous samples are copied.')
+@click.option('--cache_dir', default=None,
+              type=click.Path(resolve_path=True, file_okay=False),
+              help='Directory caching parsed clusters, fasta IDs and MAG '
+                   'tables between runs.')
+@click.option('--cache_size', type=click.IntRange(min=0), default=10240,
+              show_default=True,
+              help='Cache size limit in MB, least recently used entries '
+                   'are evicted.')
 def _perform_mapping(cluster_file, genes_file, contigs_file,
                      eggnog_ann_file, bin_fp, tax_fp, checkm_fp, split_output,
-                     out_path, out_name):
+                     out_path, out_name, output_format, workers,
+                     memory_budget, previous_table, cache_dir, cache_size):
     """
     Script for mapping genes to contigs, MAGS and eggNOG annotations
 
@@ -222,7 +1833,7 @@ def _perform_mapping(cluster_file, genes_file, contigs_file,
     3) Contig files (fasta)
     4) binned contigs (MAGS)
     5) taxonomy files (tsv)
-    6) EggNOG annotation file (tsv)
+    6) EggNOG annotation file (tsv) or its shards
     7) (optional) Split the output table into three tables:
         a) Gene cluster table
         b) Individual gene table
@@ -233,104 +1844,65 @@ def _perform_mapping(cluster_file, genes_file, contigs_file,
        - if equal `table` and --split-output is False we would get
         `table_mapped_genes_cluster.tsv`, `table_individual_mapped_genes.tsv`,
         `table_MAGS.tsv`
+    10) (optional) Output format: tsv, parquet or feather
+    11) (optional) Number of processes loading MAG samples
+    12) (optional) Memory budget in MB for chunked table construction
+    13) (optional) Previous master table updated with new samples
+    14) (optional) Cache directory of parsed inputs and its size limit in MB
     """
 
-    # load cluster file
-    cluster_df = tabulate_cluster_info(cluster_file)
+    if previous_table is not None:
+        if split_output or memory_budget is not None:
+            raise click.UsageError('--previous_table cannot be combined with '
+                                   '--split-output or --memory_budget.')
+        if table_format(previous_table) != output_format:
+            raise click.UsageError('--previous_table has to be written in '
+                                   'the output format.')
 
-    # load contig and gene IDs
-    contigs = load_fasta_ids(contigs_file)
-    genes = load_fasta_ids(genes_file)
+    cache = partial(load_cached, cache_dir, cache_size * 2**20)
 
-    # create gene catalogue dataframe
-    genes_df = pd.DataFrame({'centroid': genes})
-    genes_df = genes_df.astype(str)
-
-    # create contigs dataframe
-    contigs_df = pd.DataFrame({'Contig_ID': contigs})
-    contigs_df = contigs_df.astype(str)
-
-    # map cluster and NR genes
-    mapped_centroid_genes = pd.merge(cluster_df, genes_df,
-                                     left_on='Gene_ID',
-                                     right_on='centroid',
-                                     how='inner')[['Cluster_ID', 'centroid']]
-
-    # mapped cluster genes
-    mapped_cluster_genes = pd.merge(cluster_df, mapped_centroid_genes,
-                                    left_on='Cluster_ID',
-                                    right_on='Cluster_ID',
-                                    how='outer')
-
-    # create column with truncated gene ids
-    mapped_cluster_genes['Gene_trunc'] = mapped_cluster_genes['Gene_ID']. \
-        apply(lambda x: x.rsplit('_', 1)[0])
-
-    # change data type to string
-    mapped_cluster_genes = mapped_cluster_genes.astype(str)
+    # load cluster file
+    cluster_df = cache('clusters', [cluster_file], tabulate_cluster_info,
+                       cluster_file)
 
-    # map cluster genes to contigs
-    mapped_genes_contigs = pd.merge(mapped_cluster_genes, contigs_df,
-                                    left_on='Gene_trunc',
-                                    right_on='Contig_ID',
-                                    how='left')
+    # load contig and gene IDs
+    contigs = cache('contigs', [contigs_file], load_fasta_ids,
+                    contigs_file).astype(str)
+    genes = cache('genes', [genes_file], load_fasta_ids,
+                  genes_file).astype(str)
 
     # MAGS and Taxonomy mapping
-    MAGS_df = load_mags_contigs_taxonomies(bin_fp, tax_fp, checkm_fp)
-
-    # mapping between genes, contigs and mags
-    mapped_genes_contigs_mags = pd.merge(mapped_genes_contigs, MAGS_df,
-                                         left_on='Contig_ID',
-                                         right_on='contigs',
-                                         how='outer')
-
-    # remove partial genes
-    mapped_genes_contigs_mags = mapped_genes_contigs_mags[
-        mapped_genes_contigs_mags['Gene_ID'].notna()]
+    MAGS_df = cache('mags', [bin_fp, tax_fp, checkm_fp],
+                    load_mags_contigs_taxonomies, bin_fp, tax_fp, checkm_fp,
+                    workers)
 
-    # create eggNOG annotation dataframe
-    eggNOG_df = load_eggNOG_file(eggnog_ann_file)
+    if previous_table is not None:
+        update_master_table(cluster_df, genes, contigs, MAGS_df,
+                            load_eggNOG_file(eggnog_ann_file), previous_table,
+                            out_path, out_name, output_format)
+    elif memory_budget is None:
+        # create eggNOG annotation dataframe
+        eggNOG_df = load_eggNOG_file(eggnog_ann_file)
 
-    # mapping between genes, contigs, mags and eggNOG annotations
-    mapped_genes_contigs_mags_eggNOG = pd.merge(mapped_genes_contigs_mags,
-                                                eggNOG_df,
-                                                left_on='Gene_ID',
-                                                right_on='#query',
-                                                how='outer')
-
-    # drop unused columns and replace spaces with tabs in the rest
-    mapped_genes_contigs_mags_eggNOG.\
-        drop(columns=["Gene_trunc", "contigs", "#query"], inplace=True)
-    old_cols = mapped_genes_contigs_mags_eggNOG.columns
-    new_cols = ["_".join(col.split(' ')) for col in old_cols]
-    mapped_genes_contigs_mags_eggNOG.rename(dict(zip(old_cols, new_cols)),
-                                            axis=1, inplace=True)
+        if split_output:
+            # split tables are written without the master table
+            write_split_tables(cluster_df, genes, contigs, MAGS_df,
+                               eggNOG_df, out_path, out_name, output_format)
+        else:
+            # mapping between genes, contigs, mags and eggNOG annotations
+            mapped_genes_contigs_mags_eggNOG = map_genes_contigs_mags_eggNOG(
+                cluster_df, genes, contigs, MAGS_df, eggNOG_df)
+            write_master_table(mapped_genes_contigs_mags_eggNOG, out_path,
+                               out_name, split_output,
+                               output_format=output_format)
+    else:
+        write_master_table_chunked(cluster_df, genes, contigs, MAGS_df,
+                                   eggnog_ann_file, memory_budget * 2**20,
+                                   out_path, out_name, split_output,
+                                   output_format)
 
     if split_output:
-        # split master table into three and save results
-        gene_clust_cols = ['Cluster_ID', 'centroid', 'seed_ortholog',
-                           'evalue', 'score',
-                           'max_annot_lvl', 'Preferred_name', 'GOs', 'EC',
-                           'KEGG_ko', 'KEGG_Pathway', 'KEGG_Module',
-                           'KEGG_Reaction', 'KEGG_rclass', 'BRITE', 'KEGG_TC',
-                           'CAZy', 'BiGG_Reaction', 'PFAMs',
-                           'eggNOG_OGs', 
-                           'COG_category', 'Description']
-        gene_table_cols = ['Cluster_ID', 'Gene_ID', 'Contig_ID', 'MAG_ID']
-        gene_cluster_filname, mapped_genes_filename, mags_filename = \
-            ["_".join([out_name, x]) for x in ["mapped_genes_cluster", "individual_mapped_genes", "MAGS"]]
-        mapped_genes_contigs_mags_eggNOG[gene_clust_cols].to_csv(os.path.join(out_path,
-            gene_cluster_filname + ".tsv"), sep='\t', na_rep='NaN')
-        mapped_genes_contigs_mags_eggNOG[gene_table_cols].to_csv(join(out_path,
-            mapped_genes_filename + ".tsv"), sep='\t', na_rep='NaN')
-        # Drop unnecessary columns and sort by MAG ID column
-        MAGS_df = MAGS_df.drop(columns=['Bin_ID', 'contigs']).\
-            sort_values('MAG_ID').reset_index(drop=True)
-        MAGS_df.to_csv(join(out_path, mags_filename + ".tsv"), sep='\t',
-                       na_rep='NaN')
-    else:
-        mapped_genes_contigs_mags_eggNOG.to_csv(join(out_path,
-            f'{out_name}.tsv'), sep='\t', na_rep='NaN')
+        write_mags_table(MAGS_df, out_path, out_name, output_format)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,218 @@
+#! /usr/bin/env python
+
+import os
+import gzip
+import io
+import click
+import pandas as pd
+
+# number of bytes copied from a shard at once
+MERGE_BLOCK_SIZE = 1 << 24
+# separators of the sharded tables
+SHARD_SEPARATORS = {'eggnog': '\t', 'deepfri': ','}
+# columns of DeepFRI predictions without header
+DEEPFRI_COLUMNS = ['Protein', 'GO_term', 'model', 'Score', 'name']
+# compression codec of the columnar outputs
+COLUMNAR_COMPRESSION = 'zstd'
+
+
+def is_deepfri_row(line):
+    """
+    Tells whether a line of DeepFRI predictions is a data row, i.e. its
+    score (4th field) is a number.
+
+    Parameters
+    ----------
+    line : bytes
+
+    Returns
+    -------
+    bool
+    """
+    fields = line.split(b',', 4)
+    try:
+        float(fields[3])
+    except (IndexError, ValueError):
+        return False
+    return True
+
+
+def is_header(line, kind):
+    """
+    Tells whether a line is the header of a shard of the given kind:
+    '#query' line of eggNOG annotations, first line of DeepFRI predictions
+    not commented out and without a numeric score.
+
+    Parameters
+    ----------
+    line : bytes
+    kind : str
+        'eggnog' or 'deepfri'
+
+    Returns
+    -------
+    bool
+    """
+    if kind == 'eggnog':
+        return line.startswith(b'#query')
+    return not line.startswith(b'#') and not is_deepfri_row(line)
+
+
+def read_shard_header(path, kind):
+    """
+    Reads the header line of a shard, skipping comment lines before it.
+    DeepFRI predictions may come without header.
+
+    Parameters
+    ----------
+    path : str
+    kind : str
+        'eggnog' or 'deepfri'
+
+    Returns
+    -------
+    Header line (bytes, None without header), offset of the first line
+    after the header
+    """
+    with open(path, 'rb') as f:
+        offset = 0
+        for line in iter(f.readline, b''):
+            if is_header(line, kind):
+                return line.rstrip(b'\r\n'), f.tell()
+            if kind == 'deepfri' and not line.startswith(b'#'):
+                return None, offset
+            offset = f.tell()
+        if kind == 'deepfri':
+            return None, offset
+    raise click.BadParameter(f'{path} has no header',
+                             param_hint='--input_file')
+
+
+def iter_shard_data(path, offset, block_size=MERGE_BLOCK_SIZE):
+    """
+    Reads data lines of a shard in large blocks of whole lines, dropping
+    comment lines (eggNOG '##' blocks).
+
+    Parameters
+    ----------
+    path : str
+    offset : int
+        offset of the first data line
+    block_size : int
+        number of bytes read at once
+
+    Yields
+    ------
+    bytes of data lines ending with a newline
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        rest = b''
+        for block in iter(lambda: f.read(block_size), b''):
+            block = rest + block
+            end = block.rfind(b'\n') + 1
+            block, rest = block[:end], block[end:]
+            # blocks without comments are copied as they are
+            if block.startswith(b'#') or b'\n#' in block:
+                block = b''.join(line for line in block.splitlines(True)
+                                 if not line.startswith(b'#'))
+            if block:
+                yield block
+        if rest and not rest.startswith(b'#'):
+            yield rest + b'\n'
+
+
+def merge_shards(paths, out_file, kind, output_format='plain'):
+    """
+    Merges shards of eggNOG annotations or DeepFRI predictions into one
+    table with a single header. All shards have to share the header,
+    DeepFRI shards may also all come without header.
+
+    Parameters
+    ----------
+    paths : list of str
+        shards in the merge order
+    out_file : str
+    kind : str
+        'eggnog' or 'deepfri'
+    output_format : str
+        'plain', 'gzip' (text files), 'parquet' or 'feather' (all columns
+        as strings)
+    """
+    headers = [read_shard_header(path, kind) for path in paths]
+    # shards without data lines do not need the header
+    shards = [(path, shard_header) for path, (shard_header, offset)
+              in zip(paths, headers) if shard_header is not None or
+              offset < os.path.getsize(path)]
+    header = shards[0][1] if shards else headers[0][0]
+    for path, shard_header in shards:
+        if shard_header != header:
+            raise click.BadParameter(
+                f'header of {path} differs from header of {shards[0][0]}',
+                param_hint='--input_file')
+
+    if output_format in ['plain', 'gzip']:
+        opener = gzip.open if output_format == 'gzip' else open
+        with opener(out_file, 'wb') as out:
+            if header is not None:
+                out.write(header + b'\n')
+            for path, (_, offset) in zip(paths, headers):
+                for block in iter_shard_data(path, offset):
+                    out.write(block)
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sep = SHARD_SEPARATORS[kind]
+    columns = DEEPFRI_COLUMNS if header is None else \
+        [column.strip() for column in header.decode().split(sep)]
+    schema = pa.schema([(column, pa.string()) for column in columns])
+    if output_format == 'parquet':
+        writer = pq.ParquetWriter(out_file, schema,
+                                  compression=COLUMNAR_COMPRESSION)
+    else:
+        writer = pa.ipc.new_file(out_file, schema,
+                                 options=pa.ipc.IpcWriteOptions(
+                                     compression=COLUMNAR_COMPRESSION))
+    with writer:
+        for path, (_, offset) in zip(paths, headers):
+            for block in iter_shard_data(path, offset):
+                df = pd.read_csv(io.BytesIO(block), sep=sep, names=columns,
+                                 dtype=str, keep_default_na=False)
+                writer.write_table(pa.Table.from_pandas(
+                    df, schema=schema, preserve_index=False))
+
+
+@click.command()
+@click.option('--input_file', '-i', required=True, multiple=True,
+              type=click.Path(resolve_path=True, readable=True, exists=True),
+              help='Shard of eggNOG annotations or DeepFRI predictions. '
+                   'Repeated in the merge order.')
+@click.option('--out_file', '-o', required=True,
+              type=click.Path(resolve_path=True, readable=True, exists=False),
+              help='Output merged table.')
+@click.option('--kind', '-k', required=True,
+              type=click.Choice(list(SHARD_SEPARATORS)),
+              help='Kind of the shards.')
+@click.option('--output-format', default='plain', show_default=True,
+              type=click.Choice(['plain', 'gzip', 'parquet', 'feather']),
+              help='Format of the merged table: text (plain or gzipped) or '
+                   'columnar with all columns as strings.')
+def _merge_shards(input_file, out_file, kind, output_format):
+    """
+    Script for merging sharded eggNOG annotations or DeepFRI predictions.
+
+    Input files required:
+    1) shards with the same header
+    2) Name of output file
+
+    Output:
+    1) merged table with a single header (if the shards have one) and
+       without comment lines
+    """
+    merge_shards(list(input_file), out_file, kind, output_format)
+
+
+if __name__ == "__main__":
+    _merge_shards()
@@ -1,12 +1,17 @@
 import os
 import glob
+import shutil
 import pytest
 import pandas.util.testing as pdt
 
 from os.path import join
+import numpy as np
+import pandas as pd
 from click.testing import CliRunner
 
-from scripts.GO_terms_propagation import _propagate_GO
+from scripts.GO_terms_propagation import _propagate_GO, get_go_closure, \
+    load_go_matrix, propagate_go_column, save_go_matrix
+from scripts.genes_MAGS_eggNOG_mapping import write_table
 from scripts.tests.utils import dict2str, load_df
 runner = CliRunner()
 
@@ -21,7 +26,10 @@ def clean_generated_files():
     if not os.path.exists(OUTPATH):
         os.makedirs(OUTPATH)
     for f in glob.glob(join(OUTPATH, '*')):
-        os.remove(f)
+        if os.path.isdir(f):
+            shutil.rmtree(f)
+        else:
+            os.remove(f)
     assert glob.glob(join(OUTPATH, '*')) == []
 
 
@@ -40,3 +48,143 @@ def test_basic():
     genes_out = load_df(join(OUTPATH, "output.tsv"))
     genes_exp = load_df(join(EXPPATH, "new_tree_propagated_GO.tsv"))
     pdt.assert_frame_equal(genes_out, genes_exp)
+
+
+SMALL_OBO = """format-version: 1.2
+data-version: releases/2020-06-01
+
+[Term]
+id: GO:0008150
+name: biological_process
+
+[Term]
+id: GO:0000001
+name: process A
+is_a: GO:0008150
+
+[Term]
+id: GO:0000002
+name: process B
+is_a: GO:0000001
+
+[Term]
+id: GO:0000003
+name: component part
+relationship: part_of GO:0000002
+
+[Term]
+id: GO:0000004
+name: obsolete process
+is_obsolete: true
+
+[Typedef]
+id: part_of
+name: part of
+"""
+
+
+def test_get_go_closure():
+    obo_path = join(OUTPATH, 'small.obo')
+    with open(obo_path, 'w') as f:
+        f.write(SMALL_OBO)
+    compiled = get_go_closure(obo_path)
+    index_dirs = glob.glob(join(OUTPATH, 'go_closure_*'))
+    assert [os.path.basename(d) for d in index_dirs] == \
+        ['go_closure_v1_releases_2020-06-01']
+    loaded = get_go_closure(obo_path)
+    assert loaded.terms.tolist() == compiled.terms.tolist()
+    for go_closure in [compiled, loaded]:
+        propagated, _, _ = propagate_go_column(
+            pd.Series(['GO:0000003', 'GO:0000001,GO:0000004,-']), go_closure)
+        assert propagated.tolist() == ['GO:0000001,GO:0000002,GO:0000003',
+                                       '-,GO:0000001,GO:0000004']
+
+
+def test_propagate_go_column():
+    obo_path = join(OUTPATH, 'small.obo')
+    with open(obo_path, 'w') as f:
+        f.write(SMALL_OBO)
+    go_closure = get_go_closure(obo_path)
+    go_column = pd.Series(['GO:0000003', '-', 'GO:0000002,GO:0000003',
+                           'GO:0000003,GO:0000002', 'GO:0000003'],
+                          index=[3, 5, 7, 9, 11])
+    propagated, go_matrix, terms = propagate_go_column(go_column, go_closure)
+    expected = pd.Series(['GO:0000001,GO:0000002,GO:0000003', '-',
+                          'GO:0000001,GO:0000002,GO:0000003',
+                          'GO:0000001,GO:0000002,GO:0000003',
+                          'GO:0000001,GO:0000002,GO:0000003'],
+                         index=[3, 5, 7, 9, 11])
+    pdt.assert_series_equal(propagated, expected)
+    assert terms.tolist() == ['-', 'GO:0000001', 'GO:0000002', 'GO:0000003']
+    assert go_matrix.toarray().tolist() == [[False, True, True, True],
+                                            [True, False, False, False],
+                                            [False, True, True, True],
+                                            [False, True, True, True],
+                                            [False, True, True, True]]
+
+    genes = np.array(['g3', 'g5', 'g7', 'g9', 'g11'], dtype=object)
+    save_go_matrix(join(OUTPATH, 'go_matrix.npz'), go_matrix, genes, terms)
+    loaded, loaded_genes, loaded_terms = load_go_matrix(
+        join(OUTPATH, 'go_matrix.npz'))
+    assert (loaded != go_matrix).nnz == 0
+    assert loaded_genes.tolist() == genes.tolist()
+    assert loaded_terms.tolist() == terms.tolist()
+
+
+def test_propagate_chunks():
+    obo_path = join(OUTPATH, 'small.obo')
+    with open(obo_path, 'w') as f:
+        f.write(SMALL_OBO)
+    genes = pd.DataFrame({'Gene ID': ['g1', 'g2', None, 'g4', 'g5', 'g6'],
+                          'GOs': ['GO:0000003', 'GO:0000001', 'GO:0000002',
+                                  None, '-', 'GO:0000004,GO:0000002']})
+    genes.to_csv(join(OUTPATH, 'genes.tsv'), sep='\t', index=False)
+    # several record batches of 4 rows
+    genes.to_feather(join(OUTPATH, 'genes.feather'), chunksize=4)
+
+    outputs = {}
+    for name, options in [('whole', {}), ('chunks', {'-c': 2, '-w': 2}),
+                          ('feather', {'-c': 3})]:
+        table = 'genes.feather' if name == 'feather' else 'genes.tsv'
+        params = {'-g': join(OUTPATH, table), '-t': obo_path,
+                  '-o': join(OUTPATH, f'{name}.tsv'), **options}
+        response = runner.invoke(_propagate_GO, f"{dict2str(params)}")
+        assert response.exit_code == 0
+        with open(join(OUTPATH, f'{name}.tsv')) as f:
+            outputs[name] = f.read()
+        go_matrix, go_genes, go_terms = load_go_matrix(
+            join(OUTPATH, f'{name}.npz'))
+        assert go_genes.tolist() == ['g1', 'g2', 'g5', 'g6']
+        assert go_terms.tolist() == ['-', 'GO:0000001', 'GO:0000002',
+                                     'GO:0000003', 'GO:0000004']
+        assert go_matrix.toarray().sum(axis=1).tolist() == [3, 1, 1, 3]
+    assert outputs['chunks'] == outputs['whole']
+    assert outputs['feather'] == outputs['whole']
+    assert [f for f in os.listdir(OUTPATH) if f.startswith('.')] == []
+
+
+@pytest.mark.parametrize('output_format', ['parquet', 'feather', 'tsv'])
+def test_propagate_mapper_table(output_format):
+    obo_path = join(OUTPATH, 'small.obo')
+    with open(obo_path, 'w') as f:
+        f.write(SMALL_OBO)
+    genes = pd.DataFrame({'Gene ID': ['g1', 'g2', None, 'g4'],
+                          'GOs': ['GO:0000003', 'GO:0000001', 'GO:0000002',
+                                  'GO:0000004,GO:0000002']})
+    genes.to_csv(join(OUTPATH, 'old_table.tsv'), sep='\t', index=False)
+    # table written by the gene mapper, spaces in column names replaced
+    table = join(OUTPATH, f'mapper_table.{output_format}')
+    write_table(genes.rename(columns={'Gene ID': 'Gene_ID'})
+                .assign(Cluster_ID=[0, 0, 1, 2]), table, output_format)
+
+    outputs = []
+    for name, path in [('old', join(OUTPATH, 'old_table.tsv')),
+                       (output_format, table)]:
+        params = {'-g': path, '-t': obo_path, '-c': 2,
+                  '-o': join(OUTPATH, f'mapper_{name}.tsv')}
+        response = runner.invoke(_propagate_GO, f"{dict2str(params)}")
+        assert response.exit_code == 0, response.output
+        with open(join(OUTPATH, f'mapper_{name}.tsv')) as f:
+            outputs.append(f.read())
+    assert outputs[0].startswith('Gene ID\tGOs\tGOs_propagated\n')
+    assert outputs[1] == outputs[0]
@@ -0,0 +1,82 @@
+import os
+import glob
+import shutil
+import pytest
+import numpy as np
+import pandas as pd
+
+from os.path import join
+from click.testing import CliRunner
+
+from scripts.KMA_abundance_matrix import _build_abundance_matrix, \
+    load_abundance_matrix
+from scripts.tests.utils import dict2str
+runner = CliRunner()
+
+OUTPATH = join(os.getcwd(), "data/generated/kma_abundance")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def clean_generated_files():
+    print("\nRemoving old generated files...")
+    if not os.path.exists(OUTPATH):
+        os.makedirs(OUTPATH)
+    for f in glob.glob(join(OUTPATH, '*')):
+        if os.path.isdir(f):
+            shutil.rmtree(f)
+        else:
+            os.remove(f)
+    assert glob.glob(join(OUTPATH, '*')) == []
+
+
+def write_kma_files():
+    samples = join(OUTPATH, 'samples')
+    os.makedirs(samples, exist_ok=True)
+    pd.DataFrame({'#Template': ['g3', 'g1', 'g9'], 'Score': [10, 20, 30],
+                  'Depth': [1.0, 3.0, 4.0]}).to_csv(
+        join(samples, 'A.kma.res'), sep='\t', index=False)
+    pd.DataFrame({'Gene ID': ['g2', 'g3'], 'CPM': [250_000.0, 750_000.0]}) \
+        .to_csv(join(samples, 'B.geneCPM.txt'), sep='\t', index=False)
+    pd.DataFrame({'Cluster ID': [0, 0, 1],
+                  'Gene ID': ['g3', 'g2', 'g1']}).to_csv(
+        join(OUTPATH, 'genes.tsv'), sep='\t', index=False)
+    return samples
+
+
+def test_help():
+    response = runner.invoke(_build_abundance_matrix, ["--help"])
+    assert response.exit_code == 0
+    assert " The script takes KMA results" in response.output
+
+
+def test_catalog_order():
+    samples = write_kma_files()
+    params = {'-i': samples, '-g': join(OUTPATH, 'genes.tsv'),
+              '-o': join(OUTPATH, 'catalog'), '-w': 2}
+    response = runner.invoke(_build_abundance_matrix, f"{dict2str(params)}")
+    assert response.exit_code == 0
+    abundance, genes, samples = load_abundance_matrix(
+        join(OUTPATH, 'catalog'))
+    assert genes.tolist() == ['g3', 'g2', 'g1']
+    assert samples.tolist() == ['A', 'B']
+    assert abundance.dtype == np.float32
+    assert abundance.toarray().tolist() == [[125_000.0, 750_000.0],
+                                            [0.0, 250_000.0],
+                                            [375_000.0, 0.0]]
+
+
+def test_sample_genes():
+    samples = write_kma_files()
+    params = {'-i': join(samples, 'B.geneCPM.txt'),
+              '-o': join(OUTPATH, 'all')}
+    response = runner.invoke(
+        _build_abundance_matrix,
+        f"{dict2str(params)} -i {join(samples, 'A.kma.res')}")
+    assert response.exit_code == 0
+    abundance, genes, samples = load_abundance_matrix(join(OUTPATH, 'all'))
+    assert genes.tolist() == ['g1', 'g2', 'g3', 'g9']
+    assert samples.tolist() == ['B', 'A']
+    assert abundance.toarray().tolist() == [[0.0, 375_000.0],
+                                            [250_000.0, 0.0],
+                                            [750_000.0, 125_000.0],
+                                            [0.0, 500_000.0]]
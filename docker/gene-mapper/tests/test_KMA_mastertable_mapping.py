@@ -0,0 +1,118 @@
+import os
+import glob
+import shutil
+import pytest
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from os.path import join
+from click.testing import CliRunner
+
+from scripts.KMA_mastertable_mapping import _perform_summing_up_CPM
+from scripts.tests.utils import dict2str
+runner = CliRunner()
+
+OUTPATH = join(os.getcwd(), "data/generated/kma_mastertable")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def clean_generated_files():
+    print("\nRemoving old generated files...")
+    if not os.path.exists(OUTPATH):
+        os.makedirs(OUTPATH)
+    for f in glob.glob(join(OUTPATH, '*')):
+        if os.path.isdir(f):
+            shutil.rmtree(f)
+        else:
+            os.remove(f)
+    assert glob.glob(join(OUTPATH, '*')) == []
+
+
+def write_inputs():
+    pd.DataFrame({'Gene ID': ['g1', 'g2', 'g3', 'g4'],
+                  'GOs': ['GO:2,GO:1', '-', 'GO:1', np.nan],
+                  'KEGG_ko': ['ko:K1', 'ko:K1,ko:K2', '-', 'ko:K2'],
+                  'COG_category': ['KT', 'S', np.nan, 'K']}).to_csv(
+        join(OUTPATH, 'genes.tsv'), sep='\t', index=False)
+    pd.DataFrame({'Gene ID': ['g1', 'g3', 'g4', 'g9', 'g1'],
+                  'CPM': [100.0, 20.0, 3.0, 4.0, 5.0]}).to_csv(
+        join(OUTPATH, 'A.geneCPM.txt'), sep='\t', index=False)
+
+    matrix_dir = join(OUTPATH, 'abundance')
+    os.makedirs(matrix_dir, exist_ok=True)
+    abundance = sp.csc_matrix(np.array([[105.0, 0.0], [0.0, 1.0],
+                                        [20.0, 2.0]], dtype=np.float32))
+    arrays = {'data': abundance.data, 'indices': abundance.indices,
+              'indptr': abundance.indptr,
+              'genes': np.array(['g1', 'g2', 'g3']),
+              'samples': np.array(['A', 'B'])}
+    for name, array in arrays.items():
+        np.save(join(matrix_dir, f'{name}.npy'), array)
+
+    go_matrix = sp.csr_matrix(np.array([[1, 1, 1], [0, 0, 1], [1, 0, 0]],
+                                       dtype=bool))
+    np.savez_compressed(join(OUTPATH, 'propagated.npz'), format=b'csr',
+                        shape=go_matrix.shape, data=go_matrix.data,
+                        indices=go_matrix.indices, indptr=go_matrix.indptr,
+                        genes=np.array(['g1', 'g2', 'g3']),
+                        terms=np.array(['GO:0', 'GO:1', 'GO:2']))
+
+
+def test_kma_file():
+    write_inputs()
+    params = {'-k': join(OUTPATH, 'A.geneCPM.txt'),
+              '-g': join(OUTPATH, 'genes.tsv'),
+              '-o': join(OUTPATH, 'kma_file.tsv')}
+    response = runner.invoke(_perform_summing_up_CPM, f"{dict2str(params)}")
+    assert response.exit_code == 0
+    CPM_per_GO = pd.read_csv(join(OUTPATH, 'kma_file.tsv'), sep='\t')
+    assert CPM_per_GO.columns.tolist() == ['GOs', 'CPM']
+    assert CPM_per_GO['GOs'].tolist() == ['-', 'GO:1', 'GO:2']
+    assert CPM_per_GO['CPM'].tolist() == [0.0, 125.0, 105.0]
+
+
+def test_abundance_matrix_propagated():
+    write_inputs()
+    params = {'-a': join(OUTPATH, 'abundance'),
+              '-p': join(OUTPATH, 'propagated.npz'),
+              '-o': join(OUTPATH, 'matrix.tsv')}
+    response = runner.invoke(_perform_summing_up_CPM, f"{dict2str(params)}")
+    assert response.exit_code == 0
+    CPM_per_GO = pd.read_csv(join(OUTPATH, 'matrix.tsv'), sep='\t')
+    assert CPM_per_GO.columns.tolist() == ['GOs', 'A', 'B']
+    assert CPM_per_GO.to_numpy().tolist() == [['GO:0', 125.0, 2.0],
+                                              ['GO:1', 105.0, 0.0],
+                                              ['GO:2', 105.0, 1.0]]
+
+
+def test_annotations():
+    write_inputs()
+    params = {'-a': join(OUTPATH, 'abundance'),
+              '-g': join(OUTPATH, 'genes.tsv'),
+              '-p': join(OUTPATH, 'propagated.npz'),
+              '-o': join(OUTPATH, 'rollup.tsv')}
+    response = runner.invoke(
+        _perform_summing_up_CPM,
+        f"{dict2str(params)} -n GOs -n KEGG_ko -n COG_category")
+    assert response.exit_code == 0
+    CPM_per_GO = pd.read_csv(join(OUTPATH, 'rollup_GOs.tsv'), sep='\t')
+    assert CPM_per_GO['GOs'].tolist() == ['GO:0', 'GO:1', 'GO:2']
+    CPM_per_KO = pd.read_csv(join(OUTPATH, 'rollup_KEGG_ko.tsv'), sep='\t')
+    assert CPM_per_KO.to_numpy().tolist() == [['-', 20.0, 2.0],
+                                              ['ko:K1', 105.0, 1.0],
+                                              ['ko:K2', 0.0, 1.0]]
+    CPM_per_COG = pd.read_csv(join(OUTPATH, 'rollup_COG_category.tsv'),
+                              sep='\t')
+    assert CPM_per_COG.to_numpy().tolist() == [['K', 105.0, 0.0],
+                                               ['S', 0.0, 1.0],
+                                               ['T', 105.0, 0.0]]
+
+
+def test_missing_inputs():
+    write_inputs()
+    params = {'-g': join(OUTPATH, 'genes.tsv'),
+              '-o': join(OUTPATH, 'missing.tsv')}
+    response = runner.invoke(_perform_summing_up_CPM, f"{dict2str(params)}")
+    assert response.exit_code == 2
+    assert "--kma_file" in response.output
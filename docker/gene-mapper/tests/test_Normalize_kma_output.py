@@ -0,0 +1,94 @@
+import os
+import glob
+import shutil
+import sys
+import pytest
+import numpy as np
+import pandas as pd
+
+from os.path import join, dirname
+from click.testing import CliRunner
+
+from scripts.KMA_abundance_matrix import load_kma_abundance
+from scripts.tests.utils import dict2str
+runner = CliRunner()
+
+OUTPATH = join(os.getcwd(), "data/generated/kma_normalization")
+# directory of the KMA image scripts
+KMA_PATH = join(dirname(dirname(dirname(os.path.abspath(__file__)))), 'KMA')
+
+if not os.path.exists(join(KMA_PATH, 'Normalize_kma_output.py')):
+    pytest.skip('KMA scripts not available', allow_module_level=True)
+# importable by pool workers as well
+sys.path.insert(0, KMA_PATH)
+import Normalize_kma_output as normalize_kma_output  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def clean_generated_files():
+    print("\nRemoving old generated files...")
+    if not os.path.exists(OUTPATH):
+        os.makedirs(OUTPATH)
+    for f in glob.glob(join(OUTPATH, '*')):
+        if os.path.isdir(f):
+            shutil.rmtree(f)
+        else:
+            os.remove(f)
+    assert glob.glob(join(OUTPATH, '*')) == []
+
+
+def write_kma_file(name, depths, lengths):
+    path = join(OUTPATH, name)
+    pd.DataFrame({'#Template': [f'g{i}' for i in range(len(depths))],
+                  'Score': np.arange(len(depths)) * 10,
+                  'Template_length': lengths,
+                  'Depth': depths}).to_csv(path, sep='\t', index=False)
+    return path
+
+
+@pytest.mark.parametrize('normalization', ['TPM', 'RPKM'])
+def test_length_normalization(normalization):
+    input_file = write_kma_file('lengths.kma.res', [1.0, 3.0], [100, 300])
+    out_file = join(OUTPATH, f'{normalization}.tsv')
+    params = {'-i': input_file, '-o': out_file, '-n': normalization}
+    response = runner.invoke(normalize_kma_output._perform_normalization,
+                             f"{dict2str(params)}")
+    assert response.exit_code == 0
+
+    out = pd.read_csv(out_file, sep='\t')
+    # CPM is written first even if not requested
+    assert out.columns.tolist() == ['Gene ID', 'CPM', normalization]
+    np.testing.assert_allclose(out['CPM'], [250_000, 750_000])
+    expected = {'TPM': [250_000, 750_000],
+                # aligned bases: 1 * 100 + 3 * 300
+                'RPKM': [1e9 / 1000, 3e9 / 1000]}[normalization]
+    np.testing.assert_allclose(out[normalization], expected)
+
+    genes, cpms = load_kma_abundance(out_file)
+    assert genes.tolist() == ['g0', 'g1']
+    np.testing.assert_allclose(cpms, [250_000, 750_000])
+
+
+def test_batch_out_dir():
+    input_files = [write_kma_file('A.kma.res', [1.0, 1.0], [10, 10]),
+                   write_kma_file('B.res', [2.0, 6.0, 2.0], [10, 10, 10])]
+    out_dir = join(OUTPATH, 'normalized')
+    params = {'-d': out_dir, '-w': 2, '-n': 'TPM'}
+    response = runner.invoke(
+        normalize_kma_output._perform_normalization,
+        f"{dict2str(params)} -n CPM " +
+        " ".join(f'-i {path}' for path in input_files))
+    assert response.exit_code == 0
+    assert sorted(os.listdir(out_dir)) == ['A.geneCPM.txt', 'B.geneCPM.txt']
+
+    out = pd.read_csv(join(out_dir, 'B.geneCPM.txt'), sep='\t')
+    assert out.columns.tolist() == ['Gene ID', 'CPM', 'TPM']
+    np.testing.assert_allclose(out['CPM'], [200_000, 600_000, 200_000])
+
+    # more input files need the output directory
+    params = {'-o': join(OUTPATH, 'out.tsv')}
+    response = runner.invoke(
+        normalize_kma_output._perform_normalization,
+        f"{dict2str(params)} " +
+        " ".join(f'-i {path}' for path in input_files))
+    assert response.exit_code != 0
@@ -1,12 +1,34 @@
 import os
 import glob
+import gzip
+import shutil
+import tarfile
 import pytest
+import numpy as np
+import pandas as pd
 import pandas.util.testing as pdt
 
 from os.path import join
 from click.testing import CliRunner
 
-from scripts.genes_MAGS_eggNOG_mapping import _perform_mapping
+from scripts.genes_MAGS_eggNOG_mapping import (_perform_mapping,
+                                               tabulate_cluster_info,
+                                               iter_cluster_info,
+                                               load_fasta_ids,
+                                               encode_ids,
+                                               decode_codes,
+                                               join_codes,
+                                               code_master_table,
+                                               map_genes_contigs_mags_eggNOG,
+                                               load_eggNOG_file,
+                                               load_mags_contigs_taxonomies,
+                                               write_master_table,
+                                               write_master_table_chunked,
+                                               load_cached,
+                                               update_master_table,
+                                               read_table,
+                                               write_split_tables)
+import scripts.genes_MAGS_eggNOG_mapping as genes_mapping
 from tests.utils import dict2str, load_df
 
 runner = CliRunner()
@@ -22,7 +44,10 @@ def clean_generated_files():
     if not os.path.exists(OUTPATH):
         os.makedirs(OUTPATH)
     for f in glob.glob(join(OUTPATH, '*')):
-        os.remove(f)
+        if os.path.isdir(f):
+            shutil.rmtree(f)
+        else:
+            os.remove(f)
     assert glob.glob(join(OUTPATH, '*')) == []
 
 
@@ -32,6 +57,378 @@ def test_help():
     assert "Script for mapping genes to contigs" in response.output
 
 
+# ====================
+# Cluster file parsing
+# ====================
+
+def test_tabulate_cluster_info():
+    cluster_file = join(INPATH, 'cluster_genes/nr.reduced.clstr')
+    clusters = tabulate_cluster_info(cluster_file)
+    assert list(clusters.columns) == ['Cluster_ID', 'Gene_ID']
+    assert (clusters.dtypes == 'category').all()
+    assert clusters.iloc[0].tolist() == ['Cluster 0', 'G78953_k105_10784_19']
+    # blocks cut in the middle of lines give the same table
+    small_blocks = tabulate_cluster_info(cluster_file, block_size=10)
+    pdt.assert_frame_equal(small_blocks, clusters)
+
+
+def test_iter_cluster_info():
+    cluster_file = join(INPATH, 'cluster_genes/nr.reduced.clstr')
+    clusters = tabulate_cluster_info(cluster_file).astype(str)
+    chunks = list(iter_cluster_info(cluster_file, chunksize=7,
+                                    block_size=100))
+    assert all(len(chunk) <= 7 for chunk in chunks)
+    chunked = pd.concat([chunk.astype(str) for chunk in chunks],
+                        ignore_index=True)
+    pdt.assert_frame_equal(chunked, clusters)
+
+
+# =================
+# Fasta ID scanning
+# =================
+
+def test_load_fasta_ids():
+    fasta_file = join(INPATH, 'metabat2/G78526_bins/bin.1.fa')
+    fasta_ids = load_fasta_ids(fasta_file)
+    with open(fasta_file) as f:
+        exp = [line[1:].split()[0] for line in f if line.startswith('>')]
+    assert fasta_ids.astype(str).tolist() == exp
+
+
+def test_load_fasta_ids_gzipped():
+    fasta_file = join(INPATH, 'cluster_genes/sample_genes.fa')
+    gzipped_file = join(OUTPATH, 'sample_genes.fa.gz')
+    with open(fasta_file, 'rb') as f_in, gzip.open(gzipped_file, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    fasta_ids = load_fasta_ids(gzipped_file, block_size=100)
+    assert fasta_ids.tolist() == load_fasta_ids(fasta_file).tolist()
+
+
+# =====================
+# Integer-coded joining
+# =====================
+
+def test_encode_decode_ids():
+    id_index = pd.Index(['g1', 'g2', 'g3'])
+    codes = encode_ids(['g3', 'g4', 'g1'], id_index)
+    assert codes.tolist() == [2, -1, 0]
+    assert codes.dtype == np.int32
+    decoded = decode_codes(codes, id_index)
+    assert decoded[0] == 'g3' and np.isnan(decoded[1]) and decoded[2] == 'g1'
+
+
+def test_join_codes():
+    left = np.array([1, 0, 2, -1, 1])
+    right = np.array([1, 3, -1, 1, 0])
+    left_pos, right_pos = join_codes(left, right)
+    assert left_pos.tolist() == [0, 0, 1, 4, 4]
+    assert right_pos.tolist() == [0, 3, 4, 0, 3]
+    left_pos, right_pos = join_codes(left, right, how='left')
+    assert left_pos.tolist() == [0, 0, 1, 2, 3, 4, 4]
+    assert right_pos.tolist() == [0, 3, 4, -1, -1, 0, 3]
+
+
+# ===========
+# MAG loading
+# ===========
+
+def write_checkm_tables():
+    """
+    Writes CheckM tables in the tab-separated format for the input bins.
+    """
+    checkm_path = join(OUTPATH, 'checkm')
+    os.makedirs(checkm_path, exist_ok=True)
+    for bin_dir in glob.glob(join(INPATH, 'metabat2/*_bins')):
+        sample = os.path.basename(bin_dir)[:-len('_bins')]
+        bins = sorted(os.path.splitext(f)[0] for f in os.listdir(bin_dir))
+        pd.DataFrame({'Bin Id': bins,
+                      'Completeness': np.linspace(50, 100, len(bins)),
+                      '# genomes': np.arange(len(bins))}).to_csv(
+            join(checkm_path, f'{sample}_checkm.txt'), sep='\t',
+            index=False)
+    return checkm_path
+
+
+def test_load_mags_contigs_taxonomies_workers():
+    checkm_path = write_checkm_tables()
+    args = [join(INPATH, 'metabat2/'), join(INPATH, 'gtdbtk/'), checkm_path]
+    serial = load_mags_contigs_taxonomies(*args)
+    parallel = load_mags_contigs_taxonomies(*args, workers=2)
+    assert len(serial) > 0
+    assert set(serial['MAG_ID'].str[:6]) == {'G78526', 'G78527'}
+    pdt.assert_frame_equal(serial, parallel)
+
+
+def test_load_mags_contigs_taxonomies_archives():
+    # bins packed as in the MetaBAT2 task
+    archive_path = join(OUTPATH, 'bins_archives')
+    os.makedirs(archive_path, exist_ok=True)
+    for bin_dir in glob.glob(join(INPATH, 'metabat2/*_bins')):
+        sample = os.path.basename(bin_dir)[:-len('_bins')]
+        with tarfile.open(join(archive_path, f'{sample}.bins.tar.gz'),
+                          'w:gz', compresslevel=1) as archive:
+            archive.add(bin_dir, arcname=f'{sample}_bins')
+
+    checkm_path = write_checkm_tables()
+    sort_cols = ['MAG_ID', 'contigs']
+    from_dirs = load_mags_contigs_taxonomies(
+        join(INPATH, 'metabat2/'), join(INPATH, 'gtdbtk/'), checkm_path)
+    from_archives = load_mags_contigs_taxonomies(
+        archive_path, join(INPATH, 'gtdbtk/'), checkm_path)
+    assert len(from_dirs) > 0
+    pdt.assert_frame_equal(
+        from_dirs.sort_values(sort_cols).reset_index(drop=True),
+        from_archives.sort_values(sort_cols).reset_index(drop=True))
+
+
+# ====================
+# Master table writing
+# ====================
+
+def load_mapping_inputs():
+    """
+    Loads inputs of the master table from the input data. Contigs of the
+    bins stand in for the merged contigs.
+    """
+    bin_files = sorted(glob.glob(join(INPATH, 'metabat2/*/*.fa')))
+    bin_contigs = [load_fasta_ids(bin_file).astype(str)
+                   for bin_file in bin_files]
+    contigs = np.concatenate(bin_contigs)
+    MAGS_df = pd.DataFrame({
+        'contigs': contigs,
+        'MAG_ID': np.repeat([f'MAG_{i}' for i in range(len(bin_files))],
+                            [len(ids) for ids in bin_contigs]),
+        'Completeness': np.repeat(np.arange(len(bin_files)),
+                                  [len(ids) for ids in bin_contigs])})
+    cluster_df = tabulate_cluster_info(
+        join(INPATH, 'cluster_genes/nr.reduced.clstr'))
+    genes = load_fasta_ids(
+        join(INPATH, 'cluster_genes/sample_genes.fa')).astype(str)
+    # annotations in the current eggNOG-mapper format
+    eggnog_file = join(OUTPATH, 'eggNOG_reduced.tsv')
+    with open(join(INPATH, 'eggnog-mapper/eggNOG_reduced.tsv')) as f_in, \
+            open(eggnog_file, 'w') as f_out:
+        f_out.write(f_in.read().replace('#query_name', '#query'))
+    return cluster_df, genes, contigs, MAGS_df, eggnog_file
+
+
+def test_master_table_order():
+    # int8 gene codes, more genes and orphan annotations than int8 can hold
+    genes = np.array([f'gene_{i:03d}' for i in range(0, 400, 4)])
+    cluster_file = join(OUTPATH, 'many_genes.clstr')
+    with open(cluster_file, 'w') as f:
+        for i, gene in enumerate(genes):
+            f.write(f'>Cluster {i}\n0\t100aa, >{gene}... *\n')
+    cluster_df = tabulate_cluster_info(cluster_file)
+    # annotations of some genes and of genes missing in the clusters
+    queries = [f'gene_{i:03d}' for i in range(0, 400, 3)]
+    eggNOG_df = pd.DataFrame({'#query': queries,
+                              'Preferred_name': range(len(queries))})
+    MAGS_df = pd.DataFrame({'contigs': [], 'MAG_ID': [], 'Completeness': []})
+
+    coded_df, id_indexes, eggnog_rows = code_master_table(
+        cluster_df, genes, np.array([], dtype=str), MAGS_df, eggNOG_df)
+    codes = coded_df['Gene_ID'].to_numpy()
+    keys = np.where(codes >= 0,
+                    id_indexes['Gene_ID'].to_numpy()[codes],
+                    eggNOG_df['#query'].to_numpy()[eggnog_rows])
+    assert codes.dtype == np.int8
+    assert len(genes) + np.count_nonzero(codes < 0) > 127
+    assert keys.tolist() == sorted(set(genes) | set(queries))
+
+
+def test_write_master_table_chunked(monkeypatch):
+    cluster_df, genes, contigs, MAGS_df, eggnog_file = load_mapping_inputs()
+    write_master_table(map_genes_contigs_mags_eggNOG(
+        cluster_df, genes, contigs, MAGS_df, load_eggNOG_file(eggnog_file)),
+        OUTPATH, 'in_memory', False)
+    # force chunks of a few rows
+    monkeypatch.setattr(genes_mapping, 'MIN_CHUNK_BUDGET', 100_000)
+    monkeypatch.setattr(genes_mapping, 'SAMPLE_CHUNK_SIZE', 5)
+    write_master_table_chunked(cluster_df, genes, contigs, MAGS_df,
+                               eggnog_file, 1, OUTPATH, 'chunked',
+                               False)
+
+    out = pd.read_csv(join(OUTPATH, 'chunked.tsv'), sep='\t', index_col=0)
+    exp = pd.read_csv(join(OUTPATH, 'in_memory.tsv'), sep='\t', index_col=0)
+    assert out.index.tolist() == list(range(len(exp)))
+    sort_cols = list(exp.columns)
+    pdt.assert_frame_equal(
+        out.sort_values(sort_cols).reset_index(drop=True),
+        exp.sort_values(sort_cols).reset_index(drop=True))
+
+
+def test_eggNOG_shards(monkeypatch):
+    cluster_df, genes, contigs, MAGS_df, eggnog_file = load_mapping_inputs()
+    with open(eggnog_file) as f:
+        lines = f.readlines()
+    comments = [line for line in lines if line.startswith('#')]
+    rows = [line for line in lines if not line.startswith('#')]
+    shards = [join(OUTPATH, f'eggNOG_shard_{i}.tsv') for i in range(2)]
+    for shard, shard_rows in zip(shards, [rows[:7], rows[7:]]):
+        with open(shard, 'w') as f:
+            f.writelines(comments + shard_rows)
+
+    pdt.assert_frame_equal(load_eggNOG_file(shards),
+                           load_eggNOG_file(eggnog_file))
+    monkeypatch.setattr(genes_mapping, 'MIN_CHUNK_BUDGET', 100_000)
+    monkeypatch.setattr(genes_mapping, 'SAMPLE_CHUNK_SIZE', 5)
+    for name, eggnog_ann_file in [('single', eggnog_file),
+                                  ('shards', shards)]:
+        write_master_table_chunked(cluster_df, genes, contigs, MAGS_df,
+                                   eggnog_ann_file, 1, OUTPATH,
+                                   f'chunked_{name}', False)
+    with open(join(OUTPATH, 'chunked_single.tsv')) as f_single, \
+            open(join(OUTPATH, 'chunked_shards.tsv')) as f_shards:
+        assert f_shards.read() == f_single.read()
+
+
+def test_write_master_table_columnar(monkeypatch):
+    cluster_df, genes, contigs, MAGS_df, eggnog_file = load_mapping_inputs()
+    master_df = map_genes_contigs_mags_eggNOG(
+        cluster_df, genes, contigs, MAGS_df, load_eggNOG_file(eggnog_file))
+    write_master_table(master_df, OUTPATH, 'columnar', False,
+                       output_format='parquet')
+    # force chunks of a few rows
+    monkeypatch.setattr(genes_mapping, 'MIN_CHUNK_BUDGET', 100_000)
+    monkeypatch.setattr(genes_mapping, 'SAMPLE_CHUNK_SIZE', 5)
+    write_master_table_chunked(cluster_df, genes, contigs, MAGS_df,
+                               eggnog_file, 1, OUTPATH, 'columnar_chunked',
+                               False, 'feather')
+
+    out = pd.read_feather(join(OUTPATH, 'columnar_chunked.feather'))
+    exp = pd.read_parquet(join(OUTPATH, 'columnar.parquet'))
+    assert len(exp) == len(master_df)
+    sort_cols = list(exp.columns)
+    pdt.assert_frame_equal(
+        out.sort_values(sort_cols).reset_index(drop=True),
+        exp.sort_values(sort_cols).reset_index(drop=True))
+
+
+def test_update_master_table():
+    cluster_df, genes, contigs, MAGS_df, eggnog_file = load_mapping_inputs()
+    eggNOG_df = load_eggNOG_file(eggnog_file)
+    write_master_table(map_genes_contigs_mags_eggNOG(
+        cluster_df, genes, contigs, MAGS_df, eggNOG_df),
+        OUTPATH, 'previous', False)
+
+    # re-annotation of a previous gene without new samples
+    new_annotation = eggNOG_df.iloc[[0]].copy()
+    new_annotation['eggNOG free text desc.'] = 'updated description'
+    update_master_table(cluster_df, genes, np.array([], dtype=str),
+                        MAGS_df.iloc[:0], new_annotation,
+                        join(OUTPATH, 'previous.tsv'), OUTPATH, 'updated')
+
+    prev = pd.read_csv(join(OUTPATH, 'previous.tsv'), sep='\t', index_col=0)
+    out = pd.read_csv(join(OUTPATH, 'updated.tsv'), sep='\t', index_col=0)
+    assert out.index.tolist() == list(range(len(prev)))
+    gene = new_annotation['#query'].iloc[0]
+    is_gene = out['Gene_ID'] == gene
+    assert is_gene.sum() == (prev['Gene_ID'] == gene).sum() == 1
+    assert out.loc[is_gene, 'eggNOG_free_text_desc.'].tolist() == \
+        ['updated description']
+    # untouched rows are copied
+    pdt.assert_frame_equal(out[~is_gene],
+                           prev[prev['Gene_ID'] != gene].set_axis(
+                               out.index[~is_gene]))
+
+
+@pytest.mark.parametrize('output_format', ['tsv', 'parquet'])
+def test_update_master_table_orphans(output_format):
+    cluster_df, genes, contigs, MAGS_df, eggnog_file = load_mapping_inputs()
+    eggNOG_df = load_eggNOG_file(eggnog_file)
+    master_df = map_genes_contigs_mags_eggNOG(cluster_df, genes, contigs,
+                                              MAGS_df, eggNOG_df)
+    assert master_df['Gene_ID'].isna().any()
+    write_master_table(master_df, OUTPATH, f'in_place_{output_format}',
+                       False, output_format=output_format)
+    previous_table = join(OUTPATH, f'in_place_{output_format}.'
+                                   f'{output_format}')
+    prev = read_table(previous_table)
+
+    # all annotations again, written over the previous table
+    update_master_table(cluster_df, genes, np.array([], dtype=str),
+                        MAGS_df.iloc[:0], eggNOG_df, previous_table,
+                        OUTPATH, f'in_place_{output_format}', output_format)
+    out = read_table(previous_table)
+    assert len(out) == len(prev)
+    assert out['Gene_ID'].isna().sum() == prev['Gene_ID'].isna().sum()
+    sort_cols = ['Gene_ID', 'seed_eggNOG_ortholog']
+    pdt.assert_frame_equal(
+        out.sort_values(sort_cols).reset_index(drop=True),
+        prev.sort_values(sort_cols).reset_index(drop=True))
+    assert [f for f in os.listdir(OUTPATH) if f.startswith('.')] == []
+
+
+def test_write_split_tables():
+    cluster_df, genes, contigs, MAGS_df, eggnog_file = load_mapping_inputs()
+    # column names of the current eggNOG-mapper version
+    eggNOG_df = load_eggNOG_file(eggnog_file).rename(columns={
+        'seed_eggNOG_ortholog': 'seed_ortholog',
+        'seed_ortholog_evalue': 'evalue', 'seed_ortholog_score': 'score',
+        'best_tax_level': 'max_annot_lvl',
+        'COG Functional cat.': 'COG_category',
+        'eggNOG free text desc.': 'Description'}).assign(PFAMs='-')
+    master_df = map_genes_contigs_mags_eggNOG(cluster_df, genes, contigs,
+                                              MAGS_df, eggNOG_df)
+    write_master_table(master_df, OUTPATH, 'wide', True)
+    write_split_tables(cluster_df, genes, contigs, MAGS_df, eggNOG_df,
+                       OUTPATH, 'star')
+    for name in ['mapped_genes_cluster', 'individual_mapped_genes']:
+        with open(join(OUTPATH, f'star_{name}.tsv')) as out, \
+                open(join(OUTPATH, f'wide_{name}.tsv')) as exp:
+            assert out.read() == exp.read()
+
+
+# ========================
+# Parsed intermediate cache
+# ========================
+
+def test_load_cached():
+    cache_dir = join(OUTPATH, 'cache')
+    cluster_file = join(INPATH, 'cluster_genes/nr.reduced.clstr')
+    calls = []
+
+    def loader(path):
+        calls.append(path)
+        return tabulate_cluster_info(path)
+
+    first = load_cached(cache_dir, 2**30, 'clusters', [cluster_file],
+                        loader, cluster_file)
+    second = load_cached(cache_dir, 2**30, 'clusters', [cluster_file],
+                         loader, cluster_file)
+    assert calls == [cluster_file]
+    pdt.assert_frame_equal(first, second)
+
+    # changed input gives a new entry
+    copied_file = join(OUTPATH, 'nr.copied.clstr')
+    with open(cluster_file) as f_in, open(copied_file, 'w') as f_out:
+        f_out.write(f_in.read() + '>Cluster 9999999\n0\t100aa, >extra... *\n')
+    load_cached(cache_dir, 2**30, 'clusters', [copied_file], loader,
+                copied_file)
+    assert calls == [cluster_file, copied_file]
+    assert len(os.listdir(cache_dir)) == 2
+
+    # least recently used entries are evicted, the new one is kept
+    load_cached(cache_dir, 1, 'genes',
+                [join(INPATH, 'cluster_genes/sample_genes.fa')],
+                load_fasta_ids, join(INPATH, 'cluster_genes/sample_genes.fa'))
+    entries = sorted(os.path.basename(f).split('-')[0]
+                     for f in os.listdir(cache_dir))
+    assert entries == ['genes']
+
+    # unreadable entries are rebuilt
+    entry = join(cache_dir, os.listdir(cache_dir)[0])
+    with open(entry, 'wb') as f:
+        f.write(b'not a pickle')
+    genes = load_cached(cache_dir, 2**30, 'genes',
+                        [join(INPATH, 'cluster_genes/sample_genes.fa')],
+                        load_fasta_ids,
+                        join(INPATH, 'cluster_genes/sample_genes.fa'))
+    assert len(genes) > 0
+    assert pd.read_pickle(entry).tolist() == genes.tolist()
+
+
 # =========================
 # Do not split master table
 # =========================
@@ -0,0 +1,137 @@
+import os
+import glob
+import gzip
+import pytest
+import pandas as pd
+
+from os.path import join
+from click.testing import CliRunner
+
+from scripts.merge_shards import _merge_shards
+from scripts.transform_deepfri_output import load_DeepFRI_file
+from scripts.tests.utils import dict2str
+runner = CliRunner()
+
+INPATH = join(os.getcwd(), "data/input/deepfri")
+OUTPATH = join(os.getcwd(), "data/generated/merge_shards")
+
+EGGNOG_HEADER = "#query\tseed_ortholog\tevalue\tGOs\n"
+EGGNOG_ROWS = ["g1\t1.A\t1e-10\tGO:1,GO:2\n", "g2\t2.B\t1e-20\t-\n",
+               "g3\t3.C\t1e-30\tGO:3\n", "g4\t4.D\t1e-40\t-\n"]
+
+
+@pytest.fixture(scope="session", autouse=True)
+def clean_generated_files():
+    print("\nRemoving old generated files...")
+    if not os.path.exists(OUTPATH):
+        os.makedirs(OUTPATH)
+    for f in glob.glob(join(OUTPATH, '*')):
+        os.remove(f)
+    assert glob.glob(join(OUTPATH, '*')) == []
+
+
+def write_eggnog_shards(header=EGGNOG_HEADER):
+    shards = []
+    for i, rows in enumerate([EGGNOG_ROWS[:3], EGGNOG_ROWS[3:]]):
+        shard = join(OUTPATH, f'shard_{i}.emapper.annotations')
+        with open(shard, 'w') as f:
+            f.write("## emapper-2.1.6\n## command: ./emapper.py\n##\n")
+            f.write(header if i == 0 else EGGNOG_HEADER)
+            f.writelines(rows)
+            f.write("## 3 queries scanned\n## Total time: 1 secs")
+        shards.append(shard)
+    return shards
+
+
+def test_help():
+    response = runner.invoke(_merge_shards, ["--help"])
+    assert response.exit_code == 0
+    assert " Script for merging sharded eggNOG" in response.output
+
+
+def test_merge_eggnog():
+    shards = write_eggnog_shards()
+    params = {'-o': join(OUTPATH, 'merged.tsv'), '-k': 'eggnog'}
+    response = runner.invoke(
+        _merge_shards, f"{dict2str(params)} -i {shards[0]} -i {shards[1]}")
+    assert response.exit_code == 0
+    with open(join(OUTPATH, 'merged.tsv')) as f:
+        assert f.read() == EGGNOG_HEADER + "".join(EGGNOG_ROWS)
+
+
+def test_merge_formats():
+    shards = write_eggnog_shards()
+    params = {'-o': join(OUTPATH, 'merged.tsv.gz'), '-k': 'eggnog',
+              '--output-format': 'gzip'}
+    response = runner.invoke(
+        _merge_shards, f"{dict2str(params)} -i {shards[0]} -i {shards[1]}")
+    assert response.exit_code == 0
+    with gzip.open(join(OUTPATH, 'merged.tsv.gz'), 'rt') as f:
+        assert f.read() == EGGNOG_HEADER + "".join(EGGNOG_ROWS)
+
+    params = {'-o': join(OUTPATH, 'merged.parquet'), '-k': 'eggnog',
+              '--output-format': 'parquet'}
+    response = runner.invoke(
+        _merge_shards, f"{dict2str(params)} -i {shards[0]} -i {shards[1]}")
+    assert response.exit_code == 0
+    merged = pd.read_parquet(join(OUTPATH, 'merged.parquet'))
+    assert merged.columns.tolist() == ['#query', 'seed_ortholog', 'evalue',
+                                       'GOs']
+    assert merged['#query'].tolist() == ['g1', 'g2', 'g3', 'g4']
+    assert merged['evalue'].tolist() == ['1e-10', '1e-20', '1e-30', '1e-40']
+
+
+def test_merge_deepfri():
+    shards = []
+    for i, rows in enumerate([['g1,GO:1,cnn_mf,0.9,"a, b"\n'],
+                              ['g2,GO:2,cnn_mf,0.7,c\n']]):
+        shard = join(OUTPATH, f'shard_{i}.csv')
+        with open(shard, 'w') as f:
+            f.write('### Predictions made by DeepFRI.\n')
+            f.write('Protein,GO_term,model,Score,name\n')
+            f.writelines(rows)
+        shards.append(shard)
+    params = {'-o': join(OUTPATH, 'merged.csv'), '-k': 'deepfri'}
+    response = runner.invoke(
+        _merge_shards, f"{dict2str(params)} -i {shards[0]} -i {shards[1]}")
+    assert response.exit_code == 0
+    with open(join(OUTPATH, 'merged.csv')) as f:
+        assert f.read() == 'Protein,GO_term,model,Score,name\n' \
+            'g1,GO:1,cnn_mf,0.9,"a, b"\ng2,GO:2,cnn_mf,0.7,c\n'
+
+
+@pytest.mark.parametrize('header', [None, 'Protein,GO_term,model,Score,name'])
+def test_merge_deepfri_load(header):
+    with open(join(INPATH, 'deepfri_reduced.tsv')) as f:
+        rows = f.readlines()
+    shards = []
+    for i, shard_rows in enumerate([rows[:40], rows[40:]]):
+        shard = join(OUTPATH, f'deepfri_{header is None}_{i}.csv')
+        with open(shard, 'w') as f:
+            f.write('### Predictions made by DeepFRI.\n')
+            if header is not None:
+                f.write(header + '\n')
+            f.writelines(shard_rows)
+        shards.append(shard)
+    merged = join(OUTPATH, f'deepfri_{header is None}.csv')
+    params = {'-o': merged, '-k': 'deepfri'}
+    response = runner.invoke(
+        _merge_shards, f"{dict2str(params)} -i {shards[0]} -i {shards[1]}")
+    assert response.exit_code == 0
+    with open(merged) as f:
+        assert f.readlines() == ([header + '\n'] if header else []) + rows
+
+    goterms = set(pd.read_csv(join(INPATH, 'deepfri_reduced.tsv'),
+                              header=None)[1])
+    pd.testing.assert_frame_equal(
+        load_DeepFRI_file(merged, goterms),
+        load_DeepFRI_file(join(INPATH, 'deepfri_reduced.tsv'), goterms))
+
+
+def test_header_mismatch():
+    shards = write_eggnog_shards(header="#query\tseed_ortholog\tevalue\n")
+    params = {'-o': join(OUTPATH, 'mismatch.tsv'), '-k': 'eggnog'}
+    response = runner.invoke(
+        _merge_shards, f"{dict2str(params)} -i {shards[0]} -i {shards[1]}")
+    assert response.exit_code == 2
+    assert "header of" in response.output
@@ -6,7 +6,8 @@ import pandas.util.testing as pdt
 from os.path import join
 from click.testing import CliRunner
 
-from scripts.transform_deepfri_output import _process_deepfri
+from scripts.transform_deepfri_output import _process_deepfri, \
+    load_DeepFRI_file, load_GO_subset_file, preprocess_data
 from scripts.tests.utils import dict2str, load_df
 runner = CliRunner()
 
@@ -40,3 +41,32 @@ def test_basic():
     genes_out = load_df(join(OUTPATH, "output.tsv"))
     genes_exp = load_df(join(EXPPATH, "deepfri_out.tsv"))
     pdt.assert_frame_equal(genes_out, genes_exp)
+
+
+def test_load_DeepFRI_file_chunks():
+    goterms = set(load_GO_subset_file(
+        join(INPATH, 'GO_informative.txt'))['Goterm'])
+    whole = load_DeepFRI_file(join(INPATH, 'deepfri_reduced.tsv'), goterms)
+    chunks = load_DeepFRI_file(join(INPATH, 'deepfri_reduced.tsv'), goterms,
+                               chunksize=50)
+    assert (chunks['model'] == 'cnn_mf').all()
+    assert (chunks['score'] >= 0.5).all()
+    assert chunks['goterm'].isin(goterms).all()
+    pdt.assert_frame_equal(preprocess_data(chunks).astype(str),
+                           preprocess_data(whole).astype(str))
+    assert preprocess_data(chunks)['Sample'].tolist() == \
+        [gene.split('_k')[0] for gene in chunks['id']]
+
+
+def test_load_DeepFRI_file_header():
+    # merged DeepFRI output (see test_merge_deepfri) with a comment line
+    with open(join(OUTPATH, 'header.csv'), 'w') as f:
+        f.write('### Predictions made by DeepFRI.\n'
+                'Protein,GO_term,model,Score,name\n'
+                'g1,GO:1,cnn_mf,0.9,"a, b"\ng2,GO:2,cnn_mf,0.7,c\n'
+                'g3,GO:3,cnn_mf,0.9,d\n')
+    deepfri = load_DeepFRI_file(join(OUTPATH, 'header.csv'),
+                                {'GO:1', 'GO:2'})
+    assert deepfri['id'].tolist() == ['g1', 'g2']
+    assert deepfri['name'].tolist() == ['a, b', 'c']
+    assert deepfri['score'].tolist() == pytest.approx([0.9, 0.7])
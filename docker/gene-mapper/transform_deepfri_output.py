@@ -1,26 +1,101 @@
 #! /usr/bin/env python
 
+import gzip
 import click
+import numpy as np
 import pandas as pd
 
 pd.options.mode.chained_assignment = None
 
+# number of DeepFRI rows read at once
+DEEPFRI_CHUNK_SIZE = 1_000_000
+# selected DeepFRI predictions
+DEEPFRI_MODEL = 'cnn_mf'
+MIN_SCORE = 0.5
 
-def load_DeepFRI_file(path):
+
+def count_DeepFRI_header_lines(path):
+    """
+    Counts lines before the DeepFRI predictions: comment lines and the
+    header line (first line without numeric score), if there is one
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    int
     """
-    Reads DeepFRI annotation file
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        for n, line in enumerate(f):
+            if line.startswith('#'):
+                continue
+            try:
+                float(line.split(',', 4)[3])
+            except (IndexError, ValueError):
+                return n + 1
+            return n
+    return 0
+
+
+def load_DeepFRI_file(path, goterms, chunksize=DEEPFRI_CHUNK_SIZE):
+    """
+    Reads DeepFRI annotation file chunk by chunk, keeping only CNN_MF
+    functions of the given GO terms. Comment lines and the header line
+    before the predictions are skipped.
 
     Parameters
     ----------
     path : tsv
+    goterms : set
+        GO terms to keep
+    chunksize : int
+        number of rows read at once
 
     Returns
     -------
     Pandas dataframe
     """
-    deepfri_df = pd.read_csv(path, sep=",", header=None,
-                             names=['id', 'goterm', 'model', 'score', 'name'])
-    return deepfri_df
+    deepfri_chunks = []
+    selected = None
+    with pd.read_csv(path, sep=",", header=None,
+                     skiprows=count_DeepFRI_header_lines(path),
+                     names=['id', 'goterm', 'model', 'score', 'name'],
+                     dtype={'goterm': 'category', 'model': 'category',
+                            'score': 'float32'},
+                     chunksize=chunksize) as reader:
+        for chunk in reader:
+            selected = filter_DeepFRI_chunk(chunk, goterms)
+            if len(selected):
+                deepfri_chunks.append(selected)
+    return pd.concat(deepfri_chunks or [selected], ignore_index=True)
+
+
+def filter_DeepFRI_chunk(chunk, goterms):
+    """
+    Selects CNN_MF functions of the given GO terms with score of at
+    least MIN_SCORE
+
+    Parameters
+    ----------
+    chunk : pandas.DataFrame
+        DeepFRI annotations with categorical goterm column
+    goterms : set
+        GO terms to keep
+
+    Returns
+    -------
+    Pandas dataframe
+    """
+    # membership is tested once per category, -1 codes (NaN) are dropped
+    informative = np.append(chunk['goterm'].cat.categories.isin(goterms),
+                            False)
+    selected = informative[chunk['goterm'].cat.codes.to_numpy()] & \
+        (chunk['model'] == DEEPFRI_MODEL).to_numpy() & \
+        (chunk['score'] >= MIN_SCORE).to_numpy()
+    return chunk[selected]
 
 
 def load_GO_subset_file(go):
@@ -44,13 +119,9 @@ def load_GO_subset_file(go):
 
 def preprocess_data(data):
     """
-    Processing DeepFRI file and selecting only CNN_MF functions
+    Processing selected DeepFRI functions, adding sample of genes
     """
-    data = data.astype({'score': 'float32'})
-    data = data.loc[(data['model'] == 'cnn_mf') & (
-                data['score'] >= 0.5)]  # Select CNN_MF functions
-    data['Sample'] = data['id'].apply(
-        lambda x: x.split("_k")[0])  # extract sample colum
+    data['Sample'] = data['id'].str.split("_k", n=1).str[0]  # extract sample
     data = data[["id", "goterm", "name", "Sample"]]  # subset
     return data
 
@@ -79,19 +150,15 @@ def _process_deepfri(deepfri_file, go_subset_file, out_file):
     1) DeepFRI .tsv file
     """
 
-    # load deepfri dataframe
-    deepfri_df = load_DeepFRI_file(deepfri_file)
-
     # load informative GO subset
     GO_informative_df = load_GO_subset_file(go_subset_file)
 
-    # map to deepfri dataframe to filter out only informative GO terms
-    deepfri_GO_informative = pd.merge(deepfri_df, GO_informative_df,
-                                      left_on='goterm', right_on='Goterm',
-                                      how='inner')
+    # load cnn_mf functions of informative GO terms of deepfri dataframe
+    deepfri_cnn_mf = load_DeepFRI_file(deepfri_file,
+                                       set(GO_informative_df['Goterm']))
 
-    # select the cnn_mf functions
-    deepfri_cnn_mf = preprocess_data(deepfri_GO_informative)
+    # add samples
+    deepfri_cnn_mf = preprocess_data(deepfri_cnn_mf)
 
     # save the file
     deepfri_cnn_mf.to_csv(out_file, sep='\t', index=False)
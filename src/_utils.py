@@ -1,10 +1,35 @@
 import os
 import sys
 import re
+import io
+import bz2
 import json
 import glob
-from typing import Dict, List
-
+import gzip
+import lzma
+import zlib
+import fcntl
+import signal
+import socket
+import queue
+import shutil
+import fnmatch
+import hashlib
+import tarfile
+import zipfile
+import threading
+import contextlib
+import subprocess
+import time
+import http.client
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, List, NamedTuple, Optional
+
+import requests
 from rich.console import Console
 from rich.highlighter import RegexHighlighter
 from rich.theme import Theme
@@ -14,6 +39,72 @@ console = Console()
 import logging
 logging.basicConfig(level=logging.DEBUG)
 
+# manifest of database file locations written to database directories
+DATABASE_MANIFEST = ".database_manifest.json"
+DATABASE_MANIFEST_VERSION = 1
+# streamed database downloads: size of read chunks, number of chunks buffered
+# between the download and the extraction, retries of a broken connection
+# and the journal of members extracted to the staging directory
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+DOWNLOAD_QUEUE_SIZE = 64
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_JOURNAL = ".download_journal"
+# unpacking: compression codecs of file extensions, multi-threaded
+# decompression tools and their single-threaded Python fallbacks, size of
+# read chunks and seconds between progress messages
+ARCHIVE_CODECS = {".gz": "gzip", ".bz2": "bzip2", ".xz": "xz", ".zst": "zstd"}
+DECOMPRESSION_TOOLS = {
+    "gzip": ["pigz", "-dc", "-p", "{threads}"],
+    "bzip2": ["pbzip2", "-dc", "-p{threads}"],
+    "xz": ["xz", "-dc", "-T{threads}"],
+    "zstd": ["zstd", "-dcq"],
+}
+PYTHON_DECOMPRESSORS = {"gzip": gzip.open, "bzip2": bz2.open, "xz": lzma.open}
+UNPACK_CHUNK_SIZE = 1 << 20
+UNPACK_PROGRESS_INTERVAL = 10
+# BGZF blocks: size of the block header, number of blocks inflated per task
+BGZF_HEADER_SIZE = 18
+BGZF_BATCH_SIZE = 64
+# Cromwell log lines of task state changes, task failures, the workflow id,
+# the workflow failure and the final workflow status, task definitions and
+# maxRetries runtime attributes of WDLs, states of finished tasks and seconds
+# between reads of a log without new lines
+TASK_STATUS_PATTERN = re.compile(
+    r"\[UUID\(\w+\)(?P<task>[\w.]+:[\w-]+:\d+)\]: Status change from (?P<old>\S+) to (?P<new>\w+)")
+TASK_FAILURE_PATTERN = re.compile(
+    r"(?:Job|Call) (?P<task>[\w.]+:[\w-]+:\d+) (?:exited with return code|failed)")
+WORKFLOW_ID_PATTERN = re.compile(r"Workflow ([0-9a-f-]{36}) submitted")
+WORKFLOW_FAILURE_PATTERN = re.compile(r"Workflow [0-9a-f-]{36} failed")
+WORKFLOW_STATUS_PATTERN = re.compile(r"workflow finished with status '(\w+)'")
+TASK_RETRIES_PATTERN = re.compile(r"\btask\s+(?P<task>\w+)\s*\{|\bmaxRetries\s*:\s*(?P<retries>\d+)")
+TASK_DONE_STATES = {"Done", "Failed", "RetryableFailure", "Aborted", "Bypassed", "Unstartable"}
+TASK_FAILED_STATES = {"Failed"}
+WORKFLOW_POLL_INTERVAL = 1
+# Cromwell server mode: final workflow states, seconds to wait for a
+# starting server, seconds between status polls and the configuration
+# appended to the backend config of the server
+WORKFLOW_FINAL_STATES = {"Succeeded", "Failed", "Aborted"}
+SERVER_START_TIMEOUT = 300
+SERVER_POLL_INTERVAL = 10
+SERVER_CONFIG = """
+webservice {{
+  interface = "127.0.0.1"
+  port = {port}
+}}
+call-caching {{
+  enabled = true
+}}
+database {{
+  profile = "slick.jdbc.HsqldbProfile$"
+  db {{
+    driver = "org.hsqldb.jdbcDriver"
+    url = "jdbc:hsqldb:file:{database};shutdown=false;hsqldb.tx=mvcc"
+    connectionTimeout = 120000
+    numThreads = 1
+  }}
+}}
+"""
+
 
 def get_files_with_extension(directory, extension):
     """
@@ -156,31 +247,553 @@ def modify_concurrency_config(path_to_file : str,
     return out_config_path
 
 
-def unpack_archive(archive_path, unpack_folder, remove_archive=True):
-    unpack_path = os.path.abspath(unpack_folder)
+def archive_member_matches(name, members):
+    """Tells whether an archive member matches any glob pattern of members, None matches all"""
+    return members is None or any(fnmatch.fnmatch(name, pattern) for pattern in members)
+
+
+class ProgressReader:
+    """Read-only file object of a file logging the share read and the throughput"""
+
+    def __init__(self, path):
+        self.name = os.path.basename(path)
+        self.total = os.path.getsize(path)
+        self.done = 0
+        self._file = open(path, "rb")
+        self._start = self._logged = time.monotonic()
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self.done += len(data)
+        if time.monotonic() - self._logged >= UNPACK_PROGRESS_INTERVAL:
+            self.log()
+        return data
+
+    def log(self):
+        self._logged = time.monotonic()
+        elapsed = max(self._logged - self._start, 1e-6)
+        logging.info(f"Unpacking {self.name}: {self.done / max(self.total, 1):.0%} "
+                     f"of {self.total / 1e6:.1f} MB ({self.done / 1e6 / elapsed:.1f} MB/s)")
+
+    def close(self):
+        self._file.close()
+
+
+class IterReader:
+    """Read-only file object of an iterable of bytes"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
 
-    if archive_path.endswith(".zip"):
-        cmd = f"unzip -q {archive_path} -d {unpack_path}"
-    elif archive_path.endswith("tar.gz"):
-        cmd = f"tar -xzf {archive_path} -C {unpack_path}"
-    elif archive_path.endswith(".gz"):
-        filename = ".".join(archive_path.split("/")[-1].split('.')[:-1])
-        cmd = f"gunzip -c {archive_path} > {os.path.join(unpack_path, filename)}"
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class PipeDecompressor:
+    """
+    Read-only file object of data decompressed by an external tool, fed with
+    the compressed data by a background thread. Leaving the context raises
+    subprocess.CalledProcessError when the tool fails.
+    """
+
+    def __init__(self, command, source):
+        self.command = command
+        self._error = None
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._feeder = threading.Thread(target=self._feed, args=(source,), daemon=True)
+        self._feeder.start()
+
+    def _feed(self, source):
+        try:
+            for chunk in iter(lambda: source.read(UNPACK_CHUNK_SIZE), b""):
+                self._process.stdin.write(chunk)
+        except BrokenPipeError:
+            # the tool stopped reading, its exit status tells why
+            pass
+        except Exception as error:
+            self._error = error
+        finally:
+            try:
+                self._process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def read(self, size=-1):
+        return self._process.stdout.read(size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            # the tool exits only after its output is read to the end
+            while self.read(UNPACK_CHUNK_SIZE):
+                pass
+        else:
+            self._process.kill()
+        self._process.stdout.close()
+        returncode = self._process.wait()
+        self._feeder.join()
+        if exc_type is None:
+            if self._error is not None:
+                raise self._error
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, self.command)
+
+
+def is_bgzf(path):
+    """Tells whether a gzip file is made of independent BGZF (bgzip) blocks"""
+    with open(path, "rb") as f:
+        header = f.read(BGZF_HEADER_SIZE)
+    return header[:4] == b"\x1f\x8b\x08\x04" and header[12:14] == b"BC"
+
+
+def inflate_bgzf_block(block):
+    xlen = int.from_bytes(block[10:12], "little")
+    data = zlib.decompress(block[12 + xlen:-8], -15)
+    if zlib.crc32(data) != int.from_bytes(block[-8:-4], "little"):
+        raise ValueError("BGZF block fails the CRC check.")
+    return data
+
+
+def inflate_bgzf_blocks(blocks):
+    return b"".join(map(inflate_bgzf_block, blocks))
+
+
+def iter_bgzf_blocks(source):
+    while True:
+        header = source.read(BGZF_HEADER_SIZE)
+        if not header:
+            return
+        if len(header) < BGZF_HEADER_SIZE or header[12:14] != b"BC":
+            raise ValueError("Truncated or invalid BGZF block.")
+        block_size = int.from_bytes(header[16:18], "little") + 1
+        yield header + source.read(block_size - BGZF_HEADER_SIZE)
+
+
+def iter_bgzf_inflated(source, threads):
+    """Yields data of BGZF blocks in order, the blocks inflated in parallel threads"""
+    blocks = iter_bgzf_blocks(source)
+    with ThreadPoolExecutor(threads) as executor:
+        pending = deque()
+        while True:
+            batch = list(islice(blocks, BGZF_BATCH_SIZE))
+            if batch:
+                pending.append(executor.submit(inflate_bgzf_blocks, batch))
+            # keep a few batches per thread in flight
+            if pending and (not batch or len(pending) >= 2 * threads):
+                yield pending.popleft().result()
+            if not pending:
+                return
+
+
+@contextlib.contextmanager
+def open_decompressed(source, codec, threads, archive_path):
+    """
+    Opens decompressed content of source: BGZF blocks are inflated in
+    parallel, other formats go through the multi-threaded tool of
+    DECOMPRESSION_TOOLS or, if it is not installed, the Python module.
+    """
+    if codec is None:
+        yield source
+    elif codec == "gzip" and is_bgzf(archive_path):
+        chunks = iter_bgzf_inflated(source, threads)
+        try:
+            yield IterReader(chunks)
+        finally:
+            chunks.close()
+    else:
+        command = [arg.format(threads=threads) for arg in DECOMPRESSION_TOOLS[codec]]
+        if shutil.which(command[0]):
+            with PipeDecompressor(command, source) as stream:
+                yield stream
+        elif codec in PYTHON_DECOMPRESSORS:
+            logging.warning(f"{command[0]} is not installed, unpacking {archive_path} in a single thread.")
+            with PYTHON_DECOMPRESSORS[codec](source, "rb") as stream:
+                yield stream
+        else:
+            raise ValueError(f"{command[0]} is required to unpack {archive_path}.")
+
+
+def unpack_archive(archive_path, unpack_folder, remove_archive=True, members=None, threads=None):
+    """
+    Unpacks .zip, .tar(.gz|.bz2|.xz|.zst) and .tgz archives, or single
+    .gz/.bz2/.xz/.zst compressed files. Only archive members matching glob
+    patterns of members are extracted, all by default. Decompression uses
+    threads (all CPUs by default) where the format allows. The archive is
+    kept when unpacking fails.
+    """
+    unpack_path = os.path.abspath(unpack_folder)
+    threads = threads or os.cpu_count() or 1
+    filename = os.path.basename(archive_path)
+    stem, extension = os.path.splitext(filename)
+    if extension == ".tgz":
+        codec, is_tar = "gzip", True
+    elif extension in ARCHIVE_CODECS:
+        codec, is_tar = ARCHIVE_CODECS[extension], stem.endswith(".tar")
+    elif extension in [".tar", ".zip"]:
+        codec, is_tar = None, extension == ".tar"
     else:
         raise ValueError("Archive format is not supported.")
 
     logging.info(f"Unpacking {archive_path} to {unpack_path}")
-    os.system(cmd)
+    os.makedirs(unpack_path, exist_ok=True)
+    n_extracted = n_skipped = 0
+    if extension == ".zip":
+        with zipfile.ZipFile(archive_path) as archive:
+            for name in archive.namelist():
+                if archive_member_matches(name, members):
+                    archive.extract(name, unpack_path)
+                    n_extracted += 1
+                else:
+                    n_skipped += 1
+    else:
+        source = ProgressReader(archive_path)
+        try:
+            with open_decompressed(source, codec, threads, archive_path) as stream:
+                if is_tar:
+                    with tarfile.open(fileobj=stream, mode="r|") as tar:
+                        tar.extraction_filter = getattr(tarfile, "data_filter", None)
+                        for member in tar:
+                            if archive_member_matches(member.name, members):
+                                tar.extract(member, unpack_path)
+                                n_extracted += 1
+                            else:
+                                n_skipped += 1
+                else:
+                    with open(os.path.join(unpack_path, stem), "wb") as f:
+                        shutil.copyfileobj(stream, f, UNPACK_CHUNK_SIZE)
+                    n_extracted = 1
+            source.log()
+        finally:
+            source.close()
+    logging.info(f"Unpacked {n_extracted} files of {filename}"
+                 + (f", {n_skipped} not matching {', '.join(members)} skipped" if n_skipped else ""))
 
     if remove_archive:
         os.remove(archive_path)
 
     return unpack_path
 
+def iter_url_chunks(url, chunk_size=DOWNLOAD_CHUNK_SIZE, retries=DOWNLOAD_RETRIES):
+    """
+    Yields the content of a url in chunks. A broken connection is resumed
+    with a range request from the last received byte as long as the server
+    serves the same object.
+    """
+    received = 0
+    validator = None
+    attempt = 0
+    while True:
+        headers = {}
+        if received:
+            headers["Range"] = f"bytes={received}-"
+            if validator:
+                headers["If-Range"] = validator
+        try:
+            request = urllib.request.Request(url, headers=headers)
+            with urllib.request.urlopen(request, timeout=60) as response:
+                if received and response.status != 206:
+                    raise OSError(f"Unable to resume download of {url}: server sent the whole file.")
+                if validator is None:
+                    etag = response.headers.get("ETag", "")
+                    validator = (etag if etag and not etag.startswith("W/")
+                                 else response.headers.get("Last-Modified"))
+                for chunk in iter(lambda: response.read(chunk_size), b""):
+                    received += len(chunk)
+                    attempt = 0
+                    yield chunk
+                # http.client ends a cut response like a complete one
+                if response.length:
+                    raise http.client.IncompleteRead(b"", response.length)
+            return
+        except urllib.error.HTTPError as error:
+            if error.code < 500 or attempt >= retries:
+                raise
+            reason = error
+        except (urllib.error.URLError, http.client.HTTPException, ConnectionError, TimeoutError) as error:
+            if attempt >= retries:
+                raise
+            reason = error
+        attempt += 1
+        logging.warning(f"Download of {url} interrupted at {received} bytes ({reason}), retrying.")
+        time.sleep(min(2 ** attempt, 60))
+
+
+class DownloadStream:
+    """
+    Read-only file object of a url downloaded by a background thread, so that
+    the download runs while the consumer decompresses and writes the data.
+    Downloaded bytes are hashed on the way.
+    """
+
+    def __init__(self, url, hasher):
+        self.url = url
+        self.hasher = hasher
+        self.size = 0
+        self.error = None
+        self._buffer = bytearray()
+        self._eof = False
+        self._chunks = queue.Queue(DOWNLOAD_QUEUE_SIZE)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._download, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def _download(self):
+        try:
+            for chunk in iter_url_chunks(self.url):
+                if self._stop.is_set():
+                    return
+                self.hasher.update(chunk)
+                self.size += len(chunk)
+                self._put(chunk)
+        except Exception as error:
+            self.error = error
+        self._put(None)
+
+    def read(self, size=-1):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self._chunks.get()
+            if chunk is None:
+                self._eof = True
+                if self.error is not None:
+                    raise self.error
+            else:
+                self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        # deleting from the front of a bytearray does not copy the rest
+        del self._buffer[:size]
+        return data
+
+    def drain(self):
+        """Reads the rest of the url, e.g. padding after the end of an archive"""
+        while self.read(DOWNLOAD_CHUNK_SIZE):
+            pass
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def read_download_journal(journal_path):
+    """Reads sizes of members extracted by an interrupted streamed download"""
+    journal = {}
+    if os.path.isfile(journal_path):
+        with open(journal_path) as f:
+            for line in f:
+                name, _, size = line.rstrip("\n").rpartition("\t")
+                if name and size.isdigit():
+                    journal[name] = int(size)
+    return journal
+
+
+def is_journaled(journal, staging_dir, name, size):
+    path = os.path.join(staging_dir, name)
+    return journal.get(name) == size and os.path.isfile(path) and os.path.getsize(path) == size
+
+
+def move_tree(source, destination):
+    """Moves the content of source directory into destination, merging directories"""
+    os.makedirs(destination, exist_ok=True)
+    for entry in os.scandir(source):
+        target = os.path.join(destination, entry.name)
+        if entry.is_dir(follow_symlinks=False) and os.path.isdir(target) and not os.path.islink(target):
+            move_tree(entry.path, target)
+        else:
+            os.replace(entry.path, target)
+
+
+def stream_download_archive(url, save_dir, checksum=None, members=None):
+    """
+    Downloads a .tar(.gz|.bz2|.xz), .tgz or .gz archive and unpacks it while
+    it arrives, without keeping the archive on disk. Members are extracted to
+    a hidden staging directory and moved to save_dir once the checksum
+    ("<algorithm>:<hex digest>", e.g. "md5:...") of the whole download is
+    verified. Only members matching glob patterns of members are extracted.
+    A rerun after an interruption skips members already extracted to the
+    staging directory.
+    """
+    filename = url.split("/")[-1]
+    unpack_path = os.path.abspath(save_dir)
+    staging_dir = os.path.join(unpack_path, f".{filename}.partial")
+    journal_path = os.path.join(staging_dir, DOWNLOAD_JOURNAL)
+    os.makedirs(staging_dir, exist_ok=True)
+    journal = read_download_journal(journal_path)
+    if journal:
+        logging.info(f"Resuming unpacking of {filename}, {len(journal)} extracted files are kept.")
+
+    algorithm, _, expected = (checksum or "").rpartition(":")
+    hasher = hashlib.new(algorithm or "sha256")
+    logging.info(f"Downloading and unpacking {url} to {unpack_path}")
+    start = time.monotonic()
+    stream = DownloadStream(url, hasher)
+    try:
+        with open(journal_path, "a") as journal_file:
+            if filename.endswith(".gz") and not filename.endswith((".tar.gz", ".tgz")):
+                name = filename[:-len(".gz")]
+                if not is_journaled(journal, staging_dir, name, journal.get(name)):
+                    with gzip.GzipFile(fileobj=stream) as f_in, \
+                            open(os.path.join(staging_dir, name), "wb") as f_out:
+                        shutil.copyfileobj(f_in, f_out, DOWNLOAD_CHUNK_SIZE)
+                    size = os.path.getsize(os.path.join(staging_dir, name))
+                    journal_file.write(f"{name}\t{size}\n")
+                    journal_file.flush()
+            else:
+                with tarfile.open(fileobj=stream, mode="r|*") as tar:
+                    tar.extraction_filter = getattr(tarfile, "data_filter", None)
+                    for member in tar:
+                        if not archive_member_matches(member.name, members):
+                            continue
+                        if member.isfile() and is_journaled(journal, staging_dir, member.name, member.size):
+                            continue
+                        tar.extract(member, staging_dir)
+                        if member.isfile():
+                            journal_file.write(f"{member.name}\t{member.size}\n")
+                            journal_file.flush()
+        stream.drain()
+    except BaseException:
+        # nothing to resume from, e.g. the URL is not found
+        if not read_download_journal(journal_path):
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    finally:
+        stream.close()
+
+    elapsed = max(time.monotonic() - start, 1e-6)
+    logging.info(f"Downloaded {filename}: {stream.size / 1e6:.1f} MB "
+                 f"in {elapsed:.0f} s ({stream.size / 1e6 / elapsed:.1f} MB/s), "
+                 f"{hasher.name} {hasher.hexdigest()}")
+    if expected and hasher.hexdigest() != expected.lower():
+        shutil.rmtree(staging_dir)
+        raise ValueError(f"Checksum of {filename} does not match: "
+                         f"expected {expected}, got {hasher.hexdigest()}.")
+
+    os.remove(journal_path)
+    move_tree(staging_dir, unpack_path)
+    shutil.rmtree(staging_dir)
+    return unpack_path
+
+
+def match_database_file(fname, all_extensions):
+    """
+    Check if a path ends with one of the database extensions (regular expressions).
+    """
+    return any(re.search(extension+"$", fname) for extension in all_extensions)
+
+
+def scan_database_directory(database_path, all_extensions):
+    """
+    Walk the directory with os.scandir in the order of a recursive glob
+    (entries of a directory before its subdirectories) and stop at the first
+    file or directory matching the extensions. Hidden entries are skipped
+    like in glob and directories already visited through symlinks are pruned.
+
+    Returns the matching path and the directories on the way to it,
+    or (None, []) if nothing matches.
+    """
+    visited = set()
+
+    def walk(directory, parents):
+        try:
+            real_directory = os.path.realpath(directory)
+            if real_directory in visited:
+                return None, []
+            visited.add(real_directory)
+            with os.scandir(directory) as it:
+                entries = [entry for entry in it if not entry.name.startswith(".")]
+        except OSError:
+            return None, []
+
+        parents = parents + [directory]
+        for entry in entries:
+            if match_database_file(entry.path, all_extensions):
+                return entry.path, parents
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                match, match_parents = walk(entry.path, parents)
+                if match is not None:
+                    return match, match_parents
+        return None, []
+
+    return walk(database_path, [])
+
+
+def directory_mtimes(directories):
+    """
+    Modification times of directories (None for missing ones).
+    """
+    mtimes = {}
+    for directory in directories:
+        try:
+            mtimes[directory] = os.stat(directory).st_mtime_ns
+        except OSError:
+            mtimes[directory] = None
+    return mtimes
+
+
+def read_database_manifest(database_path):
+    """
+    Read the manifest of database locations stored in the database directory.
+    """
+    try:
+        with open(os.path.join(database_path, DATABASE_MANIFEST), "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != DATABASE_MANIFEST_VERSION:
+        return {}
+    return manifest.get("entries", {})
+
+
+def write_database_manifest(database_path, entries, key, match, directories):
+    """
+    Add the location of database files to the manifest in the database directory.
+    The manifest file is created before the modification times are taken and
+    then rewritten in place, so that writing it does not make the entry stale.
+    Read-only database directories are left without manifest.
+    """
+    manifest_path = os.path.join(database_path, DATABASE_MANIFEST)
+    try:
+        open(manifest_path, "a").close()
+        entries[key] = {"match": match, "mtimes": directory_mtimes(directories)}
+        with open(manifest_path, "w") as f:
+            json.dump({"version": DATABASE_MANIFEST_VERSION, "entries": entries}, f, indent=4)
+    except OSError as e:
+        logging.warning(f"Unable to write database manifest {manifest_path}: {e}")
+
 
 def find_database(database_path, all_extensions, database_name):
     """
     Search through the directory for database files.
+
+    Locations of the database files are kept in a manifest in the database
+    directory. The manifest entry is used while the matched file exists and
+    the directories on the way to it are not modified, otherwise the directory
+    is scanned again.
     """
 
     index=""
@@ -195,28 +808,44 @@ def find_database(database_path, all_extensions, database_name):
                 logging.info(f"Treating {index} as {database_name}.")
                 return index
 
-    for fname in glob.glob(database_path+"/**/*", recursive=True):
-        for extension in all_extensions:
-            if re.search(extension+"$",fname):
-                index = os.path.abspath(os.path.dirname(fname))
-                logging.info(f"Treating {index} as directory with {database_name}.")
-                return index
+    if not os.path.isdir(database_path):
+        logging.info(f"Unable to find {database_name} files in directory: {database_path}.")
+        return index
+
+    entries = read_database_manifest(database_path)
+    key = "\t".join(all_extensions)
+    entry = entries.get(key)
+    if entry is not None and os.path.exists(entry["match"]) and \
+            directory_mtimes(entry["mtimes"]) == entry["mtimes"]:
+        index = os.path.abspath(os.path.dirname(entry["match"]))
+        logging.info(f"Treating {index} as directory with {database_name} (from manifest).")
+        return index
+
+    match, directories = scan_database_directory(database_path, all_extensions)
+    if match is not None:
+        index = os.path.abspath(os.path.dirname(match))
+        logging.info(f"Treating {index} as directory with {database_name}.")
+        write_database_manifest(database_path, entries, key, match, directories)
 
     if not index:
         logging.info(f"Unable to find {database_name} files in directory: {database_path}.")
 
     return index
 
-def download_database(save_dir, url, database_name, database_description):
+def download_database(save_dir, url, database_name, database_description, checksum=None, stream=True, members=None):
     """
-    Download a database from a url to a save directory.
+    Download a database from a url to a save directory. Tar and gzip archives
+    are streamed and unpacked during the download unless stream is False.
+    members are glob patterns of archive members to extract, all by default.
     """
 
     message = f"{database_name} database will be downloaded. {database_description}"
     logging.info(message)
+    if stream and url.endswith((".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".gz")):
+        return stream_download_archive(url, save_dir, checksum, members)
     zip_filename = aria2c_download_file(url, save_dir)
     zip_filepath = os.path.join(save_dir, zip_filename)
-    database_path = unpack_archive(zip_filepath, save_dir)
+    database_path = unpack_archive(zip_filepath, save_dir, members=members)
     return database_path
 
 def check_or_download_database(database_path, extensions, software_name, database_name, database_url, database_description):
@@ -260,16 +889,28 @@ def filter_list_of_terms(key_terms, list_of_terms):
     return [term for term in list_of_terms if any(key_term in term for key_term in key_terms)]
 
 
-def read_evaluate_log(log_path):
-    """ Reads the Cromwell log and checks wherher the workflow was successful or not"""
-    with open(log_path, "r") as f:
-        log = f.read()
-    if "workflow finished with status 'Succeeded'" in log:
-        console.log("Workflow finished successfully.", style="green")
-    else:
-        console.log("Workflow failed. Check the log file.", style="red")
+class WorkflowResult(NamedTuple):
+    """Outcome of a Cromwell run started by start_workflow"""
+    status: str
+    log_path: str
+    workflow_id: Optional[str]
+    failed_tasks: List[str]
+    returncode: Optional[int]
+
+    @property
+    def succeeded(self):
+        return self.status == "Succeeded"
 
 
+def evaluate_workflow(result: WorkflowResult) -> None:
+    """Reports the outcome of the workflow, exits with an error if it did not succeed"""
+    if result.succeeded:
+        console.log("Workflow finished successfully.", style="green")
+        return
+    failed_tasks = f" Failed tasks: {', '.join(result.failed_tasks)}." if result.failed_tasks else ""
+    console.log(f"Workflow {result.status.lower()}.{failed_tasks} Check the log file {result.log_path}.", style="red")
+    sys.exit(1)
+
 def check_inputs_not_empty(inputs: Dict[str, List]) -> None:
     """Checks if all lists are not empty"""
     for name, input_ in inputs.items():
@@ -277,19 +918,325 @@ def check_inputs_not_empty(inputs: Dict[str, List]) -> None:
             console.log(f"Workflow failed. Input {name} is empty. Check the inputs in the system files.", style="red")
             sys.exit(1)
 
-def start_workflow(system_paths, inputs_path, system_folder, workflow_name, console=console):
-    """Starts the workflow. Redirects output to a log file and returns the log path for evaluation"""
-    console.log(f"Workflow [bold yellow]{workflow_name}[/bold yellow] has started. Please, be patient.")
+def workflow_command(system_paths, inputs_path, workflow_name):
+    """Cromwell run command of the workflow"""
+    cmd = ["java", f"-Dconfig.file={system_paths['db_mount_config']}", "-jar", system_paths["cromwell_path"],
+           "run", system_paths["wdl_path"]]
+    if workflow_name != "qc":
+        cmd += ["-o", system_paths["output_config_path"]]
+    return cmd + ["-i", inputs_path]
 
-    with console.status("[yellow]Processing data..."):
-        log_path = os.path.join(system_folder, "log.txt")
-        if workflow_name == "qc":
-            cmd = """java -Dconfig.file={1} -jar {0} run {2} -i {3} > {4}""".format(*system_paths.values(), inputs_path, log_path)
-        else:
-            cmd = """java -Dconfig.file={1} -jar {0} run {3} -o {2} -i {4} > {5}""".format(*system_paths.values(), inputs_path, log_path)
-        os.system(cmd)
 
-    return log_path
+def iter_log_lines(log_path, process, poll_interval=WORKFLOW_POLL_INTERVAL):
+    """
+    Yields lines appended to the log of a running process, one at a time,
+    until the process exits and the log is read to the end.
+    """
+    with open(log_path, "r", errors="replace") as f:
+        partial = ""
+        while True:
+            line = f.readline()
+            if line.endswith("\n"):
+                yield partial + line
+                partial = ""
+            elif line:
+                # the line is still being written
+                partial += line
+            elif process.poll() is not None:
+                # the process has exited, read what it wrote last
+                rest = f.readline()
+                if not rest:
+                    if partial:
+                        yield partial
+                    return
+                partial += rest
+            else:
+                time.sleep(poll_interval)
+
+
+def read_task_retries(wdl_dir):
+    """Returns maxRetries of tasks defined in the WDLs of a directory"""
+    retries = {}
+    for path in glob.glob(os.path.join(wdl_dir, "*.wdl")):
+        task = None
+        with open(path) as f:
+            for match in TASK_RETRIES_PATTERN.finditer(f.read()):
+                if match.group("task"):
+                    task = match.group("task")
+                elif task is not None:
+                    retries[task] = max(retries.get(task, 0), int(match.group("retries")))
+    return retries
+
+
+class TaskMonitor:
+    """Reports state changes and failures of workflow tasks"""
+
+    def __init__(self, console, spinner, max_retries=None):
+        self.console = console
+        self.spinner = spinner
+        self.max_retries = max_retries or {}
+        self.states = {}
+        self.failed = []
+        self.retried = []
+
+    def update(self, task, state):
+        """Records the state of a task, returns True when the task has newly failed"""
+        if self.states.get(task) == state:
+            return False
+        self.states[task] = state
+        self.console.log(f"Task [bold]{task}[/bold]: {state}")
+        running = sum(state not in TASK_DONE_STATES for state in self.states.values())
+        self.spinner.update(f"[yellow]Processing data... {running} tasks running, "
+                            f"{len(self.states) - running} finished")
+        return state in TASK_FAILED_STATES and self.fail(task)
+
+    def fail(self, task, message=""):
+        """
+        Records a failed task, returns True when it has not failed before.
+        Failed attempts which Cromwell retries are only reported.
+        """
+        if task in self.failed or task in self.retried:
+            return False
+        if self.is_retried(task):
+            self.retried.append(task)
+            self.console.log(f"Task [bold]{task}[/bold] failed, retrying{': ' + message if message else '.'}",
+                             style="yellow")
+            return False
+        self.failed.append(task)
+        self.console.log(f"Task [bold]{task}[/bold] failed{': ' + message if message else '.'}", style="red")
+        return True
+
+    def is_retried(self, task):
+        """Returns True when Cromwell retries a failed attempt of a task ("<call>:<shard>:<attempt>")"""
+        call, _, attempt = task.split(":")
+        return int(attempt) <= self.max_retries.get(call.rsplit(".", 1)[-1], 0)
+
+
+def run_workflow(system_paths, inputs_path, system_folder, workflow_name, tasks,
+                 fail_fast=True, abort_on_failure=False) -> WorkflowResult:
+    """Runs the workflow in a new Cromwell process, following its log line by line"""
+    log_path = os.path.join(system_folder, "log.txt")
+    cmd = workflow_command(system_paths, inputs_path, workflow_name)
+    logging.info(" ".join(cmd))
+    status = workflow_id = None
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        for line in iter_log_lines(log_path, process):
+            failed = False
+            match = TASK_STATUS_PATTERN.search(line)
+            if match:
+                failed = tasks.update(match.group("task"), match.group("new"))
+            match = TASK_FAILURE_PATTERN.search(line)
+            if match:
+                failed = tasks.fail(match.group("task"), line.strip()) or failed
+            match = WORKFLOW_ID_PATTERN.search(line) if workflow_id is None else None
+            if match:
+                workflow_id = match.group(1)
+            match = WORKFLOW_STATUS_PATTERN.search(line)
+            if match:
+                status = match.group(1)
+            if WORKFLOW_FAILURE_PATTERN.search(line) and (fail_fast or abort_on_failure):
+                # nothing is left to abort, Cromwell ends the failed workflow
+                status = "Failed"
+                break
+
+            if failed and abort_on_failure:
+                # Cromwell aborts its running jobs on SIGTERM in run mode
+                tasks.console.log("Aborting the workflow.", style="red")
+                process.terminate()
+                process.wait()
+                status = "Aborted"
+                break
+            if failed and fail_fast:
+                tasks.console.log(f"Cromwell finishes running tasks in the background, see {log_path}.",
+                                  style="red")
+                status = "Failed"
+                break
+    except BaseException:
+        process.terminate()
+        raise
+
+    returncode = process.poll()
+    if status is None:
+        status = "Succeeded" if returncode == 0 and not tasks.failed else "Failed"
+    return WorkflowResult(status, log_path, workflow_id, tasks.failed, returncode)
+
+
+def is_server_alive(url):
+    try:
+        return requests.get(f"{url}/engine/v1/version", timeout=5).ok
+    except requests.RequestException:
+        return False
+
+
+def find_free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def ensure_cromwell_server(system_paths):
+    """
+    Returns url and log path of a local Cromwell server running with the
+    backend config of the workflow, starting one if none is running. Every
+    backend config gets its own server directory next to the Cromwell jar,
+    with the server log and the call-cache database shared by all workflows
+    submitted to it.
+    """
+    with open(system_paths["db_mount_config"]) as f:
+        backend_config = f.read()
+    key = hashlib.sha1((system_paths["cromwell_path"] + backend_config).encode()).hexdigest()[:12]
+    server_dir = os.path.join(os.path.dirname(system_paths["cromwell_path"]), "server", key)
+    os.makedirs(server_dir, exist_ok=True)
+    state_path = os.path.join(server_dir, "server.json")
+    log_path = os.path.join(server_dir, "server.log")
+
+    # a lock keeps steps launched at once from starting two servers
+    with open(os.path.join(server_dir, "server.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.isfile(state_path):
+            url = read_json_config(state_path)["url"]
+            if is_server_alive(url):
+                logging.info(f"Reusing Cromwell server {url}")
+                return url, log_path
+
+        port = find_free_port()
+        url = f"http://127.0.0.1:{port}"
+        config_path = os.path.join(server_dir, "server.conf")
+        with open(config_path, "w") as f:
+            f.write(backend_config + SERVER_CONFIG.format(port=port,
+                                                          database=os.path.join(server_dir, "cromwell-db")))
+        cmd = ["java", f"-Dconfig.file={config_path}", "-jar", system_paths["cromwell_path"], "server"]
+        logging.info(" ".join(cmd))
+        with open(log_path, "a") as log:
+            # the server outlives this step to serve the next ones
+            process = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, cwd=server_dir,
+                                       start_new_session=True)
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while not is_server_alive(url):
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.terminate()
+                message = f"Unable to start Cromwell server. Check the log file {log_path}."
+                logging.critical(message)
+                sys.exit(message)
+            time.sleep(1)
+        with open(state_path, "w") as f:
+            json.dump({"url": url, "pid": process.pid}, f)
+    logging.info(f"Started Cromwell server {url}")
+    return url, log_path
+
+
+def stop_cromwell_servers(cromwell_path):
+    """Stops local Cromwell servers started next to the Cromwell jar, returns their urls"""
+    stopped = []
+    for state_path in glob.glob(os.path.join(os.path.dirname(cromwell_path), "server", "*", "server.json")):
+        server_dir = os.path.dirname(state_path)
+        with open(os.path.join(server_dir, "server.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            state = read_json_config(state_path)
+            # the pid is only trusted while the server answers at its url
+            if is_server_alive(state["url"]):
+                try:
+                    # the server runs in its own session, see ensure_cromwell_server
+                    os.killpg(state["pid"], signal.SIGTERM)
+                    stopped.append(state["url"])
+                except ProcessLookupError:
+                    pass
+            os.remove(state_path)
+    return stopped
+
+
+def submit_workflow(url, system_paths, inputs_path, workflow_name):
+    """Submits the workflow to a Cromwell server, returns the workflow id"""
+    wdl_path = system_paths["wdl_path"]
+    # WDLs imported by the workflow are sent along as a zip
+    dependencies = io.BytesIO()
+    with zipfile.ZipFile(dependencies, "w") as archive:
+        for path in glob.glob(os.path.join(os.path.dirname(wdl_path), "*.wdl")):
+            if path != wdl_path:
+                archive.write(path, os.path.basename(path))
+
+    with contextlib.ExitStack() as stack:
+        files = {
+            "workflowSource": stack.enter_context(open(wdl_path, "rb")),
+            "workflowInputs": stack.enter_context(open(inputs_path, "rb")),
+            "workflowDependencies": ("dependencies.zip", dependencies.getvalue()),
+        }
+        if workflow_name != "qc":
+            files["workflowOptions"] = stack.enter_context(open(system_paths["output_config_path"], "rb"))
+        response = requests.post(f"{url}/api/workflows/v1", files=files, timeout=60)
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+def iter_call_states(metadata):
+    """Yields tasks ("<call>:<shard>:<attempt>" as in Cromwell logs) and their states from workflow metadata"""
+    for call, attempts in metadata.get("calls", {}).items():
+        for attempt in attempts:
+            shard = attempt.get("shardIndex", -1)
+            task = f"{call}:{'NA' if shard == -1 else shard}:{attempt.get('attempt', 1)}"
+            yield task, attempt.get("executionStatus")
+
+
+def serve_workflow(system_paths, inputs_path, workflow_name, tasks,
+                   fail_fast=True, abort_on_failure=False) -> WorkflowResult:
+    """Runs the workflow on a local Cromwell server, polling its status through the REST API"""
+    url, log_path = ensure_cromwell_server(system_paths)
+    workflow_id = submit_workflow(url, system_paths, inputs_path, workflow_name)
+    workflow_url = f"{url}/api/workflows/v1/{workflow_id}"
+    logging.info(f"Workflow {workflow_id} submitted to {url}")
+    params = {"includeKey": ["status", "executionStatus", "shardIndex", "attempt"],
+              "expandSubWorkflows": "false"}
+    try:
+        while True:
+            response = requests.get(f"{workflow_url}/metadata", params=params, timeout=60)
+            response.raise_for_status()
+            metadata = response.json()
+            failed = False
+            for task, state in iter_call_states(metadata):
+                failed = tasks.update(task, state) or failed
+            status = metadata.get("status")
+            if status in WORKFLOW_FINAL_STATES:
+                break
+            if failed and abort_on_failure:
+                tasks.console.log("Aborting the workflow.", style="red")
+                requests.post(f"{workflow_url}/abort", timeout=60).raise_for_status()
+                status = "Aborted"
+                break
+            if failed and fail_fast:
+                tasks.console.log(f"Cromwell server finishes running tasks, see {log_path}.", style="red")
+                status = "Failed"
+                break
+            time.sleep(SERVER_POLL_INTERVAL)
+    except BaseException:
+        # an interrupted step takes its workflow down as in run mode
+        try:
+            requests.post(f"{workflow_url}/abort", timeout=60)
+        except requests.RequestException:
+            pass
+        raise
+    return WorkflowResult(status, log_path, workflow_id, tasks.failed, None)
+
+
+def start_workflow(system_paths, inputs_path, system_folder, workflow_name, console=console,
+                   fail_fast=True, abort_on_failure=False, server=False) -> WorkflowResult:
+    """
+    Starts the workflow in a new Cromwell process, or on a local Cromwell
+    server shared by the steps (server), and reports task state changes.
+    When a task fails, the workflow is aborted (abort_on_failure), or left
+    to finish its running tasks in the background while the failure is
+    returned (fail_fast), or waited for until it ends.
+    """
+    console.log(f"Workflow [bold yellow]{workflow_name}[/bold yellow] has started. Please, be patient.")
+
+    with console.status("[yellow]Processing data...") as spinner:
+        tasks = TaskMonitor(console, spinner, read_task_retries(os.path.dirname(system_paths["wdl_path"])))
+        if server:
+            return serve_workflow(system_paths, inputs_path, workflow_name, tasks,
+                                  fail_fast, abort_on_failure)
+        return run_workflow(system_paths, inputs_path, system_folder, workflow_name, tasks,
+                            fail_fast, abort_on_failure)
 
 def load_input_template(script_dir, script_name, config):
     template_path = os.path.abspath(os.path.join(script_dir, config["input_templates"][script_name]))
@@ -320,6 +1267,12 @@ def prepare_system_variables(argparser, py_script):
     script_dir = os.path.dirname(py_script)
     config = read_json_config(os.path.join(script_dir, "config.json"))
     # parsing arguments
+    argparser.add_argument('--abort_on_failure', action='store_true',
+                           help='Abort running tasks of the workflow as soon as a task fails. '
+                                'Otherwise Cromwell finishes them in the background.')
+    argparser.add_argument('--server', action='store_true',
+                           help='Submit the workflow to a local Cromwell server shared by the steps, '
+                                'started if it is not running, instead of a new Cromwell process.')
     args = vars(argparser.parse_args())
     system_folder = os.path.join(args["output_folder"], "system")
     if script_name not in ["t1_predict_mags", "generate_table"]:
@@ -3,7 +3,7 @@ import os
 from _utils import (
     modify_concurrency_config,
     get_files_with_extension,
-    read_evaluate_log,
+    evaluate_workflow,
     check_inputs_not_empty,
     start_workflow,
     retrieve_config_paths,
@@ -54,7 +54,8 @@ paths = retrieve_config_paths(config, script_dir, script_name, output_path=args[
 paths["db_mount_config"] = modify_concurrency_config(paths["db_mount_config"], system_folder, args["concurrent_jobs"])
 
 # starting workflow
-log_path = start_workflow(paths, inputs_path, system_folder, script_name)
+workflow = start_workflow(paths, inputs_path, system_folder, script_name,
+                          abort_on_failure=args["abort_on_failure"], server=args["server"])
 
 # checking if the job was succesful
-read_evaluate_log(log_path)
\ No newline at end of file
+evaluate_workflow(workflow)
\ No newline at end of file
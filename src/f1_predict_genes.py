@@ -1,6 +1,6 @@
 from _utils import (
     modify_concurrency_config, 
-    read_evaluate_log,
+    evaluate_workflow,
     get_files_with_extension,
     check_inputs_not_empty,
     start_workflow,
@@ -42,7 +42,8 @@ paths["db_mount_config"] = modify_concurrency_config(paths["db_mount_config"],
                                                      args["concurrent_jobs"])
 
 # starting workflow
-log_path = start_workflow(paths, inputs_path, system_folder, script_name)
+workflow = start_workflow(paths, inputs_path, system_folder, script_name,
+                          abort_on_failure=args["abort_on_failure"], server=args["server"])
 
 # checking if the job was successful
-read_evaluate_log(log_path)
\ No newline at end of file
+evaluate_workflow(workflow)
\ No newline at end of file
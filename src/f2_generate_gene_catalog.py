@@ -2,7 +2,7 @@ import os
 
 from _utils import (
     modify_concurrency_config,
-    read_evaluate_log,
+    evaluate_workflow,
     get_files_with_extension,
     check_inputs_not_empty,
     start_workflow,
@@ -44,9 +44,10 @@ paths = retrieve_config_paths(config, script_dir, script_name, output_path=args[
 paths["db_mount_config"] = modify_concurrency_config(paths["db_mount_config"], system_folder, n_jobs=1)
 
 # starting workflow
-log_path = start_workflow(paths, inputs_path, system_folder, script_name)
+workflow = start_workflow(paths, inputs_path, system_folder, script_name,
+                          abort_on_failure=args["abort_on_failure"], server=args["server"])
 
-read_evaluate_log(log_path)
+evaluate_workflow(workflow)
 
 # rename output folder
 glob_name = [file for file in os.listdir(args["output_folder"]) if file.startswith("glob")][0]
@@ -3,7 +3,7 @@ import json
 
 from _utils import (
     modify_concurrency_config,
-    read_evaluate_log,
+    evaluate_workflow,
     find_database,
     download_database,
     check_inputs_not_empty,
@@ -81,6 +81,7 @@ paths["db_mount_config"] = modify_concurrency_config(paths["db_mount_config"], s
                                                     )
 
 # starting workflow
-log_path = start_workflow(paths, inputs_path, system_folder, script_name)
+workflow = start_workflow(paths, inputs_path, system_folder, script_name,
+                          abort_on_failure=args["abort_on_failure"], server=args["server"])
 
-read_evaluate_log(log_path)
\ No newline at end of file
+evaluate_workflow(workflow)
\ No newline at end of file
@@ -5,7 +5,7 @@ from _utils import (
     modify_concurrency_config,
     infer_split_character,
     filter_list_of_terms,
-    read_evaluate_log,
+    evaluate_workflow,
     find_database,
     download_database,
     check_inputs_not_empty,
@@ -90,7 +90,8 @@ paths = retrieve_config_paths(config, script_dir, script_name, output_path=args[
 paths["db_mount_config"] = modify_concurrency_config(paths["db_mount_config"], system_folder, args["concurrent_jobs"])
 
 # starting workflow
-log_path = start_workflow(paths, inputs_path, system_folder, script_name)
+workflow = start_workflow(paths, inputs_path, system_folder, script_name,
+                          abort_on_failure=args["abort_on_failure"], server=args["server"])
 
 # checking if the job was succesful
-read_evaluate_log(log_path)
\ No newline at end of file
+evaluate_workflow(workflow)
\ No newline at end of file
@@ -9,7 +9,9 @@ import argparse
 
 from _utils import (
     aria2c_download_file,
-    modify_json_config
+    modify_json_config,
+    read_json_config,
+    stop_cromwell_servers
 )
 
 from typing import List
@@ -120,13 +122,23 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--save_path", 
-                        help='Path to save Cromwell.', required=True) 
+                        help='Path to save Cromwell.')
+    parser.add_argument("--stop_servers", action='store_true',
+                        help='Stop local Cromwell servers started by the pipeline steps with --server.')
 
     args = vars(parser.parse_args())
-    cromwell_path = os.path.abspath(setup_cromwell(url, args["save_path"]))
     script_dir = os.path.dirname(__file__)
-
-    modify_json_config(os.path.join(script_dir, "config.json"), "cromwell_path", cromwell_path, "system_paths")
-
-    
-    
\ No newline at end of file
+    config_path = os.path.join(script_dir, "config.json")
+
+    if args["stop_servers"]:
+        cromwell_path = read_json_config(config_path)["system_paths"]["cromwell_path"]
+        stopped = stop_cromwell_servers(os.path.abspath(os.path.join(script_dir, cromwell_path)))
+        for server_url in stopped:
+            logging.info(f"Stopped Cromwell server {server_url}")
+        if not stopped:
+            logging.info("No Cromwell server is running.")
+    elif args["save_path"] is None:
+        parser.error("--save_path is required to install Cromwell.")
+    else:
+        cromwell_path = os.path.abspath(setup_cromwell(url, args["save_path"]))
+        modify_json_config(config_path, "cromwell_path", cromwell_path, "system_paths")
@@ -3,7 +3,7 @@ import os
 from _utils import (
     read_json_config,
     modify_concurrency_config, 
-    read_evaluate_log,
+    evaluate_workflow,
     get_files_with_extension, 
     reorder_list_substrings, 
     check_inputs_not_empty,
@@ -94,7 +94,8 @@ paths["db_mount_config"] = modify_concurrency_config(paths["db_mount_config"],
                                                  n_jobs=args["concurrent_jobs"])
 
 # starting workflow 
-log_path = start_workflow(paths, inputs_path, system_folder, script_name)
+workflow = start_workflow(paths, inputs_path, system_folder, script_name,
+                          abort_on_failure=args["abort_on_failure"], server=args["server"])
 
 # checking if the job was successful
-read_evaluate_log(log_path)
\ No newline at end of file
+evaluate_workflow(workflow)
\ No newline at end of file
@@ -0,0 +1,169 @@
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import tarfile
+import threading
+import subprocess
+import http.server
+import urllib.error
+import pytest
+
+from os.path import join, dirname, abspath
+
+pytest.importorskip("rich")
+pytest.importorskip("requests")
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+import _utils  # noqa: E402
+
+
+def make_archive(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def http_server():
+    """
+    Serves files of the `files` dictionary of the server with range
+    requests. The first `cuts` responses end after half of their content.
+    """
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            data = self.server.files.get(self.path.lstrip("/"))
+            if data is None:
+                self.send_error(404)
+                return
+            start = 0
+            if "Range" in self.headers:
+                start = int(self.headers["Range"].split("=")[1].rstrip("-"))
+                self.send_response(206)
+                self.send_header("Content-Range",
+                                 f"bytes {start}-{len(data) - 1}/{len(data)}")
+            else:
+                self.send_response(200)
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Length", str(len(data) - start))
+            self.end_headers()
+            body = data[start:]
+            if self.server.cuts > 0:
+                self.server.cuts -= 1
+                body = body[:len(body) // 2]
+                self.close_connection = True
+            self.wfile.write(body)
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.files, server.cuts = {}, 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def server_url(server, name):
+    return f"http://127.0.0.1:{server.server_address[1]}/{name}"
+
+
+def test_stream_download_resumes_cut_response(http_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(_utils.time, "sleep", lambda seconds: None)
+    files = {"db/a.txt": os.urandom(300_000), "db/b.txt": b"b" * 1000}
+    archive = make_archive(files)
+    http_server.files["db.tar.gz"] = archive
+    http_server.cuts = 2
+
+    checksum = f"sha256:{hashlib.sha256(archive).hexdigest()}"
+    _utils.stream_download_archive(server_url(http_server, "db.tar.gz"),
+                                   str(tmp_path), checksum=checksum)
+    for name, content in files.items():
+        with open(join(tmp_path, name), "rb") as f:
+            assert f.read() == content
+    assert sorted(os.listdir(tmp_path)) == ["db"]
+
+
+def test_stream_download_not_found(http_server, tmp_path):
+    with pytest.raises(urllib.error.HTTPError):
+        _utils.stream_download_archive(server_url(http_server, "db.tar.gz"),
+                                       str(tmp_path))
+    # no staging directory is left without extracted files
+    assert os.listdir(tmp_path) == []
+
+
+class Recorder:
+    """Console and spinner recording logged messages"""
+
+    def __init__(self):
+        self.messages = []
+
+    def log(self, message, style=None):
+        self.messages.append(message)
+
+    def update(self, message):
+        pass
+
+
+RETRIED_JOB_LOG = """\
+[UUID(1a2b)wf.map:NA:1]: Status change from - to Running
+Job wf.map:NA:1 exited with return code 1 which has not been declared as a valid return code.
+[UUID(1a2b)wf.map:NA:2]: Status change from - to Running
+[UUID(1a2b)wf.map:NA:2]: Status change from Running to Done
+workflow finished with status 'Succeeded'.
+"""
+
+
+@pytest.mark.parametrize("max_retries, status, failed_tasks", [
+    (1, "Succeeded", []),
+    (0, "Failed", ["wf.map:NA:1"]),
+])
+def test_run_workflow_retried_job(tmp_path, monkeypatch, max_retries, status, failed_tasks):
+    log_file = join(tmp_path, "cromwell.log")
+    with open(log_file, "w") as f:
+        f.write(RETRIED_JOB_LOG)
+    # Cromwell writing the log of a workflow with a retried job
+    monkeypatch.setattr(_utils, "workflow_command", lambda *args: [
+        sys.executable, "-c", f"print(open({log_file!r}).read(), end='')"])
+
+    recorder = Recorder()
+    tasks = _utils.TaskMonitor(recorder, recorder, {"map": max_retries})
+    result = _utils.run_workflow({}, None, str(tmp_path), "wf", tasks)
+    assert result.status == status
+    assert result.failed_tasks == failed_tasks
+    assert tasks.retried == (["wf.map:NA:1"] if max_retries else [])
+
+
+def test_stop_cromwell_servers(tmp_path):
+    # a server answering the Cromwell version request in its own session
+    server_dir = join(tmp_path, "server", "abc")
+    os.makedirs(join(server_dir, "engine", "v1"))
+    with open(join(server_dir, "engine", "v1", "version"), "w") as f:
+        f.write('{"cromwell": "0"}')
+    port = _utils.find_free_port()
+    process = subprocess.Popen([sys.executable, "-m", "http.server", str(port), "--bind", "127.0.0.1"],
+                               cwd=server_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               start_new_session=True)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            if _utils.is_server_alive(url):
+                break
+            time.sleep(0.1)
+        with open(join(server_dir, "server.json"), "w") as f:
+            json.dump({"url": url, "pid": process.pid}, f)
+
+        assert _utils.stop_cromwell_servers(join(tmp_path, "cromwell.jar")) == [url]
+        process.wait(timeout=10)
+        assert not os.path.exists(join(server_dir, "server.json"))
+        assert _utils.stop_cromwell_servers(join(tmp_path, "cromwell.jar")) == []
+    finally:
+        if process.poll() is None:
+            process.kill()